@@ -35,8 +35,12 @@ from logs2netcdfs import (
     TIME60HZ,
     AUV_NetCDF,
 )
+from nc_encoding import ENCODING, ENCODINGS
 from numpy.core._exceptions import UFuncTypeError
+from partition import SEGMENT_WORKERS, dataset_bounds, interp_segments
 from scipy.interpolate import interp1d
+from selection import MergeError, add_arguments, merge_into, stage_selection
+from storage import STORAGE, STORAGES, open_dataset, write_dataset
 
 
 class InvalidCalFile(Exception):
@@ -136,16 +140,30 @@ class Align_NetCDF:
 
         return metadata
 
-    def process_cal(self, vehicle: str = None, name: str = None) -> None:
+    def process_cal(
+        self, vehicle: str = None, name: str = None, selective: bool = True
+    ) -> None:
+        """Align the variables of all the sensors, or with `selective` only
+        those selected with --sensors or --variables, see selection.py"""
         name = name or self.args.mission
         vehicle = vehicle or self.args.auv_name
         netcdfs_dir = os.path.join(self.args.base_path, vehicle, MISSIONNETCDFS, name)
         in_fn = f"{vehicle}_{name}_cal.nc"
+        self.selection = None
+        if selective:
+            self.selection = stage_selection(
+                self.args,
+                [os.path.join(netcdfs_dir, f"{vehicle}_{name}_align.nc")],
+                self.logger,
+            )
         try:
-            self.calibrated_nc = xr.open_dataset(os.path.join(netcdfs_dir, in_fn))
+            self.calibrated_nc = open_dataset(os.path.join(netcdfs_dir, in_fn))
         except ValueError as e:
             raise InvalidCalFile(e)
         self.logger.info(f"Processing {in_fn} from {netcdfs_dir}")
+        # Segments of the mission between surfacings interpolated in parallel
+        surfacings = dataset_bounds(self.calibrated_nc)
+        workers = getattr(self.args, "segment_workers", SEGMENT_WORKERS)
         self.aligned_nc = xr.Dataset()
         self.min_time = datetime.utcnow()
         self.max_time = datetime(1970, 1, 1)
@@ -161,6 +179,8 @@ class Align_NetCDF:
             if instr in ("gps", "depth", "nudged"):
                 # Skip coordinate type variables
                 continue
+            if self.selection and not self.selection.selects(variable):
+                continue
             if variable.startswith("navigation"):
                 if variable.split("_")[1] not in (
                     "mWaterSpeed",
@@ -228,9 +248,7 @@ class Align_NetCDF:
                 # Likely x and y arrays must have at least 2 entries
                 raise InvalidCalFile(f"Cannot interpolate depth: {e}")
 
-            var_time = (
-                self.aligned_nc[variable].get_index(timevar).view(np.int64).tolist()
-            )
+            var_time = self.aligned_nc[variable].get_index(timevar).view(np.int64)
 
             # Count number of values that are outside the time range of the _interp coordinate values
             outside_interps = np.where(
@@ -323,7 +341,9 @@ class Align_NetCDF:
             )
             self.aligned_nc[variable].attrs["instrument_sample_rate_hz"] = sample_rate
             self.aligned_nc[f"{instr}_depth"] = xr.DataArray(
-                depth_interp(var_time).astype(np.float64).tolist(),
+                interp_segments(depth_interp, var_time, surfacings, workers)
+                .astype(np.float64)
+                .tolist(),
                 dims={timevar},
                 coords=[self.calibrated_nc[variable].get_index(timevar)],
                 name=f"{instr}_depth",
@@ -342,7 +362,9 @@ class Align_NetCDF:
             ] = sample_rate
 
             self.aligned_nc[f"{instr}_latitude"] = xr.DataArray(
-                lat_interp(var_time).astype(np.float64).tolist(),
+                interp_segments(lat_interp, var_time, surfacings, workers)
+                .astype(np.float64)
+                .tolist(),
                 dims={timevar},
                 coords=[self.calibrated_nc[variable].get_index(timevar)],
                 name=f"{instr}_latitude",
@@ -360,7 +382,9 @@ class Align_NetCDF:
             ] = sample_rate
 
             self.aligned_nc[f"{instr}_longitude"] = xr.DataArray(
-                lon_interp(var_time).astype(np.float64).tolist(),
+                interp_segments(lon_interp, var_time, surfacings, workers)
+                .astype(np.float64)
+                .tolist(),
                 dims={timevar},
                 coords=[self.calibrated_nc[variable].get_index(timevar)],
                 name=f"{instr}_longitude",
@@ -403,11 +427,24 @@ class Align_NetCDF:
         vehicle = vehicle or self.args.auv_name
         self.aligned_nc.attrs = self.global_metadata()
         out_fn = os.path.join(netcdfs_dir, f"{vehicle}_{name}_align.nc")
+        if getattr(self, "selection", None):
+            try:
+                self.aligned_nc = merge_into(out_fn, self.aligned_nc, self.selection)
+            except MergeError as e:
+                self.logger.warning(f"Cannot merge {self.selection}: {e}")
+                self.process_cal(vehicle, name, selective=False)
+                self.aligned_nc.attrs = self.global_metadata()
         self.logger.info(f"Writing aligned data to {out_fn}")
         if os.path.exists(out_fn):
             self.logger.debug(f"Removing file {out_fn}")
             os.remove(out_fn)
-        self.aligned_nc.to_netcdf(out_fn)
+        write_dataset(
+            self.aligned_nc,
+            out_fn,
+            getattr(self.args, "storage", STORAGE),
+            getattr(self.args, "encoding", ENCODING),
+            self.logger,
+        )
         self.logger.info(
             "Data variables written: %s", ", ".join(sorted(self.aligned_nc.variables))
         )
@@ -447,6 +484,30 @@ class Align_NetCDF:
             action="store_true",
             help="Create intermediate plots to validate data operations.",
         )
+        parser.add_argument(
+            "--encoding",
+            action="store",
+            choices=ENCODINGS,
+            default=ENCODING,
+            help="Compression and precision of the netCDF file written,"
+            f" default: {ENCODING}, see nc_encoding.py",
+        )
+        parser.add_argument(
+            "--storage",
+            action="store",
+            choices=STORAGES,
+            default=STORAGE,
+            help="Write a netCDF file, a Zarr store or both, default: netcdf",
+        )
+        add_arguments(parser)
+        parser.add_argument(
+            "--segment_workers",
+            action="store",
+            type=int,
+            default=SEGMENT_WORKERS,
+            help="Threads processing the segments of the mission between"
+            " surfacings in parallel, default: 1, see partition.py",
+        )
         parser.add_argument(
             "-v",
             "--verbose",
@@ -16,9 +16,12 @@ import platform
 import sys
 import time
 from pathlib import Path
+from typing import List, Union
 
 from logs2netcdfs import BASE_PATH, LOG_FILES, MISSIONNETCDFS, AUV_NetCDF
+from mirror import mirror
 from resample import FREQ
+from storage import STORAGE, STORAGES, zarr_path
 
 LOG_NAME = "processing.log"
 AUVCTD_VOL = "/Volumes/AUVCTD"
@@ -31,8 +34,31 @@ class Archiver:
     logger.addHandler(_handler)
     _log_levels = (logging.WARN, logging.INFO, logging.DEBUG)
 
-    def copy_to_AUVTCD(self, nc_file_base: str, freq: str = FREQ) -> None:
-        "Copy the resampled netCDF file(s) to appropriate AUVCTD directory"
+    def _product_files(self, src_dir: str, nc_names: List[str]) -> List[str]:
+        """Return the names relative to `src_dir` of the files of the products
+        `nc_names` in the --storage they were written in: the netCDF files
+        and/or the files in the Zarr stores next to them"""
+        storage = getattr(self.args, "storage", STORAGE)
+        names = []
+        for nc_name in nc_names:
+            if storage in ("netcdf", "both"):
+                names.append(nc_name)
+            if storage in ("zarr", "both"):
+                store = zarr_path(nc_name)
+                store_files = sorted(
+                    os.path.relpath(os.path.join(root, file_name), src_dir)
+                    for root, _, file_names in os.walk(os.path.join(src_dir, store))
+                    for file_name in file_names
+                )
+                # A store not written is reported as missing
+                names.extend(store_files or [store])
+        return names
+
+    def copy_to_AUVTCD(
+        self, nc_file_base: str, freq: Union[str, List[str]] = FREQ
+    ) -> None:
+        """Copy the resampled netCDF file(s), or Zarr stores, to appropriate
+        AUVCTD directory"""
         surveys_dir = os.path.join(AUVCTD_VOL, "surveys")
         try:
             os.stat(surveys_dir)
@@ -43,15 +69,25 @@ class Archiver:
         year = self.args.mission.split(".")[0]
         surveys_dir = os.path.join(surveys_dir, year, "netcdf")
         self.logger.info(f"Copying {nc_file_base} files to {surveys_dir}")
-        # To avoid "fchmod failed: Permission denied" message use rsync instead  of cp
-        # https://apple.stackexchange.com/a/206251
-        for ftype in (f"{freq}.nc", "cal.nc", "align.nc", LOG_NAME):
-            src_file = f"{nc_file_base}_{ftype}"
-            if os.path.exists(src_file):
-                os.system(f"rsync {src_file} {surveys_dir}")
-                self.logger.info(f"rsync {src_file} {surveys_dir} done.")
-            else:
-                self.logger.error(f"{src_file} not found")
+        # mirror() does not copy permissions to avoid "fchmod failed: Permission
+        # denied" errors - https://apple.stackexchange.com/a/206251
+        freqs = [freq] if isinstance(freq, str) else freq
+        ftypes = (*(f"{f}.nc" for f in freqs), "cal.nc", "align.nc")
+        src_dir, file_name_base = os.path.split(nc_file_base)
+        names = self._product_files(
+            src_dir, [f"{file_name_base}_{ftype}" for ftype in ftypes]
+        )
+        report = mirror(
+            src_dir,
+            surveys_dir,
+            [*names, f"{file_name_base}_{LOG_NAME}"],
+            checksum=getattr(self.args, "checksum", False),
+        )
+        for file_name in report.missing:
+            self.logger.error(f"{os.path.join(src_dir, file_name)} not found")
+        self.logger.info(report.summary())
+        for file_name, error in report.failed.items():
+            self.logger.error(f"Failed to copy {file_name}: {error}")
 
         # Copy intermediate files to AUVCTD/missionnetcdfs/YYYY/YYYYJJJ
         YYYYJJJ = "".join(self.args.mission.split(".")[:2])
@@ -59,14 +95,17 @@ class Archiver:
             AUVCTD_VOL, MISSIONNETCDFS, year, YYYYJJJ, self.args.mission
         )
         Path(missionnetcdfs_dir).mkdir(parents=True, exist_ok=True)
-        src_dir = "/".join(nc_file_base.split("/")[:-1])
-        for log in LOG_FILES:
-            src_file = os.path.join(src_dir, f"{log.replace('.log', '')}.nc")
-            if os.path.exists(src_file):
-                os.system(f"rsync {src_file} {missionnetcdfs_dir}")
-                self.logger.info(f"rsync {src_file} {missionnetcdfs_dir} done.")
-            else:
-                self.logger.debug(f"{src_file} not found")
+        report = mirror(
+            src_dir,
+            missionnetcdfs_dir,
+            [log.replace(".log", ".nc") for log in LOG_FILES],
+            checksum=getattr(self.args, "checksum", False),
+        )
+        for file_name in report.missing:
+            self.logger.debug(f"{os.path.join(src_dir, file_name)} not found")
+        self.logger.info(report.summary())
+        for file_name, error in report.failed.items():
+            self.logger.error(f"Failed to copy {file_name}: {error}")
 
     def copy_to_M3(self, resampled_nc_file: str) -> None:
         pass
@@ -97,8 +136,9 @@ class Archiver:
         parser.add_argument(
             "--freq",
             action="store",
-            default=FREQ,
-            help="Resample freq",
+            nargs="+",
+            default=[FREQ],
+            help="Resample freq(s) of the files to copy",
         ),
         parser.add_argument(
             "--M3",
@@ -110,6 +150,20 @@ class Archiver:
             action="store_true",
             help="Copy reampled netCDF file(s) to appropriate place on AUVCTD",
         ),
+        parser.add_argument(
+            "--storage",
+            action="store",
+            choices=STORAGES,
+            default=STORAGE,
+            help="Copy the netCDF files, Zarr stores or both of the products,"
+            " as written with process.py --storage, default: netcdf",
+        )
+        parser.add_argument(
+            "--checksum",
+            action="store_true",
+            help="Compare the contents of the files instead of their sizes and"
+            " modification times to decide which to copy",
+        )
         parser.add_argument(
             "-v",
             "--verbose",
@@ -144,5 +198,5 @@ if __name__ == "__main__":
     if arch.args.M3:
         arch.copy_to_M3(nc_file_base)
     if arch.args.AUVCTD:
-        arch.copy_to_AUVTCD(nc_file_base)
+        arch.copy_to_AUVTCD(nc_file_base, arch.args.freq)
     arch.logger.info(f"Time to process: {(time.time() - p_start):.2f} seconds")
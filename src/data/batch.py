@@ -0,0 +1,240 @@
+"""
+Helpers for running many missions through the processing pipeline in a pool
+of worker processes: a restart journal, per-mission time limits, the
+reporting of worker process ids back to the scheduler and the estimation
+of each mission's processing time and peak memory from the sizes of its
+input files.
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, Optional, Set
+
+MAX_TASKS_PER_CHILD = 4  # Missions processed before a worker is replaced
+JOURNAL_DONE = "done"
+METRICS_FILE = "mission_metrics.json"
+# Processing rate assumed before any missions have been timed
+DEFAULT_SECONDS_PER_MB = 2.0
+# Peak memory of a worker is estimated as BASE_MEMORY_MB plus a multiple of
+# the size of each input file.  The high rate biolume and lopc data are held
+# in memory in several forms as they are calibrated, aligned and resampled.
+BASE_MEMORY_MB = 500
+MEMORY_PER_BYTE = {"biolume.log": 12.0, "lopc.bin": 16.0}
+DEFAULT_MEMORY_PER_BYTE = 4.0
+# Part of the memory available at the start of a batch that it may use
+MEMORY_BUDGET_FRACTION = 0.8
+
+# Set in each worker process by init_worker()
+_started_queue = None
+# Missions started in this process, whose peak memory peak_rss() includes
+_missions_measured = 0
+
+
+class MissionTimeout(Exception):
+    pass
+
+
+def init_worker(started_queue) -> None:
+    """Pool initializer: remember the queue used to report mission starts"""
+    global _started_queue
+    _started_queue = started_queue
+
+
+def report_start(mission: str) -> None:
+    """Tell the scheduler which worker process is running `mission` so that
+    it can be killed if it overruns its time limit"""
+    if _started_queue is not None:
+        _started_queue.put((mission, os.getpid(), time.time()))
+
+
+@contextmanager
+def mission_timeout(seconds: float, what: str):
+    """Raise MissionTimeout in the enclosed block after `seconds`.  Relies on
+    SIGALRM, so it is a no-op for a falsy `seconds` or on platforms without
+    it.  Pool workers run their tasks in the main thread, as is required.
+    """
+    if not seconds or not hasattr(signal, "SIGALRM"):
+        yield
+        return
+
+    def _handler(signum, frame):
+        raise MissionTimeout(f"{what} exceeded {seconds} seconds")
+
+    previous = signal.signal(signal.SIGALRM, _handler)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+class MissionJournal:
+    """Append-only record of the missions completed by a batch.  A batch that
+    crashes or is interrupted can be rerun with the same arguments and will
+    skip the missions already done.  The journal is removed once every
+    mission of the batch has been done.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def done(self) -> Set[str]:
+        "Return the missions recorded as done"
+        missions = set()
+        try:
+            with open(self.path) as fh:
+                for line in fh:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Likely a partial line written as the batch crashed
+                        self.logger.warning("Skipping bad line in %s", self.path)
+                        continue
+                    if entry.get("status") == JOURNAL_DONE:
+                        missions.add(entry["mission"])
+        except FileNotFoundError:
+            pass
+        return missions
+
+    def record(self, mission: str, status: str, **info) -> None:
+        with open(self.path, "a") as fh:
+            fh.write(json.dumps(dict(mission=mission, status=status, **info)) + "\n")
+            fh.flush()
+            os.fsync(fh.fileno())
+
+    def remove(self) -> None:
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def mission_input_sizes(src_dir: str, file_names: Iterable[str]) -> Dict[str, int]:
+    "Return the sizes in bytes of the `file_names` present in `src_dir`"
+    sizes = {}
+    for name in file_names:
+        try:
+            sizes[name] = os.path.getsize(os.path.join(src_dir, name))
+        except (OSError, TypeError):
+            continue
+    return sizes
+
+
+def available_memory() -> Optional[int]:
+    "Return the bytes of memory available for new processes, None if unknown"
+    try:
+        with open("/proc/meminfo") as fh:
+            for line in fh:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def reset_peak_rss() -> bool:
+    """Start measuring the peak memory of a mission in this process.  Returns
+    True if peak_rss() will report the peak of that mission alone: if the
+    peak could be reset, only possible on Linux, or if it is the first
+    mission of the process.  Pool workers process several missions."""
+    global _missions_measured
+    _missions_measured += 1
+    try:
+        with open("/proc/self/clear_refs", "w") as fh:
+            fh.write("5")
+        return True
+    except OSError:
+        return _missions_measured == 1
+
+
+def peak_rss() -> Optional[int]:
+    """Return the peak resident memory in bytes of this process since it
+    started or since reset_peak_rss() reset it"""
+    try:
+        # VmHWM, unlike ru_maxrss, is reset by reset_peak_rss()
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes on Linux and in bytes on macOS
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class CostModel:
+    """Estimate mission processing time and peak memory from the bytes of its
+    input files.  Missions processed before keep their measured values; others
+    are estimated with the overall seconds per byte of the missions in the
+    metrics file and the MEMORY_PER_BYTE factors.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        try:
+            with open(self.path) as fh:
+                self.metrics = json.load(fh)
+        except FileNotFoundError:
+            self.metrics = {}
+        except json.JSONDecodeError as e:
+            self.logger.warning("Ignoring unreadable %s: %s", self.path, e)
+            self.metrics = {}
+
+    def seconds_per_byte(self) -> float:
+        nbytes = sum(m["bytes"] for m in self.metrics.values())
+        seconds = sum(m["seconds"] for m in self.metrics.values())
+        if nbytes and seconds:
+            return seconds / nbytes
+        return DEFAULT_SECONDS_PER_MB / 1.0e6
+
+    def estimate(self, mission: str, nbytes: int) -> float:
+        "Return the estimated seconds to process `mission` with `nbytes` of input"
+        previous = self.metrics.get(mission)
+        if previous and previous["bytes"] == nbytes:
+            return previous["seconds"]
+        return nbytes * self.seconds_per_byte()
+
+    def estimate_memory(self, mission: str, sizes: Dict[str, int]) -> float:
+        """Return the estimated peak bytes of memory needed to process
+        `mission` whose input files have `sizes`"""
+        previous = self.metrics.get(mission)
+        if (
+            previous
+            and previous.get("peak_mb")
+            and previous["bytes"] == sum(sizes.values())
+        ):
+            return previous["peak_mb"] * 1.0e6
+        return BASE_MEMORY_MB * 1.0e6 + sum(
+            size * MEMORY_PER_BYTE.get(name, DEFAULT_MEMORY_PER_BYTE)
+            for name, size in sizes.items()
+        )
+
+    def update(self, mission: str, nbytes: int, seconds: float, **info) -> None:
+        self.metrics[mission] = dict(bytes=nbytes, seconds=seconds, **info)
+
+    def save(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as fh:
+            json.dump(self.metrics, fh, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,189 @@
+"""
+Cache of parsed calibration and configuration files keyed by their content.
+
+The same seabird25p.cfg, FLBBCD2K-3695.dev and hs2Calibration.dat files are
+copied into hundreds of mission directories of a deployment campaign.  Each
+file is hashed together with the name and version of its parser and parsed
+only the first time its content is seen.  The parsed coefficients are kept
+in memory for the process and written as JSON files to a directory shared
+by the worker processes of a batch, so that a reprocessing run parses each
+distinct calibration once.  The serial number of the instrument, where the
+file gives it, is recorded with a digest of the parsed coefficients so that
+a warning is logged when missions claim the same instrument with different
+coefficients, but not for files that only differ in comments or dates.
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set
+
+CAL_CACHE_DIR = "calibration_cache"
+SERIALS_FILE = "serials.jsonl"
+# Increment when a parser changes what it returns to invalidate the cache
+PARSER_VERSION = 1
+SERIAL_PATTERNS = {
+    ".cfg": re.compile(
+        r"^//.*?\b(?:serial(?: number)?|s/n|sn)\s*[#:=]?\s*([A-Za-z0-9][\w-]*)",
+        re.IGNORECASE | re.MULTILINE,
+    ),
+    ".dev": re.compile(r"^ECO\s+(\S+)", re.MULTILINE),
+    ".dat": re.compile(r"^Serial\s*=\s*(\S+)", re.MULTILINE),
+}
+
+# Parsed records of this process by content hash, shared by all the caches
+_memory: Dict[str, Dict] = {}
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(content: bytes, parser_name: str) -> str:
+    "Return the key of `content` parsed by the parser named `parser_name`"
+    digest = hashlib.sha256(f"{parser_name}:{PARSER_VERSION}:".encode())
+    digest.update(content)
+    return digest.hexdigest()
+
+
+def record_digest(record: Dict) -> str:
+    "Return a digest of the parsed coefficients of an encoded `record`"
+    return hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+
+def serial_number(filename: str, content: bytes) -> Optional[str]:
+    "Return the instrument serial number in calibration file `content`"
+    pattern = SERIAL_PATTERNS.get(os.path.splitext(filename)[1])
+    if pattern is None:
+        return None
+    match = pattern.search(content.decode(errors="replace"))
+    return match.group(1) if match else None
+
+
+def _encode(record) -> Dict:
+    if isinstance(record, dict):
+        return {"sections": record}
+    return {"attributes": vars(record)}
+
+
+def _decode(encoded: Dict, record_type: type = None):
+    if "sections" in encoded:
+        return defaultdict(dict, copy.deepcopy(encoded["sections"]))
+    record = record_type()
+    record.__dict__.update(encoded["attributes"])
+    return record
+
+
+class CalibrationCache:
+    """Parsed calibration files by content hash, in memory and, if
+    `cache_dir` is given, on disk"""
+
+    def __init__(self, cache_dir: str = None, log: logging.Logger = logger) -> None:
+        self.cache_dir = cache_dir
+        self.logger = log
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read(self, key: str) -> Optional[Dict]:
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(key)) as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as e:
+            self.logger.warning("Ignoring unreadable %s: %s", self._path(key), e)
+            return None
+
+    def _write(self, key: str, entry: Dict) -> None:
+        if not self.cache_dir:
+            return
+        # Unique temporary name as other processes may write the same entry
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as fh:
+            json.dump(entry, fh)
+        os.replace(tmp_path, self._path(key))
+
+    def load(
+        self, filename: str, parser: Callable[[str], object], record_type=None
+    ):
+        """Return the calibration record of `filename` returned by `parser`,
+        parsing it only if its content has not been seen before.  Objects are
+        rebuilt as `record_type` and dictionaries of sections, as returned by
+        hs2_read_cal_file(), as a defaultdict.  Each call returns a new copy
+        of the record."""
+        with open(filename, "rb") as fh:
+            content = fh.read()
+        key = content_hash(content, parser.__name__)
+        entry = _memory.get(key) or self._read(key)
+        if entry is None:
+            self.logger.debug(f"Parsing {filename} with {parser.__name__}()")
+            record = parser(filename)
+            entry = {
+                "serial": serial_number(filename, content),
+                "source": os.path.abspath(filename),
+                "record": _encode(record),
+            }
+            self._write(key, entry)
+            self._check_serial(key, entry)
+        else:
+            self.logger.debug(f"Using cached {key[:12]} for {filename}")
+        _memory[key] = entry
+        return _decode(entry["record"], record_type)
+
+    def _serials(self) -> List[Dict]:
+        if not self.cache_dir:
+            return []
+        try:
+            with open(os.path.join(self.cache_dir, SERIALS_FILE)) as fh:
+                return [json.loads(line) for line in fh if line.strip()]
+        except FileNotFoundError:
+            return []
+
+    def _check_serial(self, key: str, entry: Dict) -> None:
+        """Record the serial number of a newly parsed file and warn if other
+        coefficients have been seen for the same instrument"""
+        if not self.cache_dir or not entry["serial"]:
+            return
+        digest = record_digest(entry["record"])
+        others = {
+            line["source"]
+            for line in self._serials()
+            if line["serial"] == entry["serial"]
+            and line.get("record", line["key"]) != digest
+        }
+        line = {
+            "serial": entry["serial"],
+            "key": key,
+            "record": digest,
+            "source": entry["source"],
+        }
+        # Appending a single short line is atomic between processes
+        with open(os.path.join(self.cache_dir, SERIALS_FILE), "a") as fh:
+            fh.write(json.dumps(line) + "\n")
+        if others:
+            self.logger.warning(
+                f"{entry['source']} has different coefficients for serial number"
+                f" {entry['serial']} than {', '.join(sorted(others))}"
+            )
+
+    def conflicts(self) -> Dict[str, Set[str]]:
+        """Return the files of the serial numbers that have more than one set
+        of coefficients in the cache"""
+        digests, sources = defaultdict(set), defaultdict(set)
+        for line in self._serials():
+            # Lines written before the digest was recorded compare by content
+            digests[line["serial"]].add(line.get("record", line["key"]))
+            sources[line["serial"]].add(line["source"])
+        return {
+            serial: sources[serial] for serial in digests if len(digests[serial]) > 1
+        }
@@ -52,13 +52,16 @@ import pandas as pd
 import pyproj
 import xarray as xr
 from AUV import monotonic_increasing_time_indices
-from ctd_proc import (
-    _beam_transmittance_from_volts,
-    _calibrated_O2_from_volts,
-    _calibrated_sal_from_cond_frequency,
-    _calibrated_temp_from_frequency,
+from cal_cache import CAL_CACHE_DIR, CalibrationCache
+from ctd_proc import CTDKernel, PressureCache
+from depth_engine import (
+    boxcar_filter,
+    depth_at,
+    interp_extrapolate,
+    zero_phase_filter,
 )
 from hs2_proc import hs2_calc_bb, hs2_read_cal_file
+from lag_estimation import LAG_PAIRS, MIN_PROFILES, apply_lag, estimate_lag
 from logs2netcdfs import (
     BASE_PATH,
     MISSIONLOGS,
@@ -68,9 +71,18 @@ from logs2netcdfs import (
     TIME60HZ,
 )
 from matplotlib import patches
-from scipy import signal
-from scipy.interpolate import interp1d
+from nc_encoding import ENCODING, ENCODINGS
 from seawater import eos80
+from selection import (
+    CALIBRATE_DEPENDENCIES,
+    LAG_DEPENDENCIES,
+    MergeError,
+    add_arguments,
+    merge_into,
+    stage_selection,
+)
+from sensor_data import SENSOR_VARIABLES, SensorFiles, SensorInfo
+from storage import STORAGE, STORAGES, write_dataset
 
 TIME = "time"
 Range = namedtuple("Range", "min max")
@@ -125,10 +137,6 @@ class Coeffs:
     pass
 
 
-class SensorInfo:
-    pass
-
-
 class Calibrate_NetCDF:
     logger = logging.getLogger(__name__)
     _handler = logging.StreamHandler()
@@ -180,6 +188,8 @@ class Calibrate_NetCDF:
         if self.summary_fields:
             # Should be just one item in set, but just in case join them
             metadata["summary"] += " " + ". ".join(self.summary_fields)
+        for estimate in getattr(self, "lag_estimates", {}).values():
+            metadata.update(estimate.metadata())
         metadata["comment"] = (
             f"MBARI Dorado-class AUV data produced from original data"
             f" with execution of '{self.commandline}'' at {iso_now} on"
@@ -440,33 +450,29 @@ class Calibrate_NetCDF:
         self.logger.info(f"Done range checking {instrument}")
 
     def _read_data(self, logs_dir, netcdfs_dir):
-        """Read in all the instrument data into member variables named by "sensor"
-        Access xarray.Dataset like: self.ctd.data, self.navigation.data, ...
+        """Set up member variables named by "sensor" for all the instruments
+        Access xarray.Dataset like: self.ctd.orig_data, self.navigation.orig_data,
+        ..., which opens the sensor's file on first use, see sensor_data.py.
         Access calibration coefficients like: self.ctd.cals.t_f0, or as a
-        dictionary for hs2 data.  Collect summary metadata fields that should
-        describe the source of the data if copied from M3.
+        dictionary for hs2 data.  Summary metadata fields that should
+        describe the source of the data if copied from M3 are collected as
+        the files are opened.
         """
-        self.summary_fields = set()
+        if getattr(self, "sensor_files", None) is not None:
+            self.sensor_files.close()
+        self.sensor_files = SensorFiles(log=self.logger)
+        self.summary_fields = self.sensor_files.summaries
         for sensor, info in self.sinfo.items():
-            sensor_info = SensorInfo()
             orig_netcdf_filename = os.path.join(netcdfs_dir, info["data_filename"])
             self.logger.debug(
-                f"Reading data from {orig_netcdf_filename}"
-                f" into self.{sensor}.orig_data"
+                f"Data from {orig_netcdf_filename} will be read into"
+                f" self.{sensor}.orig_data when first used"
+            )
+            sensor_info = SensorInfo(
+                self.sensor_files,
+                orig_netcdf_filename,
+                SENSOR_VARIABLES.get(sensor),
             )
-            try:
-                setattr(sensor_info, "orig_data", xr.open_dataset(orig_netcdf_filename))
-            except (FileNotFoundError, ValueError) as e:
-                self.logger.debug(
-                    f"{sensor:10}: Cannot open file" f" {orig_netcdf_filename}: {e}"
-                )
-            except OverflowError as e:
-                self.logger.error(
-                    f"{sensor:10}: Cannot open file" f" {orig_netcdf_filename}: {e}"
-                )
-                self.logger.info(
-                    "Perhaps _remove_bad_values() needs to be called for it in logs2netcdfs.py"
-                )
             if info["cal_filename"]:
                 cal_filename = os.path.join(logs_dir, info["cal_filename"])
                 self.logger.debug(
@@ -475,26 +481,40 @@ class Calibrate_NetCDF:
                 )
                 if cal_filename.endswith(".cfg"):
                     try:
-                        setattr(sensor_info, "cals", self._read_cfg(cal_filename))
+                        setattr(
+                            sensor_info,
+                            "cals",
+                            self.cal_cache.load(cal_filename, self._read_cfg, Coeffs),
+                        )
                     except FileNotFoundError as e:
                         self.logger.debug(f"{e}")
                 elif cal_filename.endswith(".dev"):
                     try:
-                        setattr(sensor_info, "cals", self._read_eco_dev(cal_filename))
+                        setattr(
+                            sensor_info,
+                            "cals",
+                            self.cal_cache.load(
+                                cal_filename, self._read_eco_dev, Coeffs
+                            ),
+                        )
                     except FileNotFoundError as e:
                         self.logger.debug(f"{e}")
 
             setattr(self, sensor, sensor_info)
-            if hasattr(sensor_info, "orig_data"):
-                try:
-                    self.summary_fields.add(
-                        getattr(self, sensor).orig_data.attrs["summary"]
-                    )
-                except KeyError:
-                    self.logger.warning(f"{orig_netcdf_filename}: No summary field")
 
         # TODO: Warn if no data found and if logs2netcdfs.py should be run
 
+    @property
+    def cal_cache(self) -> CalibrationCache:
+        """Parsed calibration files, also kept in the CAL_CACHE_DIR of the
+        base_path unless --no_cal_cache"""
+        if getattr(self, "_cal_cache", None) is None:
+            cache_dir = None
+            if getattr(self.args, "cal_cache", False):
+                cache_dir = os.path.join(self.args.base_path, CAL_CACHE_DIR)
+            self._cal_cache = CalibrationCache(cache_dir, self.logger)
+        return self._cal_cache
+
     def _read_cfg(self, cfg_filename):
         """Emulate what get_auv_cal.m and processCTD.m do in the
         Matlab doradosdp toolbox
@@ -1279,8 +1299,6 @@ class Calibrate_NetCDF:
         self.logger.debug(f"Converting depth to pressure using latitude = {latitude}")
         pres = eos80.pres(orig_nc["depth"], latitude)
 
-        # See https://docs.scipy.org/doc/scipy-1.0.0/reference/generated/scipy.signal.filtfilt.html#scipy.signal.filtfilt
-        # and https://docs.scipy.org/doc/scipy-1.0.0/reference/generated/scipy.signal.butter.html#scipy.signal.butter
         # Sample rate should be 10 - calcuate it to be sure
         sample_rate = 1.0 / np.round(
             np.mean(np.diff(orig_nc["time"])) / np.timedelta64(1, "s"), decimals=2
@@ -1290,23 +1308,19 @@ class Calibrate_NetCDF:
                 f"Expected sample_rate to be 10 Hz, instead it's {sample_rate} Hz"
             )
 
-        # The Wn parameter for butter() is fraction of the Nyquist frequency
-        Wn = cutoff_freq / (sample_rate / 2.0)
-        b, a = signal.butter(8, Wn)
+        # Filter pressure and depth together in second-order sections form
         try:
-            depth_filtpres_butter = signal.filtfilt(b, a, pres)
+            depth_filtpres_butter, depth_filtdepth_butter = zero_phase_filter(
+                np.vstack((pres, orig_nc["depth"].values)), sample_rate, cutoff_freq
+            )
         except ValueError as e:
             raise EOFError(f"Likely short or empty file: {e}")
-        depth_filtdepth_butter = signal.filtfilt(b, a, orig_nc["depth"])
 
-        # Use 10 points in boxcar as in processDepth.m
-        a = 10
-        b = signal.boxcar(a)
-        depth_filtpres_boxcar = signal.filtfilt(b, a, pres)
         pres_plot = True  # Set to False for debugging other plots
         if self.args.plot and pres_plot:
             # Use Pandas to plot multiple columns of data
             # to validate that the filtering works as expected
+            depth_filtpres_boxcar = boxcar_filter(pres)
             pbeg = 0
             pend = len(orig_nc.get_index("time"))
             if self.args.plot.startswith("first"):
@@ -1380,7 +1394,7 @@ class Calibrate_NetCDF:
 
         try:
             cal_fn = os.path.join(logs_dir, self.sinfo["hs2"]["cal_filename"])
-            cals = hs2_read_cal_file(cal_fn)
+            cals = self.cal_cache.load(cal_fn, hs2_read_cal_file)
         except FileNotFoundError as e:
             self.logger.error(f"Cannot process HS2 data: {e}")
             return
@@ -1570,22 +1584,13 @@ class Calibrate_NetCDF:
     def _calibrated_oxygen(
         self,
         sensor,
-        cf,
+        kernel,
         orig_nc,
         var_name,
-        temperature,
-        salinity,
         portstbd="",
     ) -> Tuple[xr.DataArray, xr.DataArray]:
         """Calibrate oxygen data, returning DataArrays."""
-        oxy_mll, oxy_umolkg = _calibrated_O2_from_volts(
-            self.combined_nc,
-            cf,
-            orig_nc,
-            var_name,
-            temperature,
-            salinity,
-        )
+        oxy_mll, oxy_umolkg = kernel.oxygen(var_name)
         oxygen_mll = xr.DataArray(
             oxy_mll,
             coords=[orig_nc.get_index("time")],
@@ -1640,11 +1645,19 @@ class Calibrate_NetCDF:
         source = self.sinfo[sensor]["data_filename"]
 
         # === Temperature and salinity variables ===
-        # Seabird specific calibrations
+        # Seabird specific calibrations, with the terms shared by the
+        # variables, and the pressure by the CTDs, evaluated once
+        if getattr(self, "_pressures", None) is None or (
+            self._pressures.combined_nc is not self.combined_nc
+        ):
+            self._pressures = PressureCache(self.combined_nc)
+        kernel = CTDKernel(
+            self.args, self.combined_nc, self.logger, cf, orig_nc, self._pressures
+        )
         vars_to_qc = []
-        self.logger.debug("Calling _calibrated_temp_from_frequency()")
+        self.logger.debug("Calibrating temperature")
         temperature = xr.DataArray(
-            _calibrated_temp_from_frequency(cf, orig_nc),
+            kernel.temperature,
             coords=[orig_nc.get_index("time")],
             dims={f"{sensor}_time"},
             name="temperature",
@@ -1661,17 +1674,9 @@ class Calibrate_NetCDF:
         }
         self.combined_nc[f"{sensor}_temperature"] = temperature
 
-        self.logger.debug("Calling _calibrated_sal_from_cond_frequency()")
-        cal_conductivity, cal_salinity = _calibrated_sal_from_cond_frequency(
-            self.args,
-            self.combined_nc,
-            self.logger,
-            cf,
-            orig_nc,
-            temperature,
-        )
+        self.logger.debug("Calibrating conductivity and salinity")
         conductivity = xr.DataArray(
-            cal_conductivity,
+            kernel.conductivity,
             coords=[orig_nc.get_index("time")],
             dims={f"{sensor}_time"},
             name="conductivity",
@@ -1689,7 +1694,7 @@ class Calibrate_NetCDF:
         self.combined_nc[f"{sensor}_conductivity"] = conductivity
         vars_to_qc.append(f"{sensor}_salinity")
         salinity = xr.DataArray(
-            cal_salinity,
+            kernel.salinity,
             coords=[orig_nc.get_index("time")],
             dims={f"{sensor}_time"},
             name="salinity",
@@ -1783,15 +1788,7 @@ class Calibrate_NetCDF:
             (
                 self.combined_nc[f"{sensor}_oxygen_mll"],
                 self.combined_nc[f"{sensor}_oxygen_umolkg"],
-            ) = self._calibrated_oxygen(
-                sensor,
-                cf,
-                orig_nc,
-                "dissolvedO2",
-                temperature,
-                salinity,
-                "",
-            )
+            ) = self._calibrated_oxygen(sensor, kernel, orig_nc, "dissolvedO2", "")
         except KeyError:
             self.logger.debug("No dissolvedO2 data in %s", self.args.mission)
         except ValueError as e:
@@ -1821,13 +1818,7 @@ class Calibrate_NetCDF:
                 self.combined_nc[f"{sensor}_oxygen_mll_port"],
                 self.combined_nc[f"{sensor}_oxygen_umolkg_port"],
             ) = self._calibrated_oxygen(
-                sensor,
-                cf,
-                orig_nc,
-                "dissolvedO2_port",
-                temperature,
-                salinity,
-                "port",
+                sensor, kernel, orig_nc, "dissolvedO2_port", "port"
             )
         except KeyError:
             self.logger.debug("No dissolvedO2_port data in %s", self.args.mission)
@@ -1849,13 +1840,7 @@ class Calibrate_NetCDF:
                 self.combined_nc[f"{sensor}_oxygen_mll_stbd"],
                 self.combined_nc[f"{sensor}_oxygen_umolkg_stbd"],
             ) = self._calibrated_oxygen(
-                sensor,
-                cf,
-                orig_nc,
-                "dissolvedO2_stbd",
-                temperature,
-                salinity,
-                "stbd",
+                sensor, kernel, orig_nc, "dissolvedO2_stbd", "stbd"
             )
         except KeyError:
             self.logger.debug("No dissolvedO2_port data in %s", self.args.mission)
@@ -1896,9 +1881,7 @@ class Calibrate_NetCDF:
             self.logger.debug("No flow2 data in %s", self.args.mission)
 
         try:
-            beam_transmittance, _ = _beam_transmittance_from_volts(
-                self.combined_nc, orig_nc
-            )
+            beam_transmittance, _ = kernel.beam_transmittance()
             beam_transmittance = xr.DataArray(
                 beam_transmittance * 100.0,
                 coords=[orig_nc.get_index("time")],
@@ -2067,8 +2050,44 @@ class Calibrate_NetCDF:
         lag_info = (
             f"with plumbing lag correction of {self.sinfo[sensor]['lag_secs']} seconds"
         )
+        self.applied_lag_secs[sensor] = self.sinfo[sensor]["lag_secs"]
         return lagged_time, lag_info
 
+    def _estimate_lags(self) -> None:
+        """Estimate the plumbing lags of the pumped sensors from the calibrated
+        data, see lag_estimation.py, and with --apply_lags shift their times
+        by the estimates in place of the lag_secs of _define_sensor_info()"""
+        self.lag_estimates = {}
+        for sensor in LAG_PAIRS:
+            if sensor not in self.sinfo:
+                continue
+            estimate = estimate_lag(
+                self.combined_nc, sensor, self.applied_lag_secs.get(sensor, 0.0)
+            )
+            if estimate is None:
+                self.logger.info(f"Cannot estimate the plumbing lag of {sensor}")
+                continue
+            self.logger.info(
+                f"{estimate}, lag_secs configured: {self.sinfo[sensor]['lag_secs']}"
+            )
+            self.lag_estimates[sensor] = estimate
+            if getattr(self.args, "apply_lags", False):
+                if estimate.within_sensor:
+                    self.logger.info(
+                        f"Not applying the lag of {estimate.variable} relative to"
+                        f" {estimate.reference} of the same sensor"
+                    )
+                    continue
+                if estimate.n_profiles < MIN_PROFILES:
+                    self.logger.warning(
+                        f"Not applying the lag of {sensor} estimated from only"
+                        f" {estimate.n_profiles} profiles"
+                    )
+                    continue
+                self.combined_nc = apply_lag(self.combined_nc, estimate)
+                self.sinfo[sensor]["lag_secs"] = estimate.lag_secs
+                self.applied_lag_secs[sensor] = estimate.lag_secs
+
     def _biolume_process(self, sensor):
         try:
             orig_nc = getattr(self, sensor).orig_data
@@ -2296,21 +2315,15 @@ class Calibrate_NetCDF:
         array.
         """
         try:
-            p_interp = interp1d(
-                self.combined_nc["navigation_time"].values.tolist(),
+            pitch = interp_extrapolate(
+                orig_nc["time"].values,
+                self.combined_nc["navigation_time"].values,
                 self.combined_nc["navigation_pitch"].values,
-                fill_value="extrapolate",
             )
         except KeyError:
             raise EOFError("No navigation_time or navigation_pitch in combined_nc. ")
-        pitch = p_interp(orig_nc["time"].values.tolist())
 
-        d_interp = interp1d(
-            self.combined_nc["depth_time"].values.tolist(),
-            self.combined_nc["depth_filtdepth"].values,
-            fill_value="extrapolate",
-        )
-        orig_depth = d_interp(orig_nc["time"].values.tolist())
+        orig_depth = depth_at(self.combined_nc, orig_nc["time"].values)
         offs_depth = align_geom(self.sinfo[sensor]["sensor_offset"], pitch)
 
         corrected_depth = xr.DataArray(
@@ -2413,17 +2426,40 @@ class Calibrate_NetCDF:
         vehicle = vehicle or self.args.auv_name
         self.combined_nc.attrs = self.global_metadata()
         out_fn = os.path.join(netcdfs_dir, f"{vehicle}_{name}_cal.nc")
+        if getattr(self, "selection", None):
+            try:
+                self.combined_nc = merge_into(out_fn, self.combined_nc, self.selection)
+            except MergeError as e:
+                self.logger.warning(f"Cannot merge {self.selection}: {e}")
+                self.process_logs(vehicle, name, selective=False)
+                self.combined_nc.attrs = self.global_metadata()
         self.logger.info(f"Writing calibrated instrument data to {out_fn}")
         if os.path.exists(out_fn):
             os.remove(out_fn)
-        self.combined_nc.to_netcdf(out_fn)
+        write_dataset(
+            self.combined_nc,
+            out_fn,
+            getattr(self.args, "storage", STORAGE),
+            getattr(self.args, "encoding", ENCODING),
+            self.logger,
+        )
         self.logger.info(
             "Data variables written: %s", ", ".join(sorted(self.combined_nc.variables))
         )
+        # The original data have been read into the calibrated data written
+        if getattr(self, "sensor_files", None) is not None:
+            self.sensor_files.close()
 
     def process_logs(
-        self, vehicle: str = None, name: str = None, process_gps: bool = True
+        self,
+        vehicle: str = None,
+        name: str = None,
+        process_gps: bool = True,
+        selective: bool = True,
     ) -> None:
+        """Calibrate the data of all the sensors, or with `selective` only
+        those selected with --sensors or --variables and those they need,
+        see selection.py"""
         name = name or self.args.mission
         vehicle = vehicle or self.args.auv_name
         logs_dir = os.path.join(self.args.base_path, vehicle, MISSIONLOGS, name)
@@ -2432,11 +2468,30 @@ class Calibrate_NetCDF:
         self._define_sensor_info(start_datetime)
         self._read_data(logs_dir, netcdfs_dir)
         self.combined_nc = xr.Dataset()
+        self.applied_lag_secs = {}
+        estimate_lags = getattr(self.args, "estimate_lags", False) or getattr(
+            self.args, "apply_lags", False
+        )
+        self.selection = None
+        if selective:
+            self.selection = stage_selection(
+                self.args,
+                [os.path.join(netcdfs_dir, f"{vehicle}_{name}_cal.nc")],
+                self.logger,
+            )
+        if self.selection:
+            dependencies = dict(CALIBRATE_DEPENDENCIES)
+            if estimate_lags:
+                for sensor, references in LAG_DEPENDENCIES.items():
+                    dependencies[sensor] = dependencies.get(sensor, ()) + references
+            sensors = self.selection.expand(dependencies)
 
         for sensor in self.sinfo.keys():
             if not process_gps:
                 if sensor == "gps":
                     continue  # to skip gps processing in conftest.py fixture
+            if self.selection and sensor not in sensors:
+                continue
             setattr(getattr(self, sensor), "cal_align_data", xr.Dataset())
             self.logger.debug(f"Processing {vehicle} {name} {sensor}")
             try:
@@ -2445,6 +2500,8 @@ class Calibrate_NetCDF:
                 self.logger.error(f"Error processing {sensor}: {e}")
             except KeyError as e:
                 self.logger.error(f"Error processing {sensor}: missing variable {e}")
+        if estimate_lags:
+            self._estimate_lags()
 
         return netcdfs_dir
 
@@ -2483,6 +2540,41 @@ class Calibrate_NetCDF:
             action="store_true",
             help="Execute without asking for a response, e.g. to not ask to re-download file",
         )
+        parser.add_argument(
+            "--encoding",
+            action="store",
+            choices=ENCODINGS,
+            default=ENCODING,
+            help="Compression and precision of the netCDF file written,"
+            f" default: {ENCODING}, see nc_encoding.py",
+        )
+        parser.add_argument(
+            "--storage",
+            action="store",
+            choices=STORAGES,
+            default=STORAGE,
+            help="Write a netCDF file, a Zarr store or both, default: netcdf",
+        )
+        add_arguments(parser)
+        parser.add_argument(
+            "--no_cal_cache",
+            action="store_false",
+            dest="cal_cache",
+            help="Parse the calibration files of the mission instead of using"
+            f" those cached by content in {CAL_CACHE_DIR} of the base_path",
+        )
+        parser.add_argument(
+            "--estimate_lags",
+            action="store_true",
+            help="Estimate the plumbing lags of the pumped sensors from the data"
+            " and write them to the metadata, see lag_estimation.py",
+        )
+        parser.add_argument(
+            "--apply_lags",
+            action="store_true",
+            help="Apply the estimated plumbing lags in place of the configured"
+            " lag_secs, implies --estimate_lags",
+        )
         parser.add_argument(
             "--plot",
             action="store",
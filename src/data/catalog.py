@@ -0,0 +1,220 @@
+"""
+Catalog of the mission directories of a vehicle in an sqlite database so
+that missions are found without walking the whole archive with find.
+
+The catalog records the path, size and modification time of each mission
+directory, named like 2020.245.00, found under the vehicle's directory, and
+the last processing stage run for it.  Refreshing the catalog lists only the
+directories whose modification time changed since the last refresh, using
+the subdirectories recorded for the others, and rereads the size of only
+the mission directories that changed.  The database is kept with the local
+processed data as sqlite is not safe to write on a network mount.
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+from typing import Dict, List, Optional
+
+CATALOG_FILE = "mission_catalog.sqlite"
+MISSION_REGEX = re.compile(r"^[0-9]{4}\.[0-9]{3}\.[0-9]{2}$")
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime REAL,
+    children TEXT
+);
+CREATE TABLE IF NOT EXISTS missions (
+    path TEXT PRIMARY KEY,
+    name TEXT,
+    vehicle TEXT,
+    size INTEGER,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS missions_name ON missions (vehicle, name);
+CREATE TABLE IF NOT EXISTS stages (
+    vehicle TEXT,
+    name TEXT,
+    stage TEXT,
+    updated REAL,
+    PRIMARY KEY (vehicle, name)
+);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def _directory_size(path: str) -> int:
+    "Return the bytes of the files in directory `path`"
+    with os.scandir(path) as entries:
+        return sum(entry.stat().st_size for entry in entries if entry.is_file())
+
+
+class MissionCatalog:
+    """Missions of `vehicle` found under `root`, recorded in the sqlite
+    database `db_path`.  A connection is opened for each operation so that
+    the catalog can be passed to worker processes."""
+
+    def __init__(
+        self, db_path: str, root: str, vehicle: str, log: logging.Logger = logger
+    ) -> None:
+        self.db_path = db_path
+        self.root = os.path.normpath(root)
+        self.vehicle = vehicle
+        self.logger = log
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        # Worker processes may record stages at the same time
+        con = sqlite3.connect(self.db_path, timeout=30)
+        con.executescript(SCHEMA)
+        return con
+
+    def _forget(self, con: sqlite3.Connection, path: str) -> None:
+        "Remove directory `path` and all that was found under it"
+        pattern = path.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+        for table in ("dirs", "missions"):
+            con.execute(
+                f"DELETE FROM {table} WHERE path = ? OR path LIKE ? ESCAPE '!'",
+                (path, f"{pattern}{os.sep}%"),
+            )
+
+    def _list(self, con: sqlite3.Connection, path: str, mtime: float) -> List[str]:
+        "Return the subdirectories of `path`, recording them"
+        with os.scandir(path) as entries:
+            children = sorted(
+                entry.name for entry in entries if entry.is_dir(follow_symlinks=False)
+            )
+        row = con.execute(
+            "SELECT children FROM dirs WHERE path = ?", (path,)
+        ).fetchone()
+        if row:
+            for removed in set(json.loads(row[0])) - set(children):
+                self.logger.debug("Removing %s from the catalog", removed)
+                self._forget(con, os.path.join(path, removed))
+        con.execute(
+            "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)",
+            (path, mtime, json.dumps(children)),
+        )
+        return children
+
+    def _update_mission(
+        self, con: sqlite3.Connection, path: str, known: Dict[str, float]
+    ) -> None:
+        "Record the size and modification time of mission directory `path`"
+        try:
+            mtime = os.stat(path).st_mtime
+            if known.get(path) == mtime:
+                return
+            size = _directory_size(path)
+        except FileNotFoundError:
+            self._forget(con, path)
+            return
+        con.execute(
+            "INSERT OR REPLACE INTO missions VALUES (?, ?, ?, ?, ?)",
+            (path, os.path.basename(path), self.vehicle, size, mtime),
+        )
+
+    def refresh(self, full: bool = False) -> int:
+        """Update the catalog with the mission directories under the root,
+        listing only the directories changed since the last refresh, or all
+        of them if `full`.  Returns the number of directories listed.  Raises
+        FileNotFoundError if the root does not exist, e.g. is not mounted."""
+        t_start = time.time()
+        listed = 0
+        with closing(self._connect()) as con, con:
+            dirs = {
+                path: (mtime, json.loads(children))
+                for path, mtime, children in con.execute("SELECT * FROM dirs")
+            }
+            missions = dict(con.execute("SELECT path, mtime FROM missions"))
+            to_visit = [self.root]
+            while to_visit:
+                path = to_visit.pop()
+                try:
+                    mtime = os.stat(path).st_mtime
+                    if full or dirs.get(path, (None,))[0] != mtime:
+                        children = self._list(con, path, mtime)
+                        listed += 1
+                    else:
+                        children = dirs[path][1]
+                except FileNotFoundError:
+                    if path == self.root:
+                        raise
+                    self._forget(con, path)
+                    continue
+                for child in children:
+                    if MISSION_REGEX.match(child):
+                        self._update_mission(con, os.path.join(path, child), missions)
+                    else:
+                        to_visit.append(os.path.join(path, child))
+        self.logger.info(
+            "Refreshed the mission catalog of %s in %.1f seconds, listing %d"
+            " changed directories",
+            self.root,
+            time.time() - t_start,
+            listed,
+        )
+        return listed
+
+    def _rows(self, con: sqlite3.Connection, query: str, params: tuple = ()):
+        "Return the rows of `query` for the missions under the root"
+        prefix = self.root + os.sep
+        return [
+            row
+            for row in con.execute(query, (self.vehicle, *params))
+            if row[0].startswith(prefix)
+        ]
+
+    def missions(
+        self, start_year: int, end_year: int, since: float = None
+    ) -> Dict[str, str]:
+        """Return the directories keyed by mission name of the missions from
+        `start_year` to `end_year`, and if given modified after the time
+        `since` in seconds since the epoch"""
+        query = "SELECT path, name FROM missions WHERE vehicle = ?"
+        params = ()
+        if since is not None:
+            query += " AND mtime > ?"
+            params = (since,)
+        missions = {}
+        with closing(self._connect()) as con:
+            for path, name in self._rows(con, f"{query} ORDER BY path", params):
+                if start_year <= int(name.split(".")[0]) <= end_year:
+                    missions[name] = path
+        return missions
+
+    def path(self, mission: str) -> Optional[str]:
+        "Return the directory of `mission`, None if it is not in the catalog"
+        with closing(self._connect()) as con:
+            rows = self._rows(
+                con,
+                "SELECT path FROM missions WHERE vehicle = ? AND name = ?"
+                " ORDER BY path",
+                (mission,),
+            )
+        return rows[-1][0] if rows else None
+
+    def record_stage(self, mission: str, stage: str) -> None:
+        "Record `stage` as the last processing stage run for `mission`"
+        with closing(self._connect()) as con, con:
+            con.execute(
+                "INSERT OR REPLACE INTO stages VALUES (?, ?, ?, ?)",
+                (self.vehicle, mission, stage, time.time()),
+            )
+
+    def last_stage(self, mission: str) -> Optional[str]:
+        "Return the last processing stage run for `mission`"
+        with closing(self._connect()) as con:
+            row = con.execute(
+                "SELECT stage FROM stages WHERE vehicle = ? AND name = ?",
+                (self.vehicle, mission),
+            ).fetchone()
+        return row[0] if row else None
@@ -30,3 +30,110 @@ def calibration(mission_data):
     )
     cal_fn = os.path.join(logs_dir, md.sinfo["hs2"]["cal_filename"])
     return hs2_read_cal_file(cal_fn)
+
+
+@pytest.fixture()
+def portal_server():
+    """Serve fake mission files from a local stand-in for the auv-portal data
+    service.  The first request for each file is disconnected after half of
+    the file has been sent.  Files are served with an ETag and conditional
+    requests for unchanged files get a 304 response, and Range requests with an
+    If-Range of another ETag get the whole file.  Yields a dict with the
+    "url" to use as portal base, the "files" served, which may be changed,
+    and the "ranges", "statuses" and "max_active" requests seen.  The
+    "deployments" list and the "requests" made for deployments and file
+    lists may also be used.
+    """
+    import asyncio
+    import hashlib
+    import threading
+
+    import numpy as np
+    from aiohttp import web
+
+    rng = np.random.default_rng(1)
+    state = {
+        "files": {
+            "vehicle.cfg": rng.bytes(1000),
+            "navigation.log": rng.bytes(3_000_000),
+            "biolume.log": rng.bytes(5_000_000),
+            "gps.log": rng.bytes(20_000),
+        },
+        "deployments": [
+            {"vehicle": "dorado", "name": "2020.245.00"},
+            {"vehicle": "dorado", "name": "2020.246.01"},
+            {"vehicle": "i2map", "name": "2020.246.00"},
+        ],
+        "requests": [],
+        "ranges": [],
+        "statuses": [],
+        "active": 0,
+        "max_active": 0,
+    }
+    requested = set()
+
+    async def deployments(request):
+        state["requests"].append(request.path_qs)
+        return web.json_response(state["deployments"])
+
+    async def files_list(request):
+        state["requests"].append(request.path_qs)
+        return web.json_response({"names": list(state["files"])})
+
+    async def download(request):
+        file_name = request.match_info["file"]
+        data = state["files"][file_name]
+        state["active"] += 1
+        state["max_active"] = max(state["max_active"], state["active"])
+        try:
+            await asyncio.sleep(0.05)
+            etag = f'"{hashlib.md5(data).hexdigest()}"'
+            if request.headers.get("If-None-Match") == etag:
+                state["statuses"].append((file_name, 304))
+                return web.Response(status=304, headers={"ETag": etag})
+            start = 0
+            status = 200
+            range_header = request.headers.get("Range")
+            if request.headers.get("If-Range", etag) != etag:
+                # Changed since the range was requested, send the whole file
+                range_header = None
+            if range_header:
+                state["ranges"].append((file_name, range_header))
+                start = int(range_header.split("=")[1].split("-")[0])
+                status = 206
+            state["statuses"].append((file_name, status))
+            resp = web.StreamResponse(status=status, headers={"ETag": etag})
+            resp.content_length = len(data) - start
+            if status == 206:
+                resp.headers["Content-Range"] = (
+                    f"bytes {start}-{len(data) - 1}/{len(data)}"
+                )
+            await resp.prepare(request)
+            if file_name not in requested:
+                requested.add(file_name)
+                await resp.write(data[start : len(data) // 2])
+                request.transport.close()
+                return resp
+            await resp.write(data[start:])
+            await resp.write_eof()
+            return resp
+        finally:
+            state["active"] -= 1
+
+    app = web.Application()
+    app.router.add_get("/deployments", deployments)
+    app.router.add_get("/files/list/{name}/{vehicle}", files_list)
+    app.router.add_get("/files/download/{name}/{vehicle}/{file}", download)
+    runner = web.AppRunner(app)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    loop.run_until_complete(site.start())
+    port = site._server.sockets[0].getsockname()[1]
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    state["url"] = f"http://127.0.0.1:{port}"
+    yield state
+    asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
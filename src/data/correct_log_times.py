@@ -5,29 +5,40 @@ Used (initially) for 2017.284.00.  Files must first be downloaded by running:
 ./logs2netcdfs.py --auv_name Dorado389 --mission 2017.284.00 -v
 
 See https://bitbucket.org/mbari/auv-python/issues/6/dorado_2017_284_00-clock-is-wrong
+
+The clock offsets of the instruments that log depth or pressure can be
+estimated with --estimate_offset, see xcorr.py, and applied to their logs
+with --apply_estimate.  Many missions are checked for drifted clocks with
+--scan.
 """
 
 __author__ = "Mike McCann"
 __copyright__ = "Copyright 2020, Monterey Bay Aquarium Research Institute"
 
 import argparse
-import asyncio
-import concurrent
 import logging
 import os
-import struct
 import sys
-import time
-from array import array
 from datetime import datetime, timedelta
 from glob import glob
 from pathlib import Path
 from shutil import copyfile
-from typing import List
+from typing import Dict, List, Tuple
 
+import numpy as np
 from AUV import AUV
 from logs2netcdfs import AUV_NetCDF
-from readauvlog import log_record
+from readauvlog import read_array
+from xcorr import (
+    DRIFT_THRESHOLD,
+    MIN_CONFIDENCE,
+    REFERENCE_LOGS,
+    XCORR_DT,
+    OffsetEstimate,
+    estimate_offset,
+    log_signal,
+    reference_signal,
+)
 
 LOG_FILES = (
     "ctdDriver.log",
@@ -56,114 +67,20 @@ class TimeCorrect(AUV):
     logger.addHandler(_handler)
     _log_levels = (logging.WARN, logging.INFO, logging.DEBUG)
 
-    def read(self, file: str) -> List[log_record]:
-        """Reads and parses an AUV log and returns a list of `log_records`"""
-        byte_offset = 0
-        records = []
-        (byte_offset, records, header_text) = self._read_header(file)
-        self._read_data(file, records, byte_offset)
-
-        return records, header_text
-
-    def _read_header(self, file: str):
-        """Parses the ASCII header of the log file"""
-        with open(file, "r", encoding="ISO-8859-15") as f:
-            byte_offset = 0
-            records = []
-            instrument_name = os.path.basename(f.name)
-
-            # Yes, read 2 lines here.
-            line = f.readline()
-            text = line
-            line = f.readline()
-            while line:
-                text += line
-                if "begin" in line:
-                    break
-                else:
-                    # parse line
-                    ssv = line.split(" ")
-                    data_type = ssv[1]
-                    short_name = ssv[2]
-
-                    csv = line.split(",")
-                    long_name = csv[1].strip()
-                    units = csv[2].strip()
-                    if short_name == TIME:
-                        units = "seconds since 1970-01-01 00:00:00Z"
-                    r = log_record(
-                        data_type, short_name, long_name, units, instrument_name, []
-                    )
-                    records.append(r)
-
-                line = f.readline()
-                byte_offset = f.tell()
-
-            return (byte_offset, records, text)
-
-    def _read_data(self, file: str, records: List[log_record], byte_offset: int):
-        """Parse the binary section of the log file"""
-        if byte_offset == 0:
-            raise EOFError(f"{file}: 0 sized file")
-        file_size = os.path.getsize(file)
-
-        ok = True
-        rec_count = 0
-        len_sum = 0
-        with open(file, "rb") as f:
-            f.seek(byte_offset)
-            while ok:
-                for r in records:
-                    b = f.read(r.length())
-                    len_sum += r.length()
-                    if not b:
-                        ok = False
-                        len_sum -= r.length()
-                        break
-                    s = "<d"
-                    if r.data_type == "float":
-                        s = "<f"
-                    elif r.data_type == "integer":
-                        s = "<i"
-                    elif r.data_type == "short":
-                        s = "<h"
-                    try:
-                        v = struct.unpack(s, b)[0]
-                    except struct.error as e:
-                        self.logger.warning(
-                            f"{e}, b = {b} at record {rec_count},"
-                            f" for {r.short_name} in file {file}"
-                        )
-                        self.logger.info(
-                            f"bytes read = {byte_offset + len_sum}"
-                            f" file size = {file_size}"
-                        )
-                        self.logger.info(
-                            f"Tried to read {r.length()} bytes, but"
-                            f" only {byte_offset+len_sum-file_size}"
-                            f" bytes remaining"
-                        )
-                        raise
-                    r.data.append(v)
-                rec_count += 1
-
+    def read(self, file: str) -> Tuple[bytes, np.ndarray]:
+        """Reads an AUV log and returns its header as the bytes in the file
+        and its records as a structured array"""
+        records, header, data = read_array(file)
+        extra = (os.path.getsize(file) - len(header)) % data.dtype.itemsize
+        if extra:
+            self.logger.warning(
+                f"Dropping the last {extra} bytes of {file},"
+                f" a partial record of {data.dtype.itemsize} bytes"
+            )
         self.logger.debug(
-            f"bytes read = {byte_offset + len_sum}" f" file size = {file_size}"
+            f"Read {len(data)} records of {[r.short_name for r in records]}"
         )
-
-    def _correct_dup_short_names(self, log_data):
-        short_names = [v.short_name for v in log_data]
-        dupes = set([x for n, x in enumerate(short_names) if x in short_names[:n]])
-        if len(dupes) > 1:
-            raise ValueError(f"Found more than one duplicate: {dupes}")
-        elif len(dupes) == 1:
-            count = 0
-            for i, variable in enumerate(log_data):
-                if variable.short_name in dupes:
-                    count += 1
-                    log_data[i].short_name = f"{log_data[i].short_name}{count}"
-
-        return log_data
+        return header, data
 
     def _new_base_filename(self):
         ndt = datetime.strptime("".join(self.args.mission.split(".")[:2]), "%Y%j")
@@ -171,78 +88,173 @@ class TimeCorrect(AUV):
         nbf = f"{ndt.strftime('%Y.%j')}.{self.args.mission.split('.')[-1]}"
         return nbf
 
-    def _add_and_write(self, log_data, header_text, new_logs_dir, filename):
-        log_data = self._correct_dup_short_names(log_data)
+    def _add_and_write(self, header, data, new_logs_dir, filename, seconds=None):
+        if seconds is None:
+            seconds = self.args.add_seconds
         log_filename = os.path.join(new_logs_dir, filename)
         self.logger.debug(f"Writing log file {log_filename}")
-        self.logger.info(
-            f"Adding {self.args.add_seconds} seconds" f" to variable {TIME}"
-        )
+        self.logger.info(f"Adding {seconds} seconds" f" to variable {TIME}")
+        if TIME in data.dtype.names:
+            data[TIME] += seconds
         with open(log_filename, "wb") as fh:
-            fh.write(bytes(header_text, encoding="utf8"))
-            ok = True
-            while ok:
-                sdata = b""
-                for var in log_data:
-                    try:
-                        datum = var.data.pop(0)
-                    except IndexError:
-                        ok = False
-                        break
-                    if var.short_name == TIME:
-                        datum += self.args.add_seconds
-                    sf = "<d"
-                    if var.data_type == "float":
-                        sf = "<f"
-                    elif var.data_type == "short":
-                        sf = "<h"
-                    elif var.data_type == "integer":
-                        sf = "<i"
-                    sdata += struct.pack(sf, datum)
-
-                fh.write(sdata)
-
-        fh.close()
+            fh.write(header)
+            fh.write(data.tobytes())
         self.logger.info(f"Wrote log file {log_filename}")
 
-    def _verify(self, log_filename):
+    def _verify(self, log_filename, header, data):
         self.logger.info(f"verifying file {log_filename}")
-        log_data, header_text = self.read(log_filename)
-        return
+        new_header, new_data = self.read(log_filename)
+        if new_header != header or not np.array_equal(new_data, data):
+            raise ValueError(f"{log_filename} does not match the corrected data")
+
+    def estimate_offsets(self, name: str = None) -> List[OffsetEstimate]:
+        """Estimate the offset of the clock of each log of mission `name` that
+        has a depth or pressure relative to the vehicle's depth"""
+        name = name or self.args.mission
+        logs_dir = os.path.join(
+            self.args.base_path, self.args.auv_name, MISSIONLOGS, name
+        )
+        reference, ref_times, ref_depths = reference_signal(logs_dir)
+        estimates = []
+        for log_filename in sorted(glob(os.path.join(logs_dir, "*.log"))):
+            log = os.path.basename(log_filename)
+            if log in [ref_log for ref_log, _ in REFERENCE_LOGS]:
+                continue
+            try:
+                times, values = log_signal(log_filename)
+                offset, confidence, overlap = estimate_offset(
+                    ref_times,
+                    ref_depths,
+                    times,
+                    values,
+                    dt=getattr(self.args, "xcorr_dt", XCORR_DT),
+                    max_offset=getattr(self.args, "max_offset", None),
+                )
+            except (EOFError, LookupError, ValueError) as e:
+                self.logger.debug(f"Cannot estimate the offset of {log}: {e}")
+                continue
+            estimates.append(
+                OffsetEstimate(log, reference, offset, confidence, overlap)
+            )
+        return estimates
+
+    def _confident(self, estimate: OffsetEstimate) -> bool:
+        return estimate.confidence >= getattr(
+            self.args, "min_confidence", MIN_CONFIDENCE
+        )
 
-    def correct_times(self):
+    def report_offsets(self, name: str = None) -> List[OffsetEstimate]:
+        """Log the estimated offsets of the logs of mission `name`, as warnings
+        for those that drifted more than --drift_threshold seconds"""
+        name = name or self.args.mission
+        threshold = getattr(self.args, "drift_threshold", DRIFT_THRESHOLD)
+        try:
+            estimates = self.estimate_offsets(name)
+        except LookupError as e:
+            self.logger.warning(f"{name}: {e}")
+            return []
+        for estimate in estimates:
+            if estimate.drifted(threshold) and self._confident(estimate):
+                self.logger.warning(f"{name}: clock drifted {estimate}")
+            else:
+                self.logger.info(f"{name}: {estimate}")
+        return estimates
+
+    def scan_missions(self) -> Dict[str, List[OffsetEstimate]]:
+        """Estimate the offsets of the missions matching the --scan patterns
+        and return those of the logs that drifted, by mission"""
+        missions_dir = os.path.join(
+            self.args.base_path, self.args.auv_name, MISSIONLOGS
+        )
+        names = sorted(
+            {
+                os.path.basename(path)
+                for pattern in self.args.scan
+                for path in glob(os.path.join(missions_dir, pattern))
+                if os.path.isdir(path)
+            }
+        )
+        self.logger.info(f"Scanning {len(names)} missions in {missions_dir}")
+        threshold = getattr(self.args, "drift_threshold", DRIFT_THRESHOLD)
+        drifted = {}
+        for name in names:
+            estimates = [
+                estimate
+                for estimate in self.report_offsets(name)
+                if estimate.drifted(threshold) and self._confident(estimate)
+            ]
+            if estimates:
+                drifted[name] = estimates
+        for name, estimates in drifted.items():
+            self.logger.info(f"{name} drifted: {', '.join(e.log for e in estimates)}")
+        self.logger.info(f"{len(drifted)} of {len(names)} missions have drifted clocks")
+        return drifted
+
+    def estimated_offsets(self) -> Dict[str, float]:
+        """Return the estimated offsets of the logs of the mission whose clocks
+        drifted, by log file name"""
+        threshold = getattr(self.args, "drift_threshold", DRIFT_THRESHOLD)
+        return {
+            estimate.log: estimate.offset
+            for estimate in self.report_offsets()
+            if estimate.drifted(threshold) and self._confident(estimate)
+        }
+
+    def correct_times(self, offsets: Dict[str, float] = None):
+        """Write the mission's logs to a new mission directory adding
+        --add_seconds to their times or, if `offsets` are given, the seconds
+        of each log in `offsets` with the other logs copied unchanged"""
         vehicle = self.args.auv_name
         name = self.args.mission
         logs_dir = os.path.join(self.args.base_path, vehicle, MISSIONLOGS, name)
-        new_basename = self._new_base_filename()
+        new_basename = getattr(self.args, "new_mission", None)
+        new_basename = new_basename or self._new_base_filename()
+        if new_basename == name:
+            raise ValueError(f"Cannot write the corrected logs of {name} to itself")
         new_logs_dir = os.path.join(
             self.args.base_path, vehicle, MISSIONLOGS, new_basename
         )
         Path(new_logs_dir).mkdir(parents=True, exist_ok=True)
         for log_filename in glob(os.path.join(logs_dir, "*")):
             nlfn = os.path.join(new_logs_dir, os.path.basename(log_filename))
-            if os.path.getsize(log_filename) == 0 or not log_filename.endswith(".log"):
+            seconds = None
+            if offsets is not None:
+                seconds = offsets.get(os.path.basename(log_filename))
+            if (
+                os.path.getsize(log_filename) == 0
+                or not log_filename.endswith(".log")
+                or (offsets is not None and seconds is None)
+            ):
                 self.logger.info(f"Copying file {log_filename}")
                 copyfile(log_filename, nlfn)
             else:
                 try:
                     self.logger.info(f"Reading file {log_filename}")
-                    log_data, header_text = self.read(log_filename)
-                except (FileNotFoundError, EOFError, struct.error) as e:
-                    self.logger.debug(f"{e}")
+                    header, data = self.read(log_filename)
+                except (FileNotFoundError, EOFError) as e:
+                    self.logger.warning(f"{e}, copying {log_filename}")
+                    copyfile(log_filename, nlfn)
+                    continue
 
                 self._add_and_write(
-                    log_data, header_text, new_logs_dir, os.path.basename(log_filename)
+                    header, data, new_logs_dir, os.path.basename(log_filename), seconds
                 )
 
-            # Uncomment to verify correct writing - use with debugger
-            ##self._verify(nlfn)
+                # Uncomment to verify correct writing
+                ##self._verify(nlfn, header, data)
 
     def process_command_line(self):
         examples = "Example:" + "\n\n"
         examples += "  Write new original log files with time correction:\n"
         examples += f"    {sys.argv[0]} --auv_name Dorado389 --mission 2017.284.00"
-        examples += f" --add_seconds 1146649.348504"
+        examples += f" --add_seconds 1146649.348504\n"
+        examples += "  Estimate the clock offsets of the instruments of a mission:\n"
+        examples += f"    {sys.argv[0]} --mission 2020.245.00 --estimate_offset -v\n"
+        examples += "  Correct the logs of the instruments whose clocks drifted:\n"
+        examples += f"    {sys.argv[0]} --mission 2020.245.00 --estimate_offset"
+        examples += " --apply_estimate --new_mission 2020.245.90\n"
+        examples += "  Find the missions of 2020 with drifted instrument clocks:\n"
+        examples += f"    {sys.argv[0]} --scan '2020.*'\n"
 
         parser = argparse.ArgumentParser(
             formatter_class=argparse.RawTextHelpFormatter,
@@ -275,6 +287,62 @@ class TimeCorrect(AUV):
             type=float,
             default=1146649.348504,
         )
+        parser.add_argument(
+            "--new_mission",
+            action="store",
+            help="Mission directory for the corrected logs, default: --mission"
+            " with the day moved by --add_seconds",
+        )
+        parser.add_argument(
+            "--estimate_offset",
+            action="store_true",
+            help="Estimate the clock offset of each log with a depth or pressure"
+            " by cross-correlation with the vehicle's depth",
+        )
+        parser.add_argument(
+            "--apply_estimate",
+            action="store_true",
+            help="With --estimate_offset write the logs whose clocks drifted"
+            " corrected by their estimated offsets to --new_mission",
+        )
+        parser.add_argument(
+            "--scan",
+            action="store",
+            nargs="+",
+            help="Estimate the clock offsets of the missions matching these"
+            " patterns, e.g. '2020.*', and list those that drifted",
+        )
+        parser.add_argument(
+            "--drift_threshold",
+            action="store",
+            type=float,
+            default=DRIFT_THRESHOLD,
+            help="Seconds of offset reported as a drifted clock,"
+            f" default: {DRIFT_THRESHOLD}",
+        )
+        parser.add_argument(
+            "--min_confidence",
+            action="store",
+            type=float,
+            default=MIN_CONFIDENCE,
+            help="Least correlation coefficient of an estimate that is used,"
+            f" default: {MIN_CONFIDENCE}",
+        )
+        parser.add_argument(
+            "--max_offset",
+            action="store",
+            type=float,
+            help="Largest offset in seconds searched for, default: any offset"
+            " with half of the records overlapping",
+        )
+        parser.add_argument(
+            "--xcorr_dt",
+            action="store",
+            type=float,
+            default=XCORR_DT,
+            help="Seconds between the points cross-correlated,"
+            f" default: {XCORR_DT}",
+        )
         parser.add_argument(
             "-v",
             "--verbose",
@@ -292,6 +360,8 @@ class TimeCorrect(AUV):
 
         self.args = parser.parse_args()
         self.logger.setLevel(self._log_levels[self.args.verbose])
+        if self.args.apply_estimate and not self.args.new_mission:
+            parser.error("--apply_estimate requires --new_mission")
 
         self.commandline = " ".join(sys.argv)
 
@@ -299,4 +369,11 @@ class TimeCorrect(AUV):
 if __name__ == "__main__":
     tc = TimeCorrect()
     tc.process_command_line()
-    tc.correct_times()
+    if tc.args.scan:
+        tc.scan_missions()
+    elif tc.args.estimate_offset:
+        offsets = tc.estimated_offsets()
+        if tc.args.apply_estimate:
+            tc.correct_times(offsets)
+    else:
+        tc.correct_times()
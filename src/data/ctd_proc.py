@@ -1,6 +1,9 @@
+from functools import cached_property
+from typing import Dict, Tuple
+
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy.interpolate import interp1d
+from depth_engine import as_seconds, pressure_at
 from seawater import eos80
 
 # History of seabird25p.cfg file changes:
@@ -94,25 +97,17 @@ def _calibrated_temp_from_frequency(cf, nc):
     # }
     K2C = 273.15
     if cf.t_coefs == "A":
+        f = np.log(cf.t_f0 / nc["temp_frequency"].values)
         calibrated_temp = (
             1.0
-            / (
-                cf.t_a
-                + cf.t_b * np.log(cf.t_f0 / nc["temp_frequency"].values)
-                + cf.t_c * np.power(np.log(cf.t_f0 / nc["temp_frequency"]), 2)
-                + cf.t_d * np.power(np.log(cf.t_f0 / nc["temp_frequency"]), 3)
-            )
+            / (cf.t_a + cf.t_b * f + cf.t_c * np.power(f, 2) + cf.t_d * np.power(f, 3))
             - K2C
         )
     elif cf.t_coefs == "G":
+        f = np.log(cf.t_gf0 / nc["temp_frequency"].values)
         calibrated_temp = (
             1.0
-            / (
-                cf.t_g
-                + cf.t_h * np.log(cf.t_gf0 / nc["temp_frequency"].values)
-                + cf.t_i * np.power(np.log(cf.t_gf0 / nc["temp_frequency"]), 2)
-                + cf.t_j * np.power(np.log(cf.t_gf0 / nc["temp_frequency"]), 3)
-            )
+            / (cf.t_g + cf.t_h * f + cf.t_i * np.power(f, 2) + cf.t_j * np.power(f, 3))
             - K2C
         )
     else:
@@ -121,7 +116,9 @@ def _calibrated_temp_from_frequency(cf, nc):
     return calibrated_temp
 
 
-def _calibrated_sal_from_cond_frequency(args, combined_nc, logger, cf, nc, temp):
+def _calibrated_sal_from_cond_frequency(
+    args, combined_nc, logger, cf, nc, temp, p1=None
+):
     # Comments carried over from doradosdp's processCTD.m:
     # Note that recalculation of conductivity and correction for thermal mass
     # are possible, however, their magnitude results in salinity differences
@@ -132,12 +129,9 @@ def _calibrated_sal_from_cond_frequency(args, combined_nc, logger, cf, nc, temp)
     sw_c3515 = 42.914
     eps = np.spacing(1)
 
-    f_interp = interp1d(
-        combined_nc["depth_time"].values.tolist(),
-        combined_nc["depth_filtpres"].values,
-        fill_value="extrapolate",
-    )
-    p1 = f_interp(nc["time"].values.tolist())
+    if p1 is None:
+        p1 = pressure_at(combined_nc, nc["time"].values)
+    temp = np.asarray(temp)
     if args.plot:
         pbeg = 0
         pend = len(combined_nc["depth_time"])
@@ -178,19 +172,17 @@ def _calibrated_sal_from_cond_frequency(args, combined_nc, logger, cf, nc, temp)
     # C=0;
     # }
     cfreq = nc["cond_frequency"].values / 1000.0
+    cfreq2 = np.power(cfreq, 2)
 
     if cf.c_coefs == "A":
         calibrated_conductivity = (
-            cf.c_a * np.power(cfreq, cf.c_m)
-            + cf.c_b * np.power(cfreq, 2)
-            + cf.c_c
-            + cf.c_d * temp.values
+            cf.c_a * np.power(cfreq, cf.c_m) + cf.c_b * cfreq2 + cf.c_c + cf.c_d * temp
         ) / (10 * (1 + eps * p1))
     elif cf.c_coefs == "G":
         # C = (C_G +(C_H +(C_I + C_J*f)*f)*f*f) / (10.*(1+C_TCOR*t+C_PCOR*p)) ;
         calibrated_conductivity = (
-            cf.c_g + (cf.c_h + (cf.c_i + cf.c_j * cfreq) * cfreq) * np.power(cfreq, 2)
-        ) / (10 * (1 + cf.c_tcor * temp.values + cf.c_pcor * p1))
+            cf.c_g + (cf.c_h + (cf.c_i + cf.c_j * cfreq) * cfreq) * cfreq2
+        ) / (10 * (1 + cf.c_tcor * temp + cf.c_pcor * p1))
     else:
         raise ValueError(f"Unknown c_coefs: {cf.c_coefs}")
 
@@ -238,7 +230,17 @@ def _oxsat(temperature, salinity):
     return oxsat
 
 
-def _calibrated_O2_from_volts(combined_nc, cf, nc, var_name, temperature, salinity):
+def _calibrated_O2_from_volts(
+    combined_nc,
+    cf,
+    nc,
+    var_name,
+    temperature,
+    salinity,
+    pressure=None,
+    oxsat=None,
+    dens=None,
+):
     # Contents of doradosdp's calc_O2_SBE43.m:
     # ----------------------------------------
     # function [O2] = calc_O2_SBE43(O2V,T,S,P,O2cal,time,units);
@@ -248,12 +250,12 @@ def _calibrated_O2_from_volts(combined_nc, cf, nc, var_name, temperature, salini
     # %%  Also, described in SeaBird application note.
     # pltit = 'n';
     # % disp(['   Pressure should be in dB']);
-    f_interp = interp1d(
-        combined_nc["depth_time"].values.tolist(),
-        combined_nc["depth_filtpres"].values,
-        fill_value="extrapolate",
-    )
-    pressure = f_interp(nc["time"].values.tolist())
+    # The pressure, OXSAT and density may be passed in by CTDKernel which
+    # evaluates them once for all of the oxygen sensors of a CTD
+    if pressure is None:
+        pressure = pressure_at(combined_nc, nc["time"].values)
+    temperature = np.asarray(temperature)
+    salinity = np.asarray(salinity)
 
     #
     # %%----------------------------------
@@ -270,7 +272,8 @@ def _calibrated_O2_from_volts(combined_nc, cf, nc, var_name, temperature, salini
         ),
     )
 
-    oxsat = _oxsat(temperature, salinity)
+    if oxsat is None:
+        oxsat = _oxsat(temperature, salinity)
 
     #
     # %%----------------------------------
@@ -284,9 +287,9 @@ def _calibrated_O2_from_volts(combined_nc, cf, nc, var_name, temperature, salini
     try:
         o2_mll = np.multiply(
             cf.SOc * ((nc[var_name].values + cf.Voff) + (tau * docdt))
-            + cf.BOc * np.exp(-0.03 * temperature.values),
+            + cf.BOc * np.exp(-0.03 * temperature),
             np.multiply(
-                np.exp(cf.TCor * temperature.values + cf.PCor * pressure), oxsat.values
+                np.exp(cf.TCor * temperature + cf.PCor * pressure), np.asarray(oxsat)
             ),
         )
     except AttributeError as e:
@@ -302,7 +305,8 @@ def _calibrated_O2_from_volts(combined_nc, cf, nc, var_name, temperature, salini
     # %%  Convert dissolved O2 to mg/l using density of oxygen = 1.4276 kg/m^3
     # dens=sw_dens(S,T,P);
     # O2 = (O2 * 1.4276) .* (1e6./(dens*32));
-    dens = eos80.dens(salinity.values, temperature.values, pressure)
+    if dens is None:
+        dens = eos80.dens(salinity, temperature, pressure)
     o2_umolkg = np.multiply(o2_mll * 1.4276, (1.0e6 / (dens * 32)))
 
     return o2_mll, o2_umolkg
@@ -357,3 +361,92 @@ def _beam_transmittance_from_volts(combined_nc, nc) -> (float, float):
     c = -1 / 0.25 * np.log(Tr)
 
     return Tr, c
+
+
+class PressureCache:
+    """The filtered pressure of a mission interpolated to the time bases of
+    its CTDs.  Instruments logged on the same time base, e.g. the ctd1 and
+    ctd2 of a Dorado mission, share one interpolation."""
+
+    def __init__(self, combined_nc):
+        self.combined_nc = combined_nc
+        self._pressures: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def __call__(self, times) -> np.ndarray:
+        seconds = as_seconds(times)
+        key = hash(seconds.tobytes())
+        if key in self._pressures and np.array_equal(self._pressures[key][0], seconds):
+            return self._pressures[key][1]
+        pressure = pressure_at(self.combined_nc, seconds)
+        self._pressures[key] = (seconds, pressure)
+        return pressure
+
+
+class CTDKernel:
+    """Calibrated variables of the data `nc` of one CTD with calibration
+    coefficients `cf`.  Each term that variables share, the pressure at the
+    CTD's times, the temperature and salinity, and the oxygen saturation and
+    density of seawater used by every oxygen sensor, is evaluated once on
+    first use."""
+
+    def __init__(self, args, combined_nc, logger, cf, nc, pressures=None):
+        self.args = args
+        self.combined_nc = combined_nc
+        self.logger = logger
+        self.cf = cf
+        self.nc = nc
+        self.pressures = pressures or PressureCache(combined_nc)
+
+    @cached_property
+    def pressure(self) -> np.ndarray:
+        return self.pressures(self.nc["time"].values)
+
+    @cached_property
+    def temperature(self) -> np.ndarray:
+        return np.asarray(_calibrated_temp_from_frequency(self.cf, self.nc))
+
+    @cached_property
+    def _conductivity_salinity(self) -> Tuple[np.ndarray, np.ndarray]:
+        conductivity, salinity = _calibrated_sal_from_cond_frequency(
+            self.args,
+            self.combined_nc,
+            self.logger,
+            self.cf,
+            self.nc,
+            self.temperature,
+            self.pressure,
+        )
+        return np.asarray(conductivity), np.asarray(salinity)
+
+    @property
+    def conductivity(self) -> np.ndarray:
+        return self._conductivity_salinity[0]
+
+    @property
+    def salinity(self) -> np.ndarray:
+        return self._conductivity_salinity[1]
+
+    @cached_property
+    def oxsat(self) -> np.ndarray:
+        return _oxsat(self.temperature, self.salinity)
+
+    @cached_property
+    def dens(self) -> np.ndarray:
+        return eos80.dens(self.salinity, self.temperature, self.pressure)
+
+    def oxygen(self, var_name: str) -> Tuple[np.ndarray, np.ndarray]:
+        "Return the oxygen in ml/l and umol/kg from the volts of `var_name`"
+        return _calibrated_O2_from_volts(
+            self.combined_nc,
+            self.cf,
+            self.nc,
+            var_name,
+            self.temperature,
+            self.salinity,
+            self.pressure,
+            self.oxsat,
+            self.dens,
+        )
+
+    def beam_transmittance(self) -> Tuple[np.ndarray, np.ndarray]:
+        return _beam_transmittance_from_volts(self.combined_nc, self.nc)
@@ -0,0 +1,280 @@
+"""
+Local index of the vehicles, deployments and mission file lists of the
+auv-portal data service.
+
+The index is kept in a JSON file and refreshed when older than its time to
+live.  A refresh requests only the deployments since the previous refresh and
+the file lists of many missions are requested concurrently, so processing a
+range of missions takes a handful of requests instead of several per mission.
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager, suppress
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Set, Tuple
+
+import requests
+from aiohttp import ClientError, ClientSession, ClientTimeout
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+INDEX_FILE = "deployment_index.json"
+INDEX_TTL = 3600  # Seconds before the deployments are refreshed
+FILE_LIST_CONCURRENCY = 8
+# Days of deployments requested again on refresh for those that were updated
+REFRESH_OVERLAP_DAYS = 2
+TIMEOUT = 240
+
+
+class DeploymentIndex:
+    """Cache of the portal's deployments and mission file lists.  File lists
+    of missions more than REFRESH_OVERLAP_DAYS older than when they were
+    fetched are kept indefinitely, others, empty ones and, with a `ttl` of 0,
+    all of them are requested again after `ttl` seconds.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, portal_base: str, path: str, ttl: float = INDEX_TTL) -> None:
+        self.portal_base = portal_base
+        self.deployments_url = os.path.join(portal_base, "deployments")
+        self.path = path
+        self.ttl = ttl
+        # Keys of the file lists requested by this index
+        self._fetched = set()
+        self.index = {
+            "portal": portal_base,
+            "refreshed": 0,
+            "deployments": {},
+            "files": {},
+        }
+        index = self._read()
+        if index is not None:
+            self.index = index
+
+    def _read(self) -> dict:
+        "Return the index saved for this portal, None if there is none"
+        try:
+            with open(self.path) as fh:
+                index = json.load(fh)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError as e:
+            self.logger.warning("Rebuilding unreadable %s: %s", self.path, e)
+            return None
+        return index if index.get("portal") == self.portal_base else None
+
+    @contextmanager
+    def _lock(self):
+        "Hold an exclusive lock on the index between worker processes"
+        if fcntl is None:
+            yield
+            return
+        with open(f"{self.path}.lock", "w") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+    def _merge(self, saved: dict) -> None:
+        """Add to the index the deployments and file lists that other worker
+        processes saved, keeping the most recently fetched of each"""
+        if saved is None:
+            return
+        deployments = dict(saved["deployments"])
+        if saved["refreshed"] > self.index["refreshed"]:
+            deployments = {**self.index["deployments"], **deployments}
+        else:
+            deployments.update(self.index["deployments"])
+        self.index["deployments"] = deployments
+        self.index["refreshed"] = max(self.index["refreshed"], saved["refreshed"])
+        files = self.index["files"]
+        for key, entry in saved["files"].items():
+            if key not in files or entry["fetched"] > files[key]["fetched"]:
+                files[key] = entry
+
+    def _write(self) -> None:
+        "Replace the index file, to be called holding the lock"
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self.path)), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "w") as fh:
+                json.dump(self.index, fh)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            with suppress(FileNotFoundError):
+                os.remove(tmp_path)
+            raise
+
+    def save(self) -> None:
+        """Write the index merged with the one on disk, which other worker
+        processes of the batch may have saved since it was read"""
+        with self._lock():
+            self._merge(self._read())
+            self._write()
+
+    def forget(self, vehicle: str = None) -> None:
+        """Remove the deployments and file lists of `vehicle`, or of all of
+        them, so that they are requested again, e.g. after the portal has been
+        asked to update"""
+        with self._lock():
+            self._merge(self._read())
+            for table in ("deployments", "files"):
+                self.index[table] = {
+                    key: entry
+                    for key, entry in self.index[table].items()
+                    if vehicle and key.split("/")[0].upper() != vehicle.upper()
+                }
+            self.index["refreshed"] = 0
+            self._fetched.clear()
+            self._write()
+
+    def _stale(self, fetched: float) -> bool:
+        return time.time() - fetched > self.ttl
+
+    def refresh(self) -> None:
+        """Add the deployments made since the last refresh to the index, or
+        all of them on the first refresh"""
+        if not self._stale(self.index["refreshed"]):
+            return
+        url = self.deployments_url
+        if self.index["refreshed"]:
+            since = datetime.utcfromtimestamp(self.index["refreshed"]) - timedelta(
+                days=REFRESH_OVERLAP_DAYS
+            )
+            to = datetime.utcnow() + timedelta(days=1)
+            url += f"?from={since:%Y%m%d}T000000Z&to={to:%Y%m%d}T235959Z"
+        self.logger.debug(f"Getting deployments from {url}")
+        refreshed = time.time()
+        with requests.get(url) as resp:
+            if resp.status_code != 200:
+                raise requests.HTTPError(
+                    f"Cannot read {url}, status_code = {resp.status_code}"
+                )
+            for item in resp.json():
+                key = self._key(item["vehicle"], item["name"])
+                self.index["deployments"][key] = item
+        self.index["refreshed"] = refreshed
+        self.save()
+
+    @staticmethod
+    def _key(vehicle: str, name: str) -> str:
+        return f"{vehicle}/{name}"
+
+    def vehicles(self) -> Set[str]:
+        self.refresh()
+        return {item["vehicle"] for item in self.index["deployments"].values()}
+
+    def deployments_between(self, start: str, end: str) -> List[dict]:
+        """Return the deployments whose mission name, e.g. 2020.245.00, falls
+        between the `start` and `end` dates given in YYYYMMDD format"""
+        self.refresh()
+        start_date = datetime.strptime(start, "%Y%m%d")
+        end_date = datetime.strptime(end, "%Y%m%d")
+        items = []
+        for item in self.index["deployments"].values():
+            try:
+                mission_date = datetime.strptime(item["name"][:8], "%Y.%j")
+            except ValueError:
+                self.logger.debug(f"Cannot get date from mission {item['name']}")
+                continue
+            if start_date <= mission_date <= end_date:
+                items.append(item)
+        return sorted(items, key=lambda item: (item["name"], item["vehicle"]))
+
+    def _files_current(self, vehicle: str, name: str) -> bool:
+        key = self._key(vehicle, name)
+        entry = self.index["files"].get(key)
+        if not entry:
+            return False
+        if key in self._fetched or not self._stale(entry["fetched"]):
+            return True
+        if not entry["names"] or not self.ttl:
+            return False
+        # Files are no longer added to the portal for older missions
+        try:
+            mission_date = datetime.strptime(name[:8], "%Y.%j")
+        except ValueError:
+            return False
+        return mission_date < datetime.utcfromtimestamp(entry["fetched"]) - timedelta(
+            days=REFRESH_OVERLAP_DAYS
+        )
+
+    async def _get_file_list(
+        self, session: ClientSession, semaphore, vehicle: str, name: str
+    ) -> Tuple[str, str, List[str]]:
+        files_url = f"{self.portal_base}/files/list/{name}/{vehicle}"
+        async with semaphore:
+            self.logger.debug(f"Getting files list from {files_url}")
+            try:
+                async with session.get(files_url) as resp:
+                    if resp.status != 200:
+                        self.logger.error(
+                            f"Cannot read {files_url}, status = {resp.status}"
+                        )
+                        return vehicle, name, None
+                    return vehicle, name, (await resp.json())["names"]
+            except (ClientError, asyncio.TimeoutError) as e:
+                self.logger.error(f"{files_url}: {e!r}")
+                return vehicle, name, None
+
+    async def _get_file_lists(
+        self, missions: Iterable[Tuple[str, str]], concurrency: int
+    ) -> list:
+        semaphore = asyncio.Semaphore(concurrency)
+        timeout = ClientTimeout(total=None, sock_connect=TIMEOUT, sock_read=TIMEOUT)
+        async with ClientSession(timeout=timeout) as session:
+            return await asyncio.gather(
+                *(
+                    self._get_file_list(session, semaphore, vehicle, name)
+                    for vehicle, name in missions
+                )
+            )
+
+    def prefetch_files(
+        self,
+        missions: Iterable[Tuple[str, str]],
+        concurrency: int = FILE_LIST_CONCURRENCY,
+    ) -> None:
+        "Request the file lists of the (vehicle, name) `missions` not current"
+        missing = [
+            (vehicle, name)
+            for vehicle, name in missions
+            if not self._files_current(vehicle, name)
+        ]
+        if not missing:
+            return
+        self.logger.info(f"Getting the file lists of {len(missing)} missions")
+        results = asyncio.run(self._get_file_lists(missing, concurrency))
+        for vehicle, name, names in results:
+            if names is not None:
+                key = self._key(vehicle, name)
+                self.index["files"][key] = {"fetched": time.time(), "names": names}
+                self._fetched.add(key)
+        self.save()
+
+    def files(self, vehicle: str, name: str) -> List[str]:
+        "Return the names of the files of mission `name` of `vehicle`"
+        self.prefetch_files([(vehicle, name)])
+        entry = self.index["files"].get(self._key(vehicle, name))
+        if entry is None:
+            raise LookupError(f"Cannot get the files of {vehicle} {name}")
+        if not entry["names"]:
+            raise LookupError(f"No files listed for {vehicle} {name}")
+        return entry["names"]
+
+    def file_lists(self) -> Dict[str, List[str]]:
+        return {key: entry["names"] for key, entry in self.index["files"].items()}
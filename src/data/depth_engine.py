@@ -0,0 +1,93 @@
+"""
+Zero-phase filtering of the vehicle's depth and pressure and interpolation
+of them, or of any variable, to the times of other sensors.
+
+The Butterworth filter is designed once per order, cutoff and sample rate in
+second-order sections, which unlike the transfer function form stay stable
+at high orders, and is run forwards and backwards over pressure and depth
+stacked into one array.  The interpolation matches scipy's interp1d() with
+fill_value="extrapolate" without building an interpolator for each call.
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+from functools import lru_cache
+
+import numpy as np
+from scipy import signal
+
+BUTTER_ORDER = 8
+BOXCAR_POINTS = 10  # As in processDepth.m
+
+
+@lru_cache(maxsize=None)
+def butter_sos(
+    cutoff_freq: float, sample_rate: float, order: int = BUTTER_ORDER
+) -> np.ndarray:
+    "Return the second-order sections of a low pass Butterworth filter"
+    # The Wn parameter for butter() is fraction of the Nyquist frequency
+    return signal.butter(order, cutoff_freq / (sample_rate / 2.0), output="sos")
+
+
+def zero_phase_filter(
+    values: np.ndarray,
+    sample_rate: float,
+    cutoff_freq: float,
+    order: int = BUTTER_ORDER,
+) -> np.ndarray:
+    """Return `values` low pass filtered forwards and backwards along their
+    last axis, so that each row of a 2-d array is filtered in the same pass.
+    Raises ValueError if there are too few values to filter."""
+    sos = butter_sos(cutoff_freq, sample_rate, order)
+    return signal.sosfiltfilt(sos, np.asarray(values, dtype=np.float64), axis=-1)
+
+
+def boxcar_filter(values: np.ndarray, points: int = BOXCAR_POINTS) -> np.ndarray:
+    "Return `values` filtered forwards and backwards with a boxcar window"
+    return signal.filtfilt(signal.boxcar(points), points, values)
+
+
+def as_seconds(times) -> np.ndarray:
+    """Return `times`, datetime64 or numbers, as float64 for interpolation.
+    Datetimes become nanoseconds, as they are from values.tolist()."""
+    times = np.asarray(times)
+    if np.issubdtype(times.dtype, np.datetime64):
+        return times.astype("datetime64[ns]").astype(np.int64).astype(np.float64)
+    return times.astype(np.float64)
+
+
+def interp_extrapolate(x, xp, fp) -> np.ndarray:
+    """Return `fp` at `xp` linearly interpolated to `x`, and extrapolated
+    from the first and last two points outside of `xp`, like interp1d() with
+    fill_value="extrapolate".  The x values may be datetime64."""
+    x = as_seconds(x)
+    xp = as_seconds(xp)
+    fp = np.asarray(fp, dtype=np.float64)
+    if np.any(np.diff(xp) < 0):
+        order = np.argsort(xp, kind="stable")
+        xp, fp = xp[order], fp[order]
+    values = np.interp(x, xp, fp)
+    if xp.size > 1:
+        before = x < xp[0]
+        values[before] = fp[0] + (x[before] - xp[0]) * (fp[1] - fp[0]) / (
+            xp[1] - xp[0]
+        )
+        after = x > xp[-1]
+        values[after] = fp[-1] + (x[after] - xp[-1]) * (fp[-1] - fp[-2]) / (
+            xp[-1] - xp[-2]
+        )
+    return values
+
+
+def depth_at(combined_nc, times, variable: str = "depth_filtdepth") -> np.ndarray:
+    """Return the filtered depth, or another `variable` on depth_time such as
+    depth_filtpres, of `combined_nc` at `times`"""
+    return interp_extrapolate(
+        times, combined_nc["depth_time"].values, combined_nc[variable].values
+    )
+
+
+def pressure_at(combined_nc, times) -> np.ndarray:
+    "Return the filtered pressure of `combined_nc` at `times`"
+    return depth_at(combined_nc, times, "depth_filtpres")
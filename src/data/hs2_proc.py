@@ -1,8 +1,12 @@
 import numpy as np
 from collections import defaultdict
+from functools import lru_cache
 from math import pi, exp
 from scipy.interpolate import interp1d
 
+# Gain/status values are 4 bits, of which gains 1 to 5 select a coefficient
+GAIN_CODES = 16
+
 
 class SensorInfo:
     pass
@@ -68,29 +72,29 @@ def _get_gains(orig_nc, cals, hs2):
     # channel may be set to 1 if the HydroScat detects a condition that may
     # affect the quality of the data on that channel. However a status value
     # of 1 does not necessarily indicate invalid data.
+    # The values are looked up in a table indexed by gain code, in which
+    # codes other than 1 to 5 map to themselves as they did with np.where().
     for chan, gs in ((1, "Gain_Status_1"), (2, "Gain_Status_2"), (3, "Gain_Status_3")):
-        gv = orig_nc[gs]
+        # Channel 3 uses the gains of channel 2
+        cal_chan = min(chan, 2)
+        table = np.arange(GAIN_CODES, dtype=np.float64)
         for gnum in range(1, 6):
-            if chan <= 2:
-                gc = float(cals[f"Ch{chan}"][f"Gain{gnum}"])
-            elif chan == 3:
-                gc = float(cals[f"Ch{chan - 1}"][f"Gain{gnum}"])
-
-            gv = np.where(orig_nc[gs] == gnum, gc, gv)
-            setattr(hs2, f"Gain{chan}", gv)
+            table[gnum] = float(cals[f"Ch{cal_chan}"][f"Gain{gnum}"])
+        codes = np.asarray(orig_nc[gs])
+        in_table = (codes >= 0) & (codes < GAIN_CODES)
+        gv = np.where(
+            in_table, table[np.where(in_table, codes, 0).astype(np.intp)], codes
+        )
+        setattr(hs2, f"Gain{chan}", gv)
 
     return hs2
 
 
 def _int_signer(ints_in):
     # -% signed_int = int_in - 65536*(int_in > 32767);
-    signed_ints = []
-    for int_in in ints_in.values:
-        if int_in > 32767:
-            signed_ints.append(int_in - 65536)
-        else:
-            signed_ints.append(int_in)
-    return np.array(signed_ints)
+    # As floats so that missing values stay NaN
+    ints = np.asarray(ints_in, dtype=np.float64)
+    return np.where(ints > 32767, ints - 65536, ints)
 
 
 def hs2_calc_bb(orig_nc, cals):
@@ -142,8 +146,8 @@ def hs2_calc_bb(orig_nc, cals):
         chi = 1.08
         b_b_uncorr = ((2 * pi * chi) * (beta_uncorr - beta_w)) + b_bw
 
-        globals()[f"bb{wavelength}_uncorr"] = b_b_uncorr
-        globals()[f"bbp{wavelength}_uncorr"] = b_b_uncorr - b_bw
+        setattr(hs2, f"bb{wavelength}_uncorr", b_b_uncorr)
+        setattr(hs2, f"bbp{wavelength}_uncorr", b_b_uncorr - b_bw)
 
         # ESTIMATION OF KBB AND SIGMA FUNCTION
         a = typ_absorption(wavelength)
@@ -197,52 +201,54 @@ def purewater_scatter(lamda):
     return beta_w, b_bw
 
 
+# -% Embed the lookup table from the AStar.CSV file here
+# -%%a_star    =   load('AStar.csv');
+A_STAR_VALUES = np.array(
+    [
+        [400, 0.687],
+        [410, 0.828],
+        [420, 0.913],
+        [430, 0.973],
+        [440, 1.000],
+        [450, 0.944],
+        [460, 0.917],
+        [470, 0.870],
+        [480, 0.798],
+        [490, 0.750],
+        [500, 0.668],
+        [510, 0.618],
+        [520, 0.528],
+        [530, 0.474],
+        [540, 0.416],
+        [550, 0.357],
+        [560, 0.294],
+        [570, 0.276],
+        [580, 0.291],
+        [590, 0.282],
+        [600, 0.236],
+        [610, 0.252],
+        [620, 0.276],
+        [630, 0.317],
+        [640, 0.334],
+        [650, 0.356],
+        [660, 0.441],
+        [670, 0.595],
+        [680, 0.502],
+        [690, 0.329],
+        [700, 0.215],
+    ]
+)
+A_STAR_INTERP = interp1d(A_STAR_VALUES[:, 0], A_STAR_VALUES[:, 1])
+
+
+@lru_cache(maxsize=None)
 def typ_absorption(lamda):
     C = 0.1
     gamma_y = 0.014
     a_d_400 = 0.01
     gamma_d = 0.011
 
-    # -% Embed the lookup table from the AStar.CSV file here
-    # -%%a_star    =   load('AStar.csv');
-    a_star_values = np.array(
-        [
-            [400, 0.687],
-            [410, 0.828],
-            [420, 0.913],
-            [430, 0.973],
-            [440, 1.000],
-            [450, 0.944],
-            [460, 0.917],
-            [470, 0.870],
-            [480, 0.798],
-            [490, 0.750],
-            [500, 0.668],
-            [510, 0.618],
-            [520, 0.528],
-            [530, 0.474],
-            [540, 0.416],
-            [550, 0.357],
-            [560, 0.294],
-            [570, 0.276],
-            [580, 0.291],
-            [590, 0.282],
-            [600, 0.236],
-            [610, 0.252],
-            [620, 0.276],
-            [630, 0.317],
-            [640, 0.334],
-            [650, 0.356],
-            [660, 0.441],
-            [670, 0.595],
-            [680, 0.502],
-            [690, 0.329],
-            [700, 0.215],
-        ]
-    )
-
-    a_interp = interp1d(a_star_values[:, 0], a_star_values[:, 1])
-    a_star = a_interp(lamda)
+    a_star = A_STAR_INTERP(lamda)
 
     a = (0.06 * a_star * (C**0.65)) * (1 + 0.2 * exp(-gamma_y * (lamda - 440))) + (
         a_d_400 * exp(-gamma_d * (lamda - 400))
@@ -0,0 +1,248 @@
+"""
+Estimate the plumbing lags of the pumped sensors from the calibrated data.
+
+Water reaches a sensor at the end of a pumped plumbing run some seconds after
+an unpumped sensor, or one earlier in the same plumbing, measures it.  Within
+each profile of the vehicle the vertical gradients that the variable of a
+pumped sensor sees, e.g. the thermocline or the chlorophyll maximum, are
+cross-correlated with those of a reference variable using xcorr.py.  The
+median of the lags of the profiles that correlate well is the estimate of
+the sensor's lag_secs, with a bootstrap confidence interval.  The estimates
+are written to the metadata of the _cal.nc file and can be applied in place
+of the lag_secs constants of Calibrate_NetCDF._define_sensor_info().
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+import logging
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import xarray as xr
+from nc_encoding import seconds_per_record
+from xcorr import estimate_offset
+
+# Pumped sensor: (variable, reference variable, sign of their correlation).
+# The conductivity cells are downstream of the temperature sensors, the
+# others are referenced to the unpumped Hydroscat or to the first CTD.
+LAG_PAIRS = {
+    "ctd1": ("ctd1_conductivity", "ctd1_temperature", 1),
+    "ctd2": ("ctd2_conductivity", "ctd2_temperature", 1),
+    "seabird25p": ("seabird25p_conductivity", "seabird25p_temperature", 1),
+    "ecopuck": ("ecopuck_chl", "hs2_fl700", 1),
+    "biolume": ("biolume_avg_biolume", "hs2_fl700", 1),
+    "isus": ("isus_nitrate", "ctd1_temperature", -1),
+}
+DEPTH_VARIABLE = "navigation_depth"
+# Seconds between the points cross-correlated, by default the longer of the
+# sample intervals as the correlation of finer grids has a flat peak
+LAG_DT = None
+MAX_LAG_SECS = 20.0
+MIN_PROFILE_SPAN = 10.0  # Meters of depth covered by a profile
+MIN_PROFILE_SAMPLES = 20
+PROFILE_SMOOTHING = 11  # Seconds of depth averaged to find the turns
+MIN_PROFILE_CORRELATION = 0.5
+MIN_PROFILES = 3  # Needed for an estimate to be applied
+CONFIDENCE_LEVEL = 0.95
+N_BOOTSTRAP = 1000
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LagEstimate:
+    """Plumbing lag of `sensor` estimated from `variable` and `reference`
+
+    lag_secs: Median of the lags of the profiles, as in _define_sensor_info()
+    ci: Bootstrap confidence interval of lag_secs at CONFIDENCE_LEVEL
+    n_profiles: Number of profiles used out of `n_total`
+    applied_secs: Lag that had already been applied to the data
+    """
+
+    sensor: str
+    variable: str
+    reference: str
+    lag_secs: float
+    ci: Tuple[float, float]
+    n_profiles: int
+    n_total: int
+    applied_secs: float = 0.0
+
+    @property
+    def within_sensor(self) -> bool:
+        """True if the reference is of the same sensor, e.g. the lag of its
+        conductivity cell behind its temperature sensor, which cannot be
+        applied by shifting the sensor's times"""
+        return self.reference.startswith(f"{self.sensor}_")
+
+    def metadata(self) -> Dict:
+        "Return the global attributes of the _cal.nc file for this estimate"
+        prefix = f"{self.sensor}_lag_secs"
+        return {
+            f"{prefix}_estimate": round(self.lag_secs, 3),
+            f"{prefix}_ci{CONFIDENCE_LEVEL * 100:.0f}": np.round(self.ci, 3),
+            f"{prefix}_profiles": f"{self.n_profiles} of {self.n_total}",
+            f"{prefix}_method": (
+                f"Median lag of the cross-correlated gradients of {self.variable}"
+                f" with {self.reference} in each profile, {self.applied_secs}"
+                f" seconds already applied"
+            ),
+        }
+
+    def __str__(self) -> str:
+        return (
+            f"{self.sensor} lag_secs = {self.lag_secs:.2f} "
+            f"({self.ci[0]:.2f} to {self.ci[1]:.2f}) from {self.n_profiles}"
+            f" of {self.n_total} profiles of {self.variable} and {self.reference}"
+        )
+
+
+def _seconds(times: np.ndarray) -> np.ndarray:
+    "Return datetime64 `times` as seconds since the epoch"
+    return times.astype("datetime64[ns]").astype(np.int64) / 1.0e9
+
+
+def _variable(ds: xr.Dataset, name: str) -> Tuple[np.ndarray, np.ndarray]:
+    "Return the times in seconds and the values of variable `name` of `ds`"
+    var = ds[name]
+    times = _seconds(var[var.dims[0]].values)
+    values = var.values.astype(np.float64)
+    good = np.isfinite(values)
+    return times[good], values[good]
+
+
+def profile_bounds(
+    times: np.ndarray, depths: np.ndarray, min_span: float = MIN_PROFILE_SPAN
+) -> List[Tuple[float, float]]:
+    """Return the start and end times of the descents and ascents in
+    `depths` that cover at least `min_span` meters"""
+    if times.size < 2:
+        return []
+    grid = np.arange(times[0], times[-1], 1.0)
+    depth = np.convolve(
+        np.interp(grid, times, depths),
+        np.ones(PROFILE_SMOOTHING) / PROFILE_SMOOTHING,
+        mode="same",
+    )
+    direction = np.sign(np.diff(depth))
+    turns = np.flatnonzero(direction[1:] != direction[:-1]) + 1
+    edges = np.concatenate(([0], turns, [direction.size]))
+    return [
+        (grid[start], grid[stop])
+        for start, stop in zip(edges[:-1], edges[1:])
+        if direction[start] and abs(depth[stop] - depth[start]) >= min_span
+    ]
+
+
+def profile_lag(
+    ref_times: np.ndarray,
+    ref_values: np.ndarray,
+    times: np.ndarray,
+    values: np.ndarray,
+    start: float,
+    end: float,
+    dt: float = 1.0,
+    max_lag: float = MAX_LAG_SECS,
+) -> Optional[Tuple[float, float]]:
+    """Return the lag of `values` behind `ref_values` between `start` and
+    `end` and the correlation coefficient of their gradients at that lag"""
+    in_ref = (ref_times >= start) & (ref_times <= end)
+    in_profile = (times >= start) & (times <= end)
+    if min(in_ref.sum(), in_profile.sum()) < MIN_PROFILE_SAMPLES:
+        return None
+    grid = np.arange(start, end, dt)
+    ref_gradient = np.diff(np.interp(grid, ref_times[in_ref], ref_values[in_ref]))
+    gradient = np.diff(np.interp(grid, times[in_profile], values[in_profile]))
+    try:
+        offset, correlation, _ = estimate_offset(
+            grid[1:], ref_gradient, grid[1:], gradient, dt, max_offset=max_lag
+        )
+    except ValueError:
+        return None
+    # Values measured at time t were of the water at the reference at t - lag
+    return -offset, correlation
+
+
+def bootstrap_ci(
+    lags: np.ndarray, level: float = CONFIDENCE_LEVEL, n: int = N_BOOTSTRAP
+) -> Tuple[float, float]:
+    "Return the bootstrap confidence interval of the median of `lags`"
+    rng = np.random.default_rng(0)
+    medians = np.median(rng.choice(lags, (n, lags.size)), axis=1)
+    tail = (1 - level) / 2 * 100
+    low, high = np.percentile(medians, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+def estimate_lag(
+    ds: xr.Dataset,
+    sensor: str,
+    applied_secs: float = 0.0,
+    dt: float = LAG_DT,
+    max_lag: float = MAX_LAG_SECS,
+) -> Optional[LagEstimate]:
+    """Return the plumbing lag of `sensor` estimated from the calibrated data
+    in `ds`, to which `applied_secs` of lag have already been applied, or
+    None if it cannot be estimated"""
+    variable, reference, sign = LAG_PAIRS[sensor]
+    if not all(name in ds for name in (variable, reference, DEPTH_VARIABLE)):
+        logger.debug(f"No {variable}, {reference} or {DEPTH_VARIABLE} for {sensor}")
+        return None
+    ref_times, ref_values = _variable(ds, reference)
+    times, values = _variable(ds, variable)
+    intervals = (seconds_per_record(ref_times), seconds_per_record(times))
+    dt = dt or max((i for i in intervals if i), default=1.0)
+    profiles = profile_bounds(*_variable(ds, DEPTH_VARIABLE))
+    lags = []
+    for start, end in profiles:
+        result = profile_lag(
+            ref_times, ref_values, times, sign * values, start, end, dt, max_lag
+        )
+        if result and result[1] >= MIN_PROFILE_CORRELATION:
+            lags.append(result[0])
+    logger.debug(f"{sensor}: {len(lags)} of {len(profiles)} profiles correlated")
+    if not lags:
+        return None
+    lags = np.array(lags) + applied_secs
+    return LagEstimate(
+        sensor,
+        variable,
+        reference,
+        float(np.median(lags)),
+        bootstrap_ci(lags),
+        lags.size,
+        len(profiles),
+        applied_secs,
+    )
+
+
+def apply_lag(ds: xr.Dataset, estimate: LagEstimate) -> xr.Dataset:
+    """Return `ds` with the time coordinates of the estimate's sensor shifted
+    so that its total lag is the estimated lag_secs"""
+    shift = np.timedelta64(
+        int(round((estimate.lag_secs - estimate.applied_secs) * 1000)), "ms"
+    )
+    time_name = f"{estimate.sensor}_time"
+    coords = {
+        name: (name, ds[name].values - shift, ds[name].attrs)
+        for name in ds.coords
+        if name.startswith(time_name)
+    }
+    ds = ds.assign_coords(coords)
+    lag_info = (
+        f"with plumbing lag correction of {estimate.lag_secs:.2f} seconds"
+        f" estimated from the data"
+    )
+    for var in ds.data_vars.values():
+        if not var.dims or not var.dims[0].startswith(time_name):
+            continue
+        comment = re.sub(
+            r"with plumbing lag correction of .*? seconds",
+            "",
+            var.attrs.get("comment", ""),
+        )
+        var.attrs["comment"] = f"{comment.rstrip()} {lag_info}".strip()
+    return ds
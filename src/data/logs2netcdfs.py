@@ -11,20 +11,31 @@ __copyright__ = "Copyright 2020, Monterey Bay Aquarium Research Institute"
 
 import argparse
 import asyncio
-import concurrent
+import json
 import logging
 import os
 import struct
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
 from pathlib import Path
 from typing import List
 
 import numpy as np
 import requests
-from aiohttp import ClientSession
-from aiohttp.client_exceptions import ClientConnectorError
+from aiohttp import ClientError, ClientSession, ClientTimeout
 from AUV import AUV, monotonic_increasing_time_indices
+from deployment_index import INDEX_FILE, INDEX_TTL, DeploymentIndex
+from mirror import mirror
+from nc_encoding import (
+    ENCODING,
+    ENCODINGS,
+    log_written,
+    netcdf4_kwargs,
+    seconds_per_record,
+)
 from netCDF4 import Dataset
 from readauvlog import log_record
 
@@ -51,7 +62,22 @@ PORTAL_BASE = "http://portal.shore.mbari.org:8080/auvdata/v1"
 TIME = "time"
 TIME60HZ = "time60hz"
 TIMEOUT = 240
+DOWNLOAD_CONCURRENCY = 4  # Files downloaded from the portal at the same time
+CHUNK_SIZE = 1024 * 1024
+RETRIES = 5
+BACKOFF = 2.0  # Seconds before the first retry, doubled for each one after
+PART_SUFFIX = ".part"
+# Sidecar of a .part file with the validators of the download it was started
+# from so that it is only resumed if the file on the portal is the same
+PART_VALIDATORS = ".part.json"
+# Sidecar in each missionlogs directory recording the HTTP validators of the
+# files downloaded from the portal so that unchanged files are not refetched
+PORTAL_FILES = "portal_files.json"
 SUMMARY_SOURCE = "Original log files copied from {}"
+# The HDF5 library is not thread safe: held while writing netCDF files so that
+# missions converted in threads of one process, as with process.py --dag, do
+# not write at the same time
+HDF5_LOCK = threading.Lock()
 
 
 class AUV_NetCDF(AUV):
@@ -305,129 +331,293 @@ class AUV_NetCDF(AUV):
             f"bytes read = {byte_offset + len_sum}" f" file size = {file_size}"
         )
 
-    def _unique_vehicle_names(self):
-        self.logger.debug(f"Getting deployments from {self.deployments_url}")
-        with requests.get(self.deployments_url) as resp:
-            if resp.status_code != 200:
-                self.logger.error(
-                    f"Cannot read {self.deployments_url},"
-                    f" status_code = {resp.status_code}"
-                )
-                return
+    def deployment_index(self) -> DeploymentIndex:
+        "Return the index of the portal's deployments, kept in base_path"
+        if getattr(self, "_deployment_index", None) is None:
+            Path(self.args.base_path).mkdir(parents=True, exist_ok=True)
+            self._deployment_index = DeploymentIndex(
+                self.portal_base,
+                os.path.join(self.args.base_path, INDEX_FILE),
+                getattr(self.args, "index_ttl", INDEX_TTL),
+            )
+        return self._deployment_index
 
-            return set([d["vehicle"] for d in resp.json()])
+    def _unique_vehicle_names(self):
+        try:
+            return self.deployment_index().vehicles()
+        except (requests.RequestException, ValueError) as e:
+            self.logger.error(f"{e}")
+            return
 
     def _deployments_between(self):
-        start = f"{self.args.start}T000000Z"
-        end = f"{self.args.end}T235959Z"
-        url = f"{self.deployments_url}?from={start}&to={end}"
-        self.logger.debug(f"Getting missions from {url}")
-        with requests.get(url) as resp:
-            if resp.status_code != 200:
-                raise Exception(f"Cannot read {url}, status_code = {resp.status_code}")
-            if not resp.json():
-                raise LookupError(f"No missions from {url}")
-            for item in resp.json():
-                if self.args.preview:
-                    self.logger.setLevel(self._log_levels[max(1, self.args.verbose)])
-                    self.logger.info(f"{item['vehicle']} {item['name']}")
-                else:
-                    if self.args.auv_name:
-                        if item["vehicle"].upper() != self.args.auv_name.upper():
-                            self.logger.debug(
-                                f"{item['vehicle']} != {self.args.auv_name}"
-                            )
-                            continue
-                    try:
-                        self.download_process_logs(item["vehicle"], item["name"])
-                    except asyncio.exceptions.TimeoutError:
-                        self.logger.warning(
-                            f"TimeoutError for self.download_process_logs("
-                            f"'{item['vehicle']}'', '{item['name']}')"
-                        )
-                        self.logger.info("Sleeping for 60 seconds...")
-                        time.sleep(60)
-                        self.logger.info(
-                            f"Trying to download_process_logs("
-                            f"'{item['vehicle']}'', '{item['name']}') again..."
-                        )
-                        self.download_process_logs(item["vehicle"], item["name"])
+        items = self.deployment_index().deployments_between(
+            self.args.start, self.args.end
+        )
+        if not items:
+            raise LookupError(
+                f"No missions between {self.args.start} and {self.args.end}"
+            )
+        if self.args.auv_name:
+            vehicle_items = []
+            for item in items:
+                if item["vehicle"].upper() != self.args.auv_name.upper():
+                    self.logger.debug(f"{item['vehicle']} != {self.args.auv_name}")
+                    continue
+                vehicle_items.append(item)
+            items = vehicle_items
+        if self.args.preview:
+            self.logger.setLevel(self._log_levels[max(1, self.args.verbose)])
+            for item in items:
+                self.logger.info(f"{item['vehicle']} {item['name']}")
+            return
+        # Get the file lists of all the missions at once
+        self.deployment_index().prefetch_files(
+            [(item["vehicle"], item["name"]) for item in items]
+        )
+        for item in items:
+            try:
+                self.download_process_logs(item["vehicle"], item["name"])
+            except asyncio.exceptions.TimeoutError:
+                self.logger.warning(
+                    f"TimeoutError for self.download_process_logs("
+                    f"'{item['vehicle']}'', '{item['name']}')"
+                )
+                self.logger.info("Sleeping for 60 seconds...")
+                time.sleep(60)
+                self.logger.info(
+                    f"Trying to download_process_logs("
+                    f"'{item['vehicle']}'', '{item['name']}') again..."
+                )
+                self.download_process_logs(item["vehicle"], item["name"])
 
     def _files_from_mission(self, name=None, vehicle=None):
         name = name or self.args.mission
         vehicle = vehicle or self.args.auv_name
-        files_url = f"{self.portal_base}/files/list/{name}/{vehicle}"
-        self.logger.debug(f"Getting files list from {files_url}")
-        with requests.get(files_url) as resp:
-            if resp.status_code != 200:
-                self.logger.error(
-                    f"Cannot read {files_url}, status_code = {resp.status_code}"
-                )
-                return
-            if names := resp.json()["names"]:
-                return names
-            else:
-                raise LookupError(f"Nothing in names from {files_url}")
-
-    async def _get_file(self, download_url, local_filename, session):
-        try:
-            async with session.get(download_url, timeout=TIMEOUT) as resp:
-                if resp.status != 200:
-                    self.logger.warning(
-                        f"Cannot read {download_url}, status = {resp.status}"
+        return self.deployment_index().files(vehicle, name)
+
+    async def _get_file(
+        self, download_url, local_filename, session, semaphore, portal_files=None
+    ) -> bool:
+        """Download `download_url` to `local_filename`.  The data are written
+        to a .part file that is renamed once complete.  Failed downloads are
+        retried with exponential backoff, resuming from the end of the .part
+        file with a Range request.  A .part file left by an earlier run is
+        also resumed.  The Range request is made with an If-Range of the ETag
+        or Last-Modified of the download that the .part file was started from,
+        so that a file changed on the portal is downloaded again in full.  If
+        `portal_files` has the ETag or Last-Modified of the local file a
+        conditional request is made and the file is left alone if the portal
+        responds that it is unchanged.  The validators of a downloaded file
+        are recorded in `portal_files`.  Returns True if the file was
+        downloaded.
+        """
+        part_filename = local_filename + PART_SUFFIX
+        validators_filename = local_filename + PART_VALIDATORS
+        file_name = os.path.basename(local_filename)
+        if portal_files is None:
+            portal_files = {}
+        conditional = {}
+        previous = portal_files.get(file_name, {})
+        if (
+            os.path.exists(local_filename)
+            and os.path.getsize(local_filename) == previous.get("size")
+        ):
+            if previous.get("etag"):
+                conditional["If-None-Match"] = previous["etag"]
+            if previous.get("last_modified"):
+                conditional["If-Modified-Since"] = previous["last_modified"]
+        async with semaphore:
+            for attempt in range(RETRIES + 1):
+                if attempt:
+                    delay = BACKOFF * 2 ** (attempt - 1)
+                    self.logger.info(
+                        f"Retrying {download_url} in {delay:.0f} seconds"
+                        f" ({attempt} of {RETRIES})"
                     )
-                else:
-                    self.logger.info(f"Started download to {local_filename}...")
-                    with open(local_filename, "wb") as handle:
-                        async for chunk in resp.content.iter_chunked(1024):
-                            handle.write(chunk)
-                        if self.args.verbose > 1:
-                            print(
-                                f"{os.path.basename(local_filename)}(done) ",
-                                end="",
-                                flush=True,
+                    await asyncio.sleep(delay)
+                offset = 0
+                headers = conditional
+                if_range = self._read_part_validator(validators_filename)
+                if os.path.exists(part_filename) and if_range:
+                    offset = os.path.getsize(part_filename)
+                if offset:
+                    headers = {"Range": f"bytes={offset}-", "If-Range": if_range}
+                try:
+                    async with session.get(download_url, headers=headers) as resp:
+                        if resp.status == 304:
+                            self.logger.info(f"{local_filename} is unchanged")
+                            return False
+                        if resp.status == 416:
+                            # The .part file does not match the file on the portal
+                            self.logger.warning(
+                                f"Cannot resume {part_filename}, starting over"
+                            )
+                            os.remove(part_filename)
+                            continue
+                        if resp.status >= 500:
+                            self.logger.warning(
+                                f"Cannot read {download_url}, status = {resp.status}"
+                            )
+                            continue
+                        if resp.status not in (200, 206):
+                            self.logger.warning(
+                                f"Cannot read {download_url}, status = {resp.status}"
+                            )
+                            portal_files.pop(file_name, None)
+                            return True
+                        content_range = resp.headers.get("Content-Range", "")
+                        if resp.status == 206 and not content_range.startswith(
+                            f"bytes {offset}-"
+                        ):
+                            self.logger.warning(
+                                f"Cannot resume {part_filename} from {content_range},"
+                                " starting over"
+                            )
+                            os.remove(part_filename)
+                            continue
+                        validators = {
+                            "etag": resp.headers.get("ETag"),
+                            "last_modified": resp.headers.get("Last-Modified"),
+                        }
+                        if resp.status == 206:
+                            self.logger.info(
+                                f"Resuming download to {local_filename}"
+                                f" from byte {offset}..."
                             )
+                            mode = "ab"
+                        else:
+                            self.logger.info(f"Started download to {local_filename}...")
+                            mode = "wb"
+                            with open(validators_filename, "w") as fh:
+                                json.dump(validators, fh)
+                        with open(part_filename, mode) as handle:
+                            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                                handle.write(chunk)
+                    os.replace(part_filename, local_filename)
+                    with suppress(FileNotFoundError):
+                        os.remove(validators_filename)
+                    portal_files[file_name] = dict(
+                        size=os.path.getsize(local_filename), **validators
+                    )
+                    if self.args.verbose > 1:
+                        print(
+                            f"{os.path.basename(local_filename)}(done) ",
+                            end="",
+                            flush=True,
+                        )
+                    return True
+                except (ClientError, asyncio.TimeoutError) as e:
+                    self.logger.warning(f"{download_url}: {e!r}")
+            self.logger.error(
+                f"Failed to download {download_url} after {RETRIES} retries,"
+                f" rerun to resume from {part_filename}"
+            )
+            # Whatever is in the local file is not known to be current
+            portal_files.pop(file_name, None)
+            return True
 
-        except (ClientConnectorError, concurrent.futures._base.TimeoutError) as e:
-            self.logger.error(f"{e}")
+    def _read_part_validator(self, validators_filename) -> str:
+        """Return the ETag, or else the Last-Modified, of the download that a
+        .part file was started from, None if it is not known"""
+        try:
+            with open(validators_filename) as fh:
+                validators = json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return validators.get("etag") or validators.get("last_modified")
 
-    async def _download_files(self, logs_dir, name=None, vehicle=None):
+    def _read_portal_files(self, logs_dir) -> dict:
+        try:
+            with open(os.path.join(logs_dir, PORTAL_FILES)) as fh:
+                return json.load(fh)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_portal_files(self, logs_dir, portal_files) -> None:
+        file_name = os.path.join(logs_dir, PORTAL_FILES)
+        with open(file_name + PART_SUFFIX, "w") as fh:
+            json.dump(portal_files, fh, indent=1, sort_keys=True)
+        os.replace(file_name + PART_SUFFIX, file_name)
+
+    async def _download_files(
+        self, logs_dir, files, name=None, vehicle=None, convert=None
+    ) -> set:
+        """Download the `files` of a mission and return the names of those
+        changed.  If provided, `convert` is called with the name of each of
+        the LOG_FILES and whether it changed as soon as it is downloaded.  The
+        calls are made one at a time in a separate thread, as the HDF5 library
+        is not thread safe, so that downloading continues while logs are
+        converted.  Conversions of other missions are kept out by HDF5_LOCK.
+        """
         name = name or self.args.mission
         vehicle = vehicle or self.args.auv_name
+        semaphore = asyncio.Semaphore(
+            getattr(self.args, "download_concurrency", None) or DOWNLOAD_CONCURRENCY
+        )
+        # Time out a stalled connection, not a long download that is progressing
+        timeout = ClientTimeout(total=None, sock_connect=TIMEOUT, sock_read=TIMEOUT)
+        portal_files = self._read_portal_files(logs_dir)
+        if not getattr(self.args, "include_all", False):
+            # Imported here as manifest imports calibrate, which imports this module
+            from manifest import select_files
+
+            selected = select_files(files, vehicle, name)
+            self.logger.info(
+                f"Downloading {len(selected)} of the {len(files)} files of {name}"
+                " read by the processing, use --include_all for all of them"
+            )
+            files = selected
+        loop = asyncio.get_running_loop()
+
+        async def get_and_convert(download_url, local_filename, session, executor):
+            changed = await self._get_file(
+                download_url, local_filename, session, semaphore, portal_files
+            )
+            log = os.path.basename(local_filename)
+            if convert and log in LOG_FILES:
+                await loop.run_in_executor(executor, convert, log, changed)
+            return changed
+
         tasks = []
-        async with ClientSession(timeout=TIMEOUT) as session:
-            for ffm in self._files_from_mission(name, vehicle):
-                download_url = (
-                    f"{self.portal_base}/files/download/{name}/{vehicle}/{ffm}"
-                )
-                self.logger.debug(f"Getting file contents from {download_url}")
-                Path(logs_dir).mkdir(parents=True, exist_ok=True)
-                local_filename = os.path.join(logs_dir, ffm)
-                task = asyncio.ensure_future(
-                    self._get_file(download_url, local_filename, session)
-                )
-                tasks.append(task)
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            async with ClientSession(timeout=timeout) as session:
+                for ffm in files:
+                    download_url = (
+                        f"{self.portal_base}/files/download/{name}/{vehicle}/{ffm}"
+                    )
+                    self.logger.debug(f"Getting file contents from {download_url}")
+                    Path(logs_dir).mkdir(parents=True, exist_ok=True)
+                    local_filename = os.path.join(logs_dir, ffm)
+                    task = asyncio.ensure_future(
+                        get_and_convert(download_url, local_filename, session, executor)
+                    )
+                    tasks.append(task)
 
-            await asyncio.gather(*tasks)
+                changed = await asyncio.gather(*tasks)
+        self._write_portal_files(logs_dir, portal_files)
+        return {ffm for ffm, file_changed in zip(files, changed) if file_changed}
 
-    def _portal_download(self, logs_dir, name=None, vehicle=None):
+    def _portal_download(self, logs_dir, name=None, vehicle=None, convert=None) -> set:
+        """Download the mission's files that have changed on the portal and
+        return their names, None if the mission's files could not be listed.
+        See _download_files() for `convert`."""
         self.logger.debug(f"Getting logs from {self.portal_base}")
         self.logger.info(f"Downloading mission: {vehicle} {name}")
         d_start = time.time()
-        loop = asyncio.get_event_loop()
-        try:
-            future = asyncio.ensure_future(
-                self._download_files(logs_dir, name, vehicle)
-            )
-        except asyncio.exceptions.TimeoutError as e:
-            self.logger.warning(f"{e}")
         try:
-            loop.run_until_complete(future)
+            files = self._files_from_mission(name, vehicle)
         except LookupError as e:
             self.logger.error(f"{e}")
             self.logger.info(f"Perhaps use '--update' option?")
             return
-        self.logger.info(f"Time to download: {(time.time() - d_start):.2f} seconds")
+        changed = asyncio.run(
+            self._download_files(logs_dir, files, name, vehicle, convert)
+        )
+        self.logger.info(
+            f"Time to download: {(time.time() - d_start):.2f} seconds,"
+            f" {len(changed)} files changed"
+        )
+        return changed
 
     def _correct_dup_short_names(self, log_data):
         short_names = [v.short_name for v in log_data]
@@ -474,10 +664,18 @@ class AUV_NetCDF(AUV):
             raise ValueError(f"No conversion for data_type = {data_type}")
 
         self.logger.debug(f"createVariable {short_name}")
+        kwargs = netcdf4_kwargs(
+            short_name,
+            nc_data_type,
+            len(data),
+            getattr(self, "_seconds_per_record", {}).get(time_axis),
+            getattr(self.args, "encoding", ENCODING),
+            units,
+        )
         setattr(
             self,
             short_name,
-            self.nc_file.createVariable(short_name, nc_data_type, (time_axis,)),
+            self.nc_file.createVariable(short_name, dimensions=(time_axis,), **kwargs),
         )
         if standard_name := self._get_standard_name(short_name, long_name):
             setattr(getattr(self, short_name), "standard_name", standard_name)
@@ -509,6 +707,9 @@ class AUV_NetCDF(AUV):
     def write_variables(self, log_data, netcdf_filename):
         log_data = self._correct_dup_short_names(log_data)
         self.nc_file.createDimension(TIME, len(log_data[0].data))
+        # For the chunk sizes of the encoding, time is the first variable
+        seconds = seconds_per_record(np.asarray(log_data[0].data, dtype=np.float64))
+        self._seconds_per_record = {TIME: seconds, TIME60HZ: seconds and seconds / 60}
         for variable in log_data:
             self.logger.debug(
                 f"Creating Variable {variable.short_name}:"
@@ -607,7 +808,15 @@ class AUV_NetCDF(AUV):
             self.nc_file.createDimension(name, len(clean_time_values))
         # copy all file data except for the excluded
         for name, variable in ds_orig.variables.items():
-            self.nc_file.createVariable(name, variable.datatype, variable.dimensions)
+            filters = variable.filters() or {}
+            self.nc_file.createVariable(
+                name,
+                variable.datatype,
+                variable.dimensions,
+                zlib=filters.get("zlib", False),
+                complevel=filters.get("complevel", 4),
+                shuffle=filters.get("shuffle", True),
+            )
             # copy variable attributes all at once via dictionary
             self.nc_file[name].setncatts(ds_orig[name].__dict__)
             self.nc_file[name][:] = np.delete(ds_orig[name][:], bad_indices)
@@ -620,6 +829,7 @@ class AUV_NetCDF(AUV):
         if os.path.exists(netcdf_filename):
             # xarray's Dataset raises permission denied error if file exists
             os.remove(netcdf_filename)
+        w_start = time.time()
         self.nc_file = Dataset(netcdf_filename, "w")
         self.write_variables(log_data, netcdf_filename)
 
@@ -649,6 +859,53 @@ class AUV_NetCDF(AUV):
             # Write comment here, preserving original data - corrected in calibration
             self.nc_file.comment += "Non-monotonic increasing times detected."
         self.nc_file.close()
+        log_written(
+            netcdf_filename,
+            getattr(self.args, "encoding", ENCODING),
+            time.time() - w_start,
+            self.logger,
+        )
+
+    def _convert_log(
+        self,
+        log: str,
+        logs_dir: str,
+        netcdfs_dir: str,
+        src_dir: str = None,
+        unchanged: bool = False,
+    ) -> None:
+        "Convert `log` in `logs_dir` to a netCDF file in `netcdfs_dir`"
+        log_filename = os.path.join(logs_dir, log)
+        netcdf_filename = os.path.join(netcdfs_dir, log.replace(".log", ".nc"))
+        if (
+            unchanged
+            and not getattr(self.args, "force_conversion", False)
+            and not getattr(self.args, "clobber", False)
+            and os.path.exists(log_filename)
+            and os.path.exists(netcdf_filename)
+            and os.path.getmtime(netcdf_filename) >= os.path.getmtime(log_filename)
+        ):
+            self.logger.info(f"Not converting unchanged {log_filename}")
+            return
+        with HDF5_LOCK:
+            try:
+                file_size = os.path.getsize(log_filename)
+                self.logger.info(f"Processing file {log_filename} ({file_size} bytes)")
+                if file_size == 0:
+                    self.logger.warning(f"{log_filename} is empty")
+                self._process_log_file(log_filename, netcdf_filename, src_dir)
+            except (FileNotFoundError, EOFError, struct.error, IndexError) as e:
+                self.logger.debug(f"{e}")
+            except ValueError as e:
+                self.logger.warning(f"{e} in file {log_filename}")
+
+            if log == "navigation.log" and "2010.172.01" in log_filename:
+                # Remove egregiously bad values as found in 2010.172.01's navigation.log - Comment from processNav.m:
+                # % For Mission 2010.172.01 the first part of the time array had really large negative epoch second values.
+                # % Take only the positive time values in addition to the good depth values
+                self._remove_bad_values(netcdf_filename)
+            if log == "ctdDriver.log" and "2010.265.00" in log_filename:
+                self._remove_bad_values(netcdf_filename)
 
     def download_process_logs(
         self,
@@ -659,6 +916,18 @@ class AUV_NetCDF(AUV):
         name = name or self.args.mission
         vehicle = vehicle or self.args.auv_name
         logs_dir = os.path.join(self.args.base_path, vehicle, MISSIONLOGS, name)
+        netcdfs_dir = os.path.join(self.args.base_path, vehicle, MISSIONNETCDFS, name)
+        Path(netcdfs_dir).mkdir(parents=True, exist_ok=True)
+        p_start = time.time()
+
+        # Logs downloaded from the portal are converted as soon as they arrive
+        converted = set()
+        # Logs already the same as in src_dir
+        unchanged = set()
+
+        def convert(log, changed):
+            self._convert_log(log, logs_dir, netcdfs_dir, src_dir, not changed)
+            converted.add(log)
 
         if not self.args.local:
             self.logger.debug(
@@ -682,42 +951,37 @@ class AUV_NetCDF(AUV):
                     )
             if yes_no.upper().startswith("Y"):
                 if self.args.use_portal:
-                    self._portal_download(logs_dir, name=name, vehicle=vehicle)
+                    self._portal_download(logs_dir, name, vehicle, convert)
                 else:
                     if src_dir:
-                        self.logger.info(f"Rsyncing {src_dir} to {logs_dir}")
-                        os.system(f"rsync -av {src_dir} {os.path.dirname(logs_dir)}")
+                        names = None
+                        if not getattr(self.args, "include_all", False):
+                            from manifest import mission_files
+
+                            names = sorted(mission_files(vehicle, name))
+                        self.logger.info(f"Mirroring {src_dir} to {logs_dir}")
+                        report = mirror(
+                            src_dir,
+                            logs_dir,
+                            names,
+                            checksum=getattr(self.args, "checksum", False),
+                        )
+                        self.logger.info(report.summary())
+                        if not report.ok:
+                            raise OSError(f"Failed to copy {list(report.failed)}")
+                        unchanged = set(report.skipped)
                     else:
                         self.logger.info(
                             f"src_dir not provided, so downloading from portal"
                         )
-                        self._portal_download(logs_dir, name=name, vehicle=vehicle)
+                        self._portal_download(logs_dir, name, vehicle, convert)
 
         self.logger.info(f"Processing mission: {vehicle} {name}")
-        netcdfs_dir = os.path.join(self.args.base_path, vehicle, MISSIONNETCDFS, name)
-        Path(netcdfs_dir).mkdir(parents=True, exist_ok=True)
-        p_start = time.time()
         for log in LOG_FILES:
-            log_filename = os.path.join(logs_dir, log)
-            netcdf_filename = os.path.join(netcdfs_dir, log.replace(".log", ".nc"))
-            try:
-                file_size = os.path.getsize(log_filename)
-                self.logger.info(f"Processing file {log_filename} ({file_size} bytes)")
-                if file_size == 0:
-                    self.logger.warning(f"{log_filename} is empty")
-                self._process_log_file(log_filename, netcdf_filename, src_dir)
-            except (FileNotFoundError, EOFError, struct.error, IndexError) as e:
-                self.logger.debug(f"{e}")
-            except ValueError as e:
-                self.logger.warning(f"{e} in file {log_filename}")
-
-            if log == "navigation.log" and "2010.172.01" in log_filename:
-                # Remove egregiously bad values as found in 2010.172.01's navigation.log - Comment from processNav.m:
-                # % For Mission 2010.172.01 the first part of the time array had really large negative epoch second values.
-                # % Take only the positive time values in addition to the good depth values
-                self._remove_bad_values(netcdf_filename)
-            if log == "ctdDriver.log" and "2010.265.00" in log_filename:
-                self._remove_bad_values(netcdf_filename)
+            if log not in converted:
+                self._convert_log(
+                    log, logs_dir, netcdfs_dir, src_dir, log in unchanged
+                )
 
         self.logger.info(f"Time to process: {(time.time() - p_start):.2f} seconds")
 
@@ -731,6 +995,8 @@ class AUV_NetCDF(AUV):
                 f"Update failed for url = {url}," f" status_code = {resp.status_code}"
             )
         else:
+            # Request the deployments and file lists again once updated
+            self.deployment_index().forget(getattr(self.args, "auv_name", None))
             self.logger.info("Wait a few minutes for new missions to appear")
 
     def set_portal(self) -> None:
@@ -793,7 +1059,8 @@ class AUV_NetCDF(AUV):
         parser.add_argument(
             "--clobber",
             action="store_true",
-            help="Use with --noinput to overwrite existing" " downloaded log files",
+            help="Use with --noinput to overwrite existing downloaded log files"
+            " and the netCDF files converted from them",
         )
         parser.add_argument(
             "--noreprocess",
@@ -837,6 +1104,49 @@ class AUV_NetCDF(AUV):
                 " remote connection), otherwise copy from mount point"
             ),
         )
+        parser.add_argument(
+            "--index_ttl",
+            action="store",
+            type=float,
+            default=INDEX_TTL,
+            help="Seconds before the local index of portal deployments in"
+            " base_path is refreshed, 0 to also request again the file lists of"
+            f" older missions, default: {INDEX_TTL}",
+        )
+        parser.add_argument(
+            "--encoding",
+            action="store",
+            choices=ENCODINGS,
+            default=ENCODING,
+            help="Compression and precision of the netCDF files written,"
+            f" default: {ENCODING}, see nc_encoding.py",
+        )
+        parser.add_argument(
+            "--checksum",
+            action="store_true",
+            help="Compare the contents of files copied from the mission"
+            " directory instead of their sizes and modification times",
+        )
+        parser.add_argument(
+            "--include_all",
+            action="store_true",
+            help="Download or copy all files of the mission, not only those"
+            " that are read by the processing",
+        )
+        parser.add_argument(
+            "--force_conversion",
+            action="store_true",
+            help="Convert log files to netCDF even if they are unchanged on the"
+            " portal since the last download, as is also done with --clobber",
+        )
+        parser.add_argument(
+            "--download_concurrency",
+            action="store",
+            type=int,
+            default=DOWNLOAD_CONCURRENCY,
+            help="Number of files to download from the portal at the same time,"
+            f" default: {DOWNLOAD_CONCURRENCY}",
+        )
         parser.add_argument(
             "-v",
             "--verbose",
@@ -0,0 +1,56 @@
+"""
+Declare the files in a mission directory that each processing step reads.
+
+Only the files in the manifest need to be downloaded from the portal or
+copied from the mission directory on the mount point.  The portal and the
+mount point also have many files that the processing never reads.
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+from argparse import Namespace
+from datetime import datetime
+from typing import Iterable, List, Set
+
+from calibrate import Calibrate_NetCDF
+from logs2netcdfs import LOG_FILES
+
+# The vehicle.cfg file also marks a mission directory as already downloaded
+STAGE_FILES = {
+    "logs2netcdfs": (*LOG_FILES, "vehicle.cfg"),
+    "lopcToNetCDF": ("lopc.bin",),
+    "gulper": ("syslog",),
+}
+
+
+def calibration_files(auv_name: str = "Dorado389", mission: str = None) -> Set[str]:
+    """Return the calibration files read by Calibrate_NetCDF for the sensors
+    of `auv_name` at the time of `mission`, e.g. 2020.245.00"""
+    start_datetime = datetime.utcnow()
+    if mission:
+        start_datetime = datetime.strptime(mission[:8], "%Y.%j")
+    cal_netcdf = Calibrate_NetCDF()
+    cal_netcdf.args = Namespace(auv_name=auv_name)
+    cal_netcdf._define_sensor_info(start_datetime)
+    return {
+        info["cal_filename"]
+        for info in cal_netcdf.sinfo.values()
+        if info["cal_filename"]
+    }
+
+
+def mission_files(auv_name: str = "Dorado389", mission: str = None) -> Set[str]:
+    "Return the names of all the files in a mission directory that are read"
+    names = calibration_files(auv_name, mission)
+    for stage_files in STAGE_FILES.values():
+        names.update(stage_files)
+    return names
+
+
+def select_files(
+    names: Iterable[str], auv_name: str = "Dorado389", mission: str = None
+) -> List[str]:
+    "Return the `names` that are in the manifest, keeping their order"
+    wanted = mission_files(auv_name, mission)
+    return [name for name in names if name in wanted]
@@ -0,0 +1,162 @@
+"""
+Mirror files from one directory to another, in place of rsync.
+
+Files whose size or modification time differ, or optionally whose checksum
+differ, are copied in parallel.  Each file is written to a temporary name
+in the destination directory and renamed once complete so that readers
+never see a partial file.  A MirrorReport of what was done is returned.
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+import hashlib
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List
+
+COPY_BUFFER = 8 * 1024 * 1024
+MIRROR_WORKERS = 4
+TMP_SUFFIX = ".mirror_tmp"
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class MirrorReport:
+    """What was done to mirror `src` to `dst`.
+
+    copied: Names of the files copied, relative to `src`
+    skipped: Names of the files already the same in `dst`
+    missing: Names requested that are not in `src`
+    failed: Error message for each file that could not be copied
+    """
+
+    src: str
+    dst: str
+    copied: List[str] = field(default_factory=list)
+    skipped: List[str] = field(default_factory=list)
+    missing: List[str] = field(default_factory=list)
+    failed: Dict[str, str] = field(default_factory=dict)
+    bytes_copied: int = 0
+    seconds: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def summary(self) -> str:
+        rate = self.bytes_copied / self.seconds / 1.0e6 if self.seconds else 0
+        summary = (
+            f"Mirrored {self.src} to {self.dst}: {len(self.copied)} copied"
+            f" ({self.bytes_copied / 1.0e6:.1f} MB, {rate:.1f} MB/s),"
+            f" {len(self.skipped)} unchanged"
+        )
+        if self.missing:
+            summary += f", {len(self.missing)} missing"
+        if self.failed:
+            summary += f", {len(self.failed)} failed"
+        return summary
+
+
+def file_checksum(path: str, buffer_size: int = COPY_BUFFER) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        while chunk := fh.read(buffer_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def needs_copy(src_path: str, dst_path: str, checksum: bool = False) -> bool:
+    """Return True if `dst_path` is not a copy of `src_path`, judged like
+    rsync by size and modification time or, with `checksum`, by content"""
+    try:
+        dst_stat = os.stat(dst_path)
+    except FileNotFoundError:
+        return True
+    src_stat = os.stat(src_path)
+    if src_stat.st_size != dst_stat.st_size:
+        return True
+    if checksum:
+        return file_checksum(src_path) != file_checksum(dst_path)
+    # Whole seconds as some network file systems do not keep fractions
+    return int(src_stat.st_mtime) != int(dst_stat.st_mtime)
+
+
+def copy_file(src_path: str, dst_path: str, buffer_size: int = COPY_BUFFER) -> int:
+    """Copy `src_path` to a temporary file that is renamed to `dst_path` once
+    complete.  The modification time is kept but not the permissions, which
+    cannot be set on the AUVCTD share.  Returns the number of bytes copied.
+    """
+    tmp_path = os.path.join(
+        os.path.dirname(dst_path), f".{os.path.basename(dst_path)}{TMP_SUFFIX}"
+    )
+    try:
+        with open(src_path, "rb") as fsrc, open(tmp_path, "wb") as fdst:
+            shutil.copyfileobj(fsrc, fdst, buffer_size)
+        src_stat = os.stat(src_path)
+        try:
+            os.utime(tmp_path, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+        except OSError as e:
+            logger.debug(f"Cannot set modification time of {dst_path}: {e}")
+        os.replace(tmp_path, dst_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return src_stat.st_size
+
+
+def mirror(
+    src: str,
+    dst: str,
+    names: Iterable[str] = None,
+    checksum: bool = False,
+    workers: int = MIRROR_WORKERS,
+    buffer_size: int = COPY_BUFFER,
+) -> MirrorReport:
+    """Mirror the files in directory `src`, and its subdirectories, to `dst`.
+    If `names` is given only those files, relative to `src`, are mirrored.
+    Files in `dst` that are not in `src` are left alone.
+    """
+    m_start = time.time()
+    report = MirrorReport(src, dst)
+    if names is None:
+        names = sorted(
+            os.path.relpath(os.path.join(root, file_name), src)
+            for root, _, file_names in os.walk(src)
+            for file_name in file_names
+            if not file_name.endswith(TMP_SUFFIX)
+        )
+    to_copy = []
+    for name in names:
+        src_path = os.path.join(src, name)
+        dst_path = os.path.join(dst, name)
+        if not os.path.isfile(src_path):
+            report.missing.append(name)
+        elif needs_copy(src_path, dst_path, checksum):
+            to_copy.append(name)
+        else:
+            report.skipped.append(name)
+
+    def _copy(name):
+        dst_path = os.path.join(dst, name)
+        Path(os.path.dirname(dst_path)).mkdir(parents=True, exist_ok=True)
+        return copy_file(os.path.join(src, name), dst_path, buffer_size)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {name: executor.submit(_copy, name) for name in to_copy}
+        for name, future in futures.items():
+            try:
+                report.bytes_copied += future.result()
+                report.copied.append(name)
+            except OSError as e:
+                logger.error(f"Cannot copy {name} from {src} to {dst}: {e}")
+                report.failed[name] = str(e)
+    report.seconds = time.time() - m_start
+    return report
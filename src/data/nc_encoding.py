@@ -0,0 +1,162 @@
+"""
+Encoding profiles for the netCDF files written by the processing steps.
+
+One profile, selected with --encoding, is applied to the files written by
+logs2netcdfs.py, calibrate.py, align.py and resample.py:
+
+    none:    Uncompressed with default chunking, as written originally
+    zlib:    Lossless zlib compression with shuffle and time aligned chunks
+    lossy:   zlib with data variables quantized to the least significant
+             digit appropriate to their class of measurement
+    float32: zlib with double precision data variables stored as float
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+import logging
+import os
+import re
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import xarray as xr
+
+ENCODINGS = ("none", "zlib", "lossy", "float32")
+ENCODING = "zlib"
+COMPLEVEL = 4
+CHUNK_SECONDS = 3600  # Time span of a chunk of data
+DEFAULT_CHUNK = 4096  # Records per chunk when the sample interval is unknown
+
+# Decimal digits kept by the lossy profile, by the first pattern matched
+# against the variable name.  Variables not matched are not quantized.  The
+# digits are for degrees, two more are kept for angles in radians.
+LEAST_SIGNIFICANT_DIGITS = (
+    (r"(latitude|longitude)$", 6),  # ~0.1 m
+    (r"(depth|pressure|pres)$", 3),
+    (r"(temperature|temp)$", 4),
+    (r"(salinity|sal)$", 4),
+    (r"(conductivity|cond)$", 5),
+    (r"(roll|pitch|yaw|heading)$", 4),
+    (r"(oxygen|nitrate|chlorophyll|chl|fluo|bbp\d*|bb\d*)", 4),
+)
+
+logger = logging.getLogger(__name__)
+
+
+def least_significant_digit(name: str, units: str = None) -> Optional[int]:
+    for pattern, digits in LEAST_SIGNIFICANT_DIGITS:
+        if re.search(pattern, name, re.IGNORECASE):
+            if units and units.lower().startswith("rad"):
+                return digits + 2
+            return digits
+    return None
+
+
+def time_chunk(n_records: int, seconds_per_record: float = None) -> int:
+    "Return the number of records in CHUNK_SECONDS, at most `n_records`"
+    if seconds_per_record and np.isfinite(seconds_per_record):
+        chunk = int(round(CHUNK_SECONDS / seconds_per_record))
+    else:
+        chunk = DEFAULT_CHUNK
+    return max(1, min(n_records, chunk))
+
+
+def _is_time(name: str) -> bool:
+    name = name.lower()
+    return name in ("time", "time60hz", "timetag") or name.endswith("_time")
+
+
+def netcdf4_kwargs(
+    name: str,
+    dtype: str,
+    n_records: int,
+    seconds_per_record: float = None,
+    profile: str = ENCODING,
+    units: str = None,
+) -> Dict:
+    """Return the keyword arguments of netCDF4.Dataset.createVariable() for a
+    variable of `n_records` along time, including its (possibly downcast)
+    "datatype"."""
+    kwargs = {"datatype": dtype}
+    if profile == "none" or n_records == 0:
+        return kwargs
+    kwargs.update(
+        zlib=True,
+        complevel=COMPLEVEL,
+        shuffle=True,
+        chunksizes=(time_chunk(n_records, seconds_per_record),),
+    )
+    if _is_time(name):
+        return kwargs
+    if profile == "lossy":
+        if (digits := least_significant_digit(name, units)) is not None:
+            kwargs["least_significant_digit"] = digits
+    elif profile == "float32" and np.dtype(dtype) == np.float64:
+        kwargs["datatype"] = "f4"
+    return kwargs
+
+
+def seconds_per_record(values) -> Optional[float]:
+    "Return the median interval in seconds of the time `values`"
+    values = np.asarray(values)
+    if values.size < 2:
+        return None
+    if np.issubdtype(values.dtype, np.datetime64):
+        diffs = np.diff(values).astype("timedelta64[ns]").astype(np.float64) / 1.0e9
+    elif np.issubdtype(values.dtype, np.number):
+        diffs = np.diff(values.astype(np.float64))
+    else:
+        return None
+    diffs = diffs[np.isfinite(diffs) & (diffs > 0)]
+    return float(np.median(diffs)) if diffs.size else None
+
+
+def xarray_encoding(ds: xr.Dataset, profile: str = ENCODING) -> Dict[str, Dict]:
+    "Return the `encoding` argument of Dataset.to_netcdf() for `profile`"
+    if profile == "none":
+        return {}
+    chunks = {}
+    for dim, size in ds.sizes.items():
+        seconds = seconds_per_record(ds[dim].values) if dim in ds.coords else None
+        chunks[dim] = time_chunk(size, seconds) if seconds else size
+    encoding = {}
+    for name, var in ds.variables.items():
+        if not var.dims or var.dtype.kind not in "fiub":
+            continue
+        var_encoding = {
+            "zlib": True,
+            "complevel": COMPLEVEL,
+            "shuffle": True,
+            "chunksizes": tuple(max(1, chunks[dim]) for dim in var.dims),
+        }
+        if not (name in ds.dims or _is_time(name)):
+            if profile == "lossy" and var.dtype.kind == "f":
+                digits = least_significant_digit(name, var.attrs.get("units"))
+                if digits is not None:
+                    var_encoding["least_significant_digit"] = digits
+            elif profile == "float32" and var.dtype == np.float64:
+                var_encoding["dtype"] = "float32"
+        encoding[name] = var_encoding
+    return encoding
+
+
+def to_netcdf(
+    ds: xr.Dataset,
+    path: str,
+    profile: str = ENCODING,
+    log: logging.Logger = logger,
+    **kwargs,
+) -> None:
+    "Write `ds` to `path` with the `profile` encoding and log its size"
+    w_start = time.time()
+    ds.to_netcdf(path, encoding=xarray_encoding(ds, profile), **kwargs)
+    log_written(path, profile, time.time() - w_start, log)
+
+
+def log_written(path: str, profile: str, seconds: float, log=logger) -> None:
+    log.info(
+        f"Wrote {os.path.getsize(path) / 1.0e6:.1f} MB to {os.path.basename(path)}"
+        f" with {profile} encoding in {seconds:.1f} seconds"
+    )
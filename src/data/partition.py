@@ -0,0 +1,167 @@
+"""
+Partition the data of a long mission at its surfacings so that align.py and
+resample.py can process the underwater segments in parallel.
+
+A gap of more than MIN_DIVE_SECS between GPS fixes, as used by
+_nudge_pos(), is a dive, and the last fix before it bounds the segments.
+The segments of each variable are processed by a pool of threads and the
+results are concatenated in order.  The output is identical to processing
+the whole mission at once:
+
+- Interpolation is evaluated point by point, so each segment of the times
+  is interpolated against all of the coordinate values.
+- The centered median filter is computed over each segment padded with
+  half of its width from the neighbouring segments, and trimmed.
+- The bin means split the segments at the edge of the bin holding the
+  surfacing, so that every bin sums the same values in the same order.
+  Frequencies that do not divide a day, whose bins depend on the first
+  time of the data, are not partitioned.
+
+Segments shorter than MIN_SEGMENT_POINTS are merged with the following one
+as the threads would cost more than they save.
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Tuple
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+MIN_DIVE_SECS = 120  # Longer gaps between GPS fixes are underwater
+MIN_SEGMENT_POINTS = 20000
+SEGMENT_WORKERS = 1  # Serial unless --segment_workers is given
+
+
+def _as_ns(times) -> np.ndarray:
+    return np.asarray(times).astype("datetime64[ns]").view(np.int64)
+
+
+def surfacing_bounds(gps_times, min_dive_secs: float = MIN_DIVE_SECS) -> np.ndarray:
+    "Return the times of the last GPS fix before each dive as datetime64[ns]"
+    times = np.asarray(gps_times).astype("datetime64[ns]")
+    dives = np.diff(times) > np.timedelta64(int(min_dive_secs * 1e9), "ns")
+    return times[:-1][dives]
+
+
+def dataset_bounds(ds: xr.Dataset, time_name: str = "gps_time") -> np.ndarray:
+    "Return the surfacing_bounds() of the GPS fixes of calibrated data `ds`"
+    if time_name not in ds.indexes:
+        return np.array([], dtype="datetime64[ns]")
+    return surfacing_bounds(ds.indexes[time_name])
+
+
+def segment_edges(times, bounds, min_points: int = None) -> np.ndarray:
+    """Return the indices of increasing `times` at which the segments split by
+    `bounds` start, followed by the number of times.  Each segment has at
+    least `min_points`, default MIN_SEGMENT_POINTS, times."""
+    min_points = MIN_SEGMENT_POINTS if min_points is None else min_points
+    times = _as_ns(times)
+    edges = [0]
+    for index in np.searchsorted(times, _as_ns(bounds), side="right"):
+        if index - edges[-1] >= min_points and times.size - index >= min_points:
+            edges.append(int(index))
+    edges.append(times.size)
+    return np.array(edges)
+
+
+def run_segments(
+    func: Callable[[int, int], np.ndarray],
+    edges: np.ndarray,
+    overlap: int = 0,
+    workers: int = SEGMENT_WORKERS,
+) -> np.ndarray:
+    """Return the results of `func`(start, stop) for each segment between
+    `edges` concatenated.  The segments passed to `func` are padded with
+    `overlap` points on both sides, which are trimmed from its result."""
+    size = edges[-1]
+
+    def _segment(start_stop: Tuple[int, int]) -> np.ndarray:
+        start, stop = start_stop
+        lo, hi = max(start - overlap, 0), min(stop + overlap, size)
+        return np.asarray(func(lo, hi))[start - lo : stop - lo]
+
+    segments = list(zip(edges[:-1], edges[1:]))
+    if workers <= 1 or len(segments) <= 1:
+        return np.concatenate([_segment(segment) for segment in segments])
+    with ThreadPoolExecutor(max_workers=min(workers, len(segments))) as executor:
+        return np.concatenate(list(executor.map(_segment, segments)))
+
+
+def interp_segments(
+    interp: Callable, times, bounds, workers: int = SEGMENT_WORKERS
+) -> np.ndarray:
+    """Return `interp`, e.g. an interp1d(), evaluated at `times` in datetime64
+    or int64 nanoseconds, one segment per thread"""
+    x = _as_ns(times)
+    return run_segments(
+        lambda start, stop: interp(x[start:stop]),
+        segment_edges(x, bounds),
+        workers=workers,
+    )
+
+
+def rolling_median(
+    da: xr.DataArray, width: int, bounds, workers: int = SEGMENT_WORKERS
+) -> pd.Series:
+    """Return `da` median filtered with a centered window of `width` points
+    like da.rolling(center=True).median(), one segment per thread"""
+    dim = da.dims[0]
+    edges = segment_edges(da.get_index(dim), bounds)
+    if workers <= 1 or edges.size <= 2:
+        return da.rolling(**{dim: width}, center=True).median().to_pandas()
+    values = run_segments(
+        lambda start, stop: da.isel({dim: slice(start, stop)})
+        .rolling(**{dim: width}, center=True)
+        .median()
+        .values,
+        edges,
+        overlap=width // 2 + 1,
+        workers=workers,
+    )
+    return pd.Series(values, index=da.get_index(dim))
+
+
+def bin_sums(
+    series: pd.Series, freq: str, bounds, workers: int = SEGMENT_WORKERS
+) -> Tuple[pd.Series, pd.Series]:
+    """Return the sums and counts of `series` in `freq` bins centered on the
+    time labels, as series.shift(0.5, freq=freq).resample(freq), one segment
+    per thread"""
+    step = pd.to_timedelta(freq)
+    if (
+        workers > 1
+        and len(bounds)
+        and pd.Timedelta(days=1) % step == pd.Timedelta(0)
+        and series.index.is_monotonic_increasing
+    ):
+        # Move each bound to the start of the bin holding it
+        labels = (pd.DatetimeIndex(bounds) + step / 2).floor(step)
+        edges = segment_edges(series.index, labels - step / 2 - pd.Timedelta(1))
+    else:
+        edges = np.array([0, len(series)])
+    if edges.size <= 2:
+        resampler = series.shift(0.5, freq=freq).resample(freq)
+        return resampler.sum(), resampler.count()
+
+    def _binned(start_stop: Tuple[int, int]) -> Tuple[pd.Series, pd.Series]:
+        resampler = (
+            series.iloc[start_stop[0] : start_stop[1]]
+            .shift(0.5, freq=freq)
+            .resample(freq)
+        )
+        return resampler.sum(), resampler.count()
+
+    segments = list(zip(edges[:-1], edges[1:]))
+    with ThreadPoolExecutor(max_workers=min(workers, len(segments))) as executor:
+        binned = list(executor.map(_binned, segments))
+    sums = pd.concat([sums for sums, _ in binned])
+    counts = pd.concat([counts for _, counts in binned])
+    # Empty bins between the segments, as in the resampling of all the data
+    index = pd.date_range(
+        sums.index[0], sums.index[-1], freq=freq, name=sums.index.name
+    )
+    return sums.reindex(index, fill_value=0.0), counts.reindex(index, fill_value=0)
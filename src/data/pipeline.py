@@ -0,0 +1,323 @@
+"""
+Schedule the processing of many missions as a graph of stage tasks so that
+the network bound and the CPU bound stages of different missions overlap.
+
+Each mission is a chain of the stages in STAGES, each of which starts once
+those it follows are done.  The download and archive stages, which mostly
+wait on the network, run in a pool of threads and the calibrate, align and
+resample stages, which mostly compute, run in a pool of processes, each pool
+with its own limit on the stages running at once.  While the processes work
+on some missions the threads download the next ones and archive those done.
+
+Every stage runs with a copy of the Processor and logs to the processing
+log of its mission through a handler that only passes the records of its own
+thread, as the loggers of the processing classes are shared by the threads.
+If a stage fails the stages that follow it are skipped, except archive and
+cleanup, which as in Processor.process_mission_job() always run.
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+import copy
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import cpu_count, get_context
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Set, Tuple
+
+from align import InvalidCalFile
+from archive import LOG_NAME
+from batch import JOURNAL_DONE, MissionTimeout, mission_timeout
+from logs2netcdfs import MISSIONNETCDFS, AUV_NetCDF
+from resample import InvalidAlignFile
+
+IO = "io"
+CPU = "cpu"
+IO_WORKERS = 4
+
+
+class Stage(NamedTuple):
+    kind: str
+    after: Tuple[str, ...] = ()
+    always: bool = False  # Run even if a stage it follows failed
+
+
+# In the order that Processor.process_mission() checks for a single step
+STAGES: Dict[str, Stage] = {
+    "download_process": Stage(IO),
+    "calibrate": Stage(CPU, ("download_process",)),
+    "align": Stage(CPU, ("calibrate",)),
+    "resample": Stage(CPU, ("align",)),
+    "archive": Stage(IO, ("resample",), always=True),
+    "cleanup": Stage(IO, ("archive",), always=True),
+}
+
+logger = logging.getLogger(__name__)
+
+
+class ThreadFilter(logging.Filter):
+    "Pass only the records logged by the thread that created the filter"
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.thread = threading.get_ident()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.thread == self.thread
+
+
+def mission_stages(args) -> List[str]:
+    """Return the stages run for each mission with the command line `args`,
+    as by Processor.process_mission_job(): a single step if one is given or
+    all of the processing steps, followed by archive and cleanup"""
+    stages = [stage for stage in STAGES if getattr(args, stage, False)][:1]
+    if not stages:
+        stages = ["calibrate", "align", "resample"]
+        if not getattr(args, "skip_download_process", False):
+            stages.insert(0, "download_process")
+    stages.append("archive")
+    if not getattr(args, "no_cleanup", False):
+        stages.append("cleanup")
+    return list(dict.fromkeys(stages))
+
+
+def dependencies(stages: List[str]) -> Dict[str, Set[str]]:
+    """Return the stages of `stages` that each of them follows, through the
+    stages that are not run"""
+    deps = {}
+    for stage in stages:
+        deps[stage] = set()
+        to_visit = list(STAGES[stage].after)
+        while to_visit:
+            before = to_visit.pop()
+            if before in stages:
+                deps[stage].add(before)
+            else:
+                to_visit.extend(STAGES[before].after)
+    return deps
+
+
+def run_stage(
+    processor, stage: str, mission: str, src_dir: str = None, first: bool = False
+) -> Tuple[str, str, str, float]:
+    """Run `stage` of `mission` with a copy of `processor`, appending to the
+    processing log of the mission, or starting it if `first`.  Returns the
+    mission, the stage, its status and the seconds it took."""
+    t_start = time.time()
+    proc = copy.copy(processor)
+    args = proc.args
+    if first and args.clobber:
+        proc.cleanup(mission)
+    netcdfs_dir = os.path.join(args.base_path, proc.vehicle, MISSIONNETCDFS, mission)
+    Path(netcdfs_dir).mkdir(parents=True, exist_ok=True)
+    proc.log_handler = logging.FileHandler(
+        os.path.join(netcdfs_dir, f"{proc.vehicle}_{mission}_{LOG_NAME}"),
+        mode="w+" if first else "a",
+    )
+    proc.log_handler.setLevel(proc._log_levels[args.verbose])
+    proc.log_handler.setFormatter(AUV_NetCDF._formatter)
+    proc.log_handler.addFilter(ThreadFilter())
+    # Levels set by process_command_line() are not inherited by the processes
+    proc.logger.setLevel(proc._log_levels[args.verbose])
+    proc.logger.addHandler(proc.log_handler)
+    # SIGALRM can only be handled in the main thread, as in the processes;
+    # PipelineScheduler.run() times out the stages run in threads
+    timeout = None
+    if threading.current_thread() is threading.main_thread():
+        timeout = args.mission_timeout
+    status = JOURNAL_DONE
+    try:
+        with mission_timeout(timeout, f"{stage} of {mission}"):
+            if stage == "download_process":
+                proc.download_process(mission, src_dir)
+            else:
+                getattr(proc, stage)(mission)
+        # archive() records itself as it is also run outside of the stages
+        if stage not in ("archive", "cleanup"):
+            proc.record_stage(mission, stage)
+    except (InvalidCalFile, InvalidAlignFile, FileNotFoundError, EOFError) as e:
+        proc.logger.error("%s %s", mission, e)
+        status = "failed"
+    except MissionTimeout as e:
+        proc.logger.error("%s", e)
+        status = "timeout"
+    finally:
+        proc.logger.removeHandler(proc.log_handler)
+        proc.log_handler.close()
+    return mission, stage, status, time.time() - t_start
+
+
+class PipelineScheduler:
+    """Run the stages of missions with `processor`, a Processor with its
+    args, at most `io_workers` network bound stages in threads and at most
+    `cpu_workers` CPU bound stages in processes at a time"""
+
+    def __init__(
+        self,
+        processor,
+        io_workers: int = IO_WORKERS,
+        cpu_workers: int = None,
+        log: logging.Logger = logger,
+    ) -> None:
+        self.processor = processor
+        self.limits = {IO: io_workers, CPU: cpu_workers or cpu_count()}
+        self.logger = log
+        self.stages = mission_stages(processor.args)
+        self.deps = dependencies(self.stages)
+
+    def _schedule(self, mission: str) -> None:
+        """Queue the stages of `mission` whose preceding stages are done,
+        skipping those that do not always run if a stage failed"""
+        failed = self._status[mission] != JOURNAL_DONE
+        skipped = True
+        while skipped:
+            skipped = False
+            for stage in self.stages:
+                if stage in self._scheduled[mission]:
+                    continue
+                if self.deps[stage] <= self._done[mission]:
+                    self._scheduled[mission].add(stage)
+                    if failed and not STAGES[stage].always:
+                        self.logger.info("Skipping %s of %s", stage, mission)
+                        self._done[mission].add(stage)
+                        skipped = True
+                    else:
+                        self._ready.append((mission, stage))
+
+    def _finish(self, mission: str, stage: str, status: str, seconds: float) -> bool:
+        """Record `stage` of `mission` as done with `status`, queueing the
+        stages that follow it.  Returns True if the mission is done."""
+        self.logger.info(
+            "%s of %s: %s in %.1f seconds", stage, mission, status, seconds
+        )
+        if self._status[mission] == JOURNAL_DONE:
+            self._status[mission] = status
+        self._seconds[mission] += seconds
+        self._done[mission].add(stage)
+        self._schedule(mission)
+        return self._done[mission] == set(self.stages)
+
+    def run(
+        self,
+        missions: Dict[str, str],
+        memory: Dict[str, float] = None,
+        budget: float = float("inf"),
+    ) -> Iterator[Tuple[str, str, float]]:
+        """Process `missions`, source directories keyed by mission name in the
+        order that they are to be started, yielding the mission, its status
+        and the seconds its stages took as each one finishes.  A CPU stage is
+        only started if the estimated `memory` of its mission fits in `budget`
+        with those of the CPU stages running, or if none is running.
+
+        The stages in threads cannot be interrupted by the SIGALRM of
+        mission_timeout(), so one running longer than --mission_timeout is
+        recorded as "timeout" and left to finish in the pool of threads it
+        was started in, a new pool taking the following stages."""
+        memory = memory or {}
+        timeout = getattr(self.processor.args, "mission_timeout", None)
+        waiting = list(missions)
+        self._ready: List[Tuple[str, str]] = []
+        self._scheduled = defaultdict(set)
+        self._done = defaultdict(set)
+        self._status = {}
+        self._seconds = defaultdict(float)
+        started = set()
+        running = {}  # future -> (mission, stage, pool, start time)
+        pools = {IO: self._io_pool(), CPU: self._cpu_pool()}
+        try:
+            while waiting or self._ready or running:
+                # Download ahead of the processing no more missions than the
+                # workers can take on
+                while waiting and len(started) < sum(self.limits.values()):
+                    mission = waiting.pop(0)
+                    started.add(mission)
+                    self._status[mission] = JOURNAL_DONE
+                    self._schedule(mission)
+                for mission, stage in list(self._ready):
+                    kind = STAGES[stage].kind
+                    busy = [
+                        m for m, s, *_ in running.values() if STAGES[s].kind == kind
+                    ]
+                    if len(busy) >= self.limits[kind]:
+                        continue
+                    if kind == CPU and busy:
+                        in_use = sum(memory.get(m, 0) for m in busy)
+                        if in_use + memory.get(mission, 0) > budget:
+                            continue
+                    self._ready.remove((mission, stage))
+                    self.logger.debug("Starting %s of %s", stage, mission)
+                    args = (run_stage, self.processor, stage, mission)
+                    args += (missions[mission],)
+                    first = not self.deps[stage]
+                    try:
+                        future = pools[kind].submit(*args, first=first)
+                    except BrokenProcessPool:
+                        self._restart(pools)
+                        future = pools[kind].submit(*args, first=first)
+                    running[future] = (mission, stage, pools[kind], time.time())
+                deadlines = [
+                    t_start + timeout
+                    for _, s, _, t_start in running.values()
+                    if timeout and STAGES[s].kind == IO
+                ]
+                wait_for = max(0, min(deadlines) - time.time()) if deadlines else None
+                finished, _ = wait(running, wait_for, return_when=FIRST_COMPLETED)
+                results = []
+                for future in finished:
+                    mission, stage, pool, _ = running.pop(future)
+                    try:
+                        _, _, status, seconds = future.result()
+                    except BrokenProcessPool as e:
+                        # A worker was killed, e.g. out of memory, failing the
+                        # stages running in all of the processes
+                        self.logger.error("%s of %s: %s", stage, mission, e)
+                        status, seconds = "failed", 0.0
+                        if pool is pools[CPU]:
+                            self._restart(pools)
+                    except Exception as e:
+                        status, seconds = f"error: {e!r}", 0.0
+                    results.append((mission, stage, status, seconds))
+                for future, (mission, stage, pool, t_start) in list(running.items()):
+                    if STAGES[stage].kind != IO or not timeout:
+                        continue
+                    seconds = time.time() - t_start
+                    if seconds < timeout:
+                        continue
+                    self.logger.error(
+                        "%s of %s exceeded %s seconds", stage, mission, timeout
+                    )
+                    del running[future]
+                    if pool is pools[IO]:
+                        pool.shutdown(wait=False)
+                        pools[IO] = self._io_pool()
+                    results.append((mission, stage, "timeout", seconds))
+                for mission, stage, status, seconds in results:
+                    if self._finish(mission, stage, status, seconds):
+                        started.remove(mission)
+                        yield mission, self._status[mission], self._seconds[mission]
+        finally:
+            for pool in pools.values():
+                pool.shutdown()
+
+    def _io_pool(self) -> ThreadPoolExecutor:
+        return ThreadPoolExecutor(self.limits[IO])
+
+    def _cpu_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(self.limits[CPU], mp_context=get_context("spawn"))
+
+    def _restart(self, pools: Dict[str, object]) -> None:
+        "Replace the broken pool of worker processes"
+        self.logger.error("Restarting the worker processes of the CPU stages")
+        pools[CPU].shutdown(wait=False)
+        pools[CPU] = self._cpu_pool()
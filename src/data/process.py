@@ -24,7 +24,9 @@ import argparse
 import logging
 import os
 import platform
+import queue
 import shutil
+import signal
 import subprocess
 import sys
 import time
@@ -36,10 +38,39 @@ from socket import gethostname
 
 from align import Align_NetCDF, InvalidCalFile
 from archive import LOG_NAME, Archiver
+from batch import (
+    JOURNAL_DONE,
+    MAX_TASKS_PER_CHILD,
+    MEMORY_BUDGET_FRACTION,
+    METRICS_FILE,
+    CostModel,
+    MissionJournal,
+    MissionTimeout,
+    available_memory,
+    init_worker,
+    mission_input_sizes,
+    mission_timeout,
+    peak_rss,
+    report_start,
+    reset_peak_rss,
+)
 from calibrate import Calibrate_NetCDF
-from logs2netcdfs import BASE_PATH, MISSIONLOGS, MISSIONNETCDFS, AUV_NetCDF
+from catalog import CATALOG_FILE, MissionCatalog
+from logs2netcdfs import (
+    BASE_PATH,
+    HDF5_LOCK,
+    LOG_FILES,
+    MISSIONLOGS,
+    MISSIONNETCDFS,
+    AUV_NetCDF,
+)
+from nc_encoding import ENCODING, ENCODINGS
 from lopcToNetCDF import LOPC_Processor, UnexpectedAreaOfCode
-from resample import FREQ, MF_WIDTH, InvalidAlignFile, Resampler
+from partition import SEGMENT_WORKERS
+from pipeline import IO_WORKERS, PipelineScheduler
+from resample import FREQ, METHOD, MF_WIDTH, InvalidAlignFile, Resampler
+from selection import add_arguments
+from storage import STORAGE, STORAGES
 
 
 class Processor:
@@ -63,8 +94,27 @@ class Processor:
         self.vehicle_dir = vehicle_dir
         self.mount_dir = mount_dir
 
+    @property
+    def catalog(self) -> MissionCatalog:
+        "The MissionCatalog of the vehicle_dir, kept in the base_path"
+        return MissionCatalog(
+            os.path.join(self.args.base_path, self.vehicle, CATALOG_FILE),
+            self.vehicle_dir,
+            self.vehicle,
+            self.logger,
+        )
+
+    def record_stage(self, mission: str, stage: str) -> None:
+        "Record `stage` as the last one run for `mission` in the catalog"
+        if getattr(self.args, "catalog", False):
+            self.catalog.record_stage(mission, stage)
+
     def mission_list(self, start_year: int, end_year: int) -> dict:
-        """Return a dictionary of source directories keyed by mission name."""
+        """Return a dictionary of source directories keyed by mission name.
+        The mission catalog is refreshed and queried unless --no_catalog is
+        given, in which case the vehicle_dir is searched with find."""
+        if getattr(self.args, "catalog", False):
+            return self._catalog_mission_list(start_year, end_year)
         missions = {}
         REGEX = r".*\/[0-9][0-9][0-9][0-9]\.[0-9][0-9][0-9]\.[0-9][0-9]"
         if platform.system() == "Darwin":
@@ -97,6 +147,25 @@ class Processor:
                 self.logger.warning("Cannot parse year from %s", mission)
         return missions
 
+    def _catalog_mission_list(self, start_year: int, end_year: int) -> dict:
+        """Return a dictionary of source directories keyed by mission name
+        from the mission catalog, updated with the directories changed since
+        it was last refreshed"""
+        since = None
+        if self.args.last_n_days:
+            self.logger.info(
+                f"Will be looking back {self.args.last_n_days} days for new missions..."
+            )
+            since = time.time() - self.args.last_n_days * 24 * 3600
+        self.logger.info("Finding missions from %s to %s", start_year, end_year)
+        try:
+            self.catalog.refresh()
+        except FileNotFoundError as e:
+            self.logger.error("%s", e)
+            self.logger.info(f"Is {self.mount_dir} mounted?")
+            return {}
+        return self.catalog.missions(start_year, end_year, since)
+
     def get_mission_dir(self, mission: str) -> str:
         """Return the mission directory."""
         if not os.path.exists(self.vehicle_dir):
@@ -109,11 +178,18 @@ class Processor:
         elif self.vehicle.lower() == "i2map":
             year = int(mission.split(".")[0])
             # Could construct the YYYY/MM/YYYYMMDD path on M3/Master
-            # but use the mission_list() method to find the mission dir instead
-            missions = self.mission_list(start_year=year, end_year=year)
-            if mission in missions:
-                path = missions[mission]
-            else:
+            # but use the mission catalog, or mission_list(), to find it instead
+            path = None
+            if getattr(self.args, "catalog", False):
+                path = self.catalog.path(mission)
+                if path and not os.path.exists(path):
+                    # Moved or removed since the catalog was last refreshed
+                    self.logger.info("%s not found, refreshing the catalog", path)
+                    path = None
+            if path is None:
+                missions = self.mission_list(start_year=year, end_year=year)
+                path = missions.get(mission)
+            if path is None:
                 self.logger.error("Cannot find %s in %s", mission, self.vehicle_dir)
                 raise FileNotFoundError(f"Cannot find {mission} in {self.vehicle_dir}")
         if not os.path.exists(path):
@@ -133,6 +209,9 @@ class Processor:
         auv_netcdf.args.auv_name = self.vehicle
         auv_netcdf.args.mission = mission
         auv_netcdf.args.use_portal = self.args.use_portal
+        auv_netcdf.args.force_conversion = self.args.force_conversion
+        auv_netcdf.args.include_all = self.args.include_all
+        auv_netcdf.args.encoding = self.args.encoding
         auv_netcdf.set_portal()
         auv_netcdf.args.verbose = self.args.verbose
         auv_netcdf.logger.setLevel(self._log_levels[self.args.verbose])
@@ -169,7 +248,8 @@ class Processor:
         lopc_processor.logger.setLevel(self._log_levels[self.args.verbose])
         lopc_processor.logger.addHandler(self.log_handler)
         try:
-            lopc_processor.main()
+            with HDF5_LOCK:
+                lopc_processor.main()
         except UnexpectedAreaOfCode as e:
             self.logger.error(e)
         lopc_processor.logger.removeHandler(self.log_handler)
@@ -186,6 +266,13 @@ class Processor:
         cal_netcdf.args.auv_name = self.vehicle
         cal_netcdf.args.mission = mission
         cal_netcdf.args.plot = None
+        cal_netcdf.args.encoding = self.args.encoding
+        cal_netcdf.args.storage = self.args.storage
+        cal_netcdf.args.cal_cache = self.args.cal_cache
+        cal_netcdf.args.sensors = self.args.sensors
+        cal_netcdf.args.variables = self.args.variables
+        cal_netcdf.args.estimate_lags = self.args.estimate_lags
+        cal_netcdf.args.apply_lags = self.args.apply_lags
         cal_netcdf.args.verbose = self.args.verbose
         cal_netcdf.logger.setLevel(self._log_levels[self.args.verbose])
         cal_netcdf.logger.addHandler(self.log_handler)
@@ -205,6 +292,11 @@ class Processor:
         align_netcdf.args.auv_name = self.vehicle
         align_netcdf.args.mission = mission
         align_netcdf.args.plot = None
+        align_netcdf.args.encoding = self.args.encoding
+        align_netcdf.args.storage = self.args.storage
+        align_netcdf.args.sensors = self.args.sensors
+        align_netcdf.args.variables = self.args.variables
+        align_netcdf.args.segment_workers = self.args.segment_workers
         align_netcdf.args.verbose = self.args.verbose
         align_netcdf.logger.setLevel(self._log_levels[self.args.verbose])
         align_netcdf.logger.addHandler(self.log_handler)
@@ -227,6 +319,12 @@ class Processor:
         resamp.args.plot = None
         resamp.args.freq = self.args.freq
         resamp.args.mf_width = self.args.mf_width
+        resamp.args.method = self.args.method
+        resamp.args.encoding = self.args.encoding
+        resamp.args.storage = self.args.storage
+        resamp.args.sensors = self.args.sensors
+        resamp.args.variables = self.args.variables
+        resamp.args.segment_workers = self.args.segment_workers
         resamp.commandline = self.commandline
         resamp.args.verbose = self.args.verbose
         resamp.logger.setLevel(self._log_levels[self.args.verbose])
@@ -240,7 +338,9 @@ class Processor:
             file_name,
         )
         try:
-            resamp.resample_mission(nc_file)
+            resamp.resample_mission(
+                nc_file, mf_width=self.args.mf_width, freq=self.args.freq
+            )
         except FileNotFoundError as e:
             self.logger.error("%s %s", mission, e)
         finally:
@@ -252,6 +352,7 @@ class Processor:
         arch.args = argparse.Namespace()
         arch.args.auv_name = self.vehicle
         arch.args.mission = mission
+        arch.args.storage = self.args.storage
         arch.commandline = self.commandline
         arch.args.verbose = self.args.verbose
         arch.logger.setLevel(self._log_levels[self.args.verbose])
@@ -266,6 +367,7 @@ class Processor:
         )
         arch.copy_to_AUVTCD(nc_file_base, self.args.freq)
         arch.logger.removeHandler(self.log_handler)
+        self.record_stage(mission, "archive")
 
     def cleanup(self, mission: str) -> None:
         self.logger.info(
@@ -310,12 +412,16 @@ class Processor:
         )
         if self.args.download_process:
             self.download_process(mission, src_dir)
+            self.record_stage(mission, "download_process")
         elif self.args.calibrate:
             self.calibrate(mission)
+            self.record_stage(mission, "calibrate")
         elif self.args.align:
             self.align(mission)
+            self.record_stage(mission, "align")
         elif self.args.resample:
             self.resample(mission)
+            self.record_stage(mission, "resample")
         elif self.args.archive:
             self.archive(mission)
         elif self.args.cleanup:
@@ -323,15 +429,20 @@ class Processor:
         else:
             if not self.args.skip_download_process:
                 self.download_process(mission, src_dir)
-            self.calibrate(mission)
-            self.align(mission)
-            self.resample(mission)
+                self.record_stage(mission, "download_process")
+            for stage in ("calibrate", "align", "resample"):
+                getattr(self, stage)(mission)
+                self.record_stage(mission, stage)
             # self.archive() is called in finally: blocks in process_missions()
 
-    def process_mission_job(self, mission: str, src_dir: str = None) -> None:
+    def process_mission_job(self, mission: str, src_dir: str = None) -> tuple:
+        report_start(mission)
+        measured = reset_peak_rss()
+        t_start = time.time()
+        status = JOURNAL_DONE
         try:
-            t_start = time.time()
-            self.process_mission(mission, src_dir)
+            with mission_timeout(self.args.mission_timeout, f"Processing {mission}"):
+                self.process_mission(mission, src_dir)
         except (
             InvalidCalFile,
             InvalidAlignFile,
@@ -340,11 +451,21 @@ class Processor:
         ) as e:
             self.logger.error("%s %s", mission, e)
             self.logger.error("Cannot continue without valid file(s)")
+        except MissionTimeout as e:
+            self.logger.error("%s", e)
+            status = "timeout"
         finally:
             # Still need to archive the mission, especially the processing.log file
-            self.archive(mission)
-            if not self.args.no_cleanup:
-                self.cleanup(mission)
+            try:
+                with mission_timeout(
+                    self.args.mission_timeout, f"Archiving {mission}"
+                ):
+                    self.archive(mission)
+                    if not self.args.no_cleanup:
+                        self.cleanup(mission)
+            except MissionTimeout as e:
+                self.logger.error("%s", e)
+                status = "timeout"
             self.logger.info(
                 "Mission %s took %.1f seconds to process",
                 mission,
@@ -352,7 +473,336 @@ class Processor:
             )
             if hasattr(self, "log_handler"):
                 self.logger.removeHandler(self.log_handler)
-        return f"[{os.getpid()}] {mission}: {time.time() - t_start:.1f} seconds"
+        # The peak of an earlier mission of the worker is not this mission's
+        peak = peak_rss() if measured else None
+        return mission, status, time.time() - t_start, os.getpid(), peak
+
+    def _journal_path(self) -> str:
+        return os.path.join(
+            self.args.base_path,
+            self.vehicle,
+            f"journal_{self.args.start_year}{self.args.start_yd:03d}"
+            f"_{self.args.end_year}{self.args.end_yd:03d}.jsonl",
+        )
+
+    def _mission_estimates(self, missions: dict) -> tuple:
+        """Return the CostModel of the vehicle and the input bytes, estimated
+        seconds and estimated peak memory of each of `missions`"""
+        cost_model = CostModel(
+            os.path.join(self.args.base_path, self.vehicle, METRICS_FILE)
+        )
+        input_bytes = {}
+        estimates = {}
+        memory = {}
+        for mission in missions:
+            sizes = mission_input_sizes(missions[mission], (*LOG_FILES, "lopc.bin"))
+            input_bytes[mission] = sum(sizes.values())
+            estimates[mission] = cost_model.estimate(mission, input_bytes[mission])
+            memory[mission] = cost_model.estimate_memory(mission, sizes)
+        return cost_model, input_bytes, estimates, memory
+
+    def _records_metrics(self) -> bool:
+        "Only complete runs of all the processing steps are timed"
+        return not any(
+            getattr(self.args, step)
+            for step in (
+                "download_process",
+                "calibrate",
+                "align",
+                "resample",
+                "archive",
+                "cleanup",
+            )
+        )
+
+    def _memory_budget(self) -> float:
+        "Return the bytes of memory that the missions of a batch may use"
+        if self.args.memory_budget_gb:
+            budget = self.args.memory_budget_gb * 1.0e9
+        else:
+            budget = (available_memory() or float("inf")) * MEMORY_BUDGET_FRACTION
+        self.logger.info("Memory budget for the batch: %.1f GB", budget / 1.0e9)
+        return budget
+
+    def run_pipeline(self, missions: dict, ncores: int) -> None:
+        """Process `missions` (source directories keyed by mission name) as
+        stage tasks with the PipelineScheduler of pipeline.py, the download
+        and archive stages in --io_workers threads and the calibrate, align
+        and resample stages in `ncores` worker processes.  Missions are
+        started largest first, skipping those done according to the journal,
+        and the CPU stages of a mission wait for its estimated peak memory to
+        fit in the --memory_budget_gb.
+        """
+        Path(os.path.join(self.args.base_path, self.vehicle)).mkdir(
+            parents=True, exist_ok=True
+        )
+        journal = MissionJournal(self._journal_path())
+        if self.args.fresh_start:
+            journal.remove()
+        already_done = journal.done() & set(missions)
+        cost_model, input_bytes, estimates, memory = self._mission_estimates(missions)
+        pending = sorted(
+            (mission for mission in missions if mission not in already_done),
+            key=lambda mission: estimates[mission],
+            reverse=True,
+        )
+        self.logger.info(
+            "Running the stages of %d missions, skipping %d already done,"
+            " in %d threads and %d processes",
+            len(pending),
+            len(already_done),
+            self.args.io_workers,
+            ncores,
+        )
+        scheduler = PipelineScheduler(self, self.args.io_workers, ncores, self.logger)
+        record_metrics = self._records_metrics()
+        statuses = []
+        overall_start = time.time()
+        for mission, status, seconds in scheduler.run(
+            {mission: missions[mission] for mission in pending},
+            memory,
+            self._memory_budget(),
+        ):
+            journal.record(
+                mission,
+                status,
+                seconds=round(seconds, 1),
+                estimate=round(estimates[mission], 1),
+                bytes=input_bytes[mission],
+                memory_mb=round(memory[mission] / 1.0e6),
+            )
+            if status == JOURNAL_DONE and record_metrics:
+                # The seconds that the stages ran, not waiting for free workers,
+                # as timed by run_batch().  The stages share processes with those
+                # of other missions so keep the peak memory measured by a
+                # run_batch() of the same input
+                previous = cost_model.metrics.get(mission, {})
+                peak_mb = None
+                if previous.get("bytes") == input_bytes[mission]:
+                    peak_mb = previous.get("peak_mb")
+                cost_model.update(
+                    mission, input_bytes[mission], round(seconds, 1), peak_mb=peak_mb
+                )
+                cost_model.save()
+            statuses.append(status)
+            self.logger.info(
+                "%s: %s in %.1f seconds (%d of %d missions finished)",
+                mission,
+                status,
+                seconds,
+                len(statuses),
+                len(pending),
+            )
+        self.logger.info(
+            "Finished processing %d missions in %.1f seconds",
+            len(statuses),
+            time.time() - overall_start,
+        )
+        if all(status == JOURNAL_DONE for status in statuses):
+            journal.remove()
+        else:
+            self.logger.info(
+                "Rerun with the same arguments to retry the missions not done: %s",
+                journal.path,
+            )
+
+    def run_batch(self, missions: dict, ncores: int) -> None:
+        """Process `missions` (source directories keyed by mission name) in
+        a pool of `ncores` worker processes.  Missions are dispatched in order
+        of decreasing estimated processing time so that long missions do not
+        start last.  A mission is only started when its estimated peak memory
+        fits in what is left of the --memory_budget_gb after the estimates of
+        the missions already running.  Results are logged as each mission
+        finishes and recorded
+        in a journal so that an interrupted batch can be rerun to do only the
+        missions not yet done.  Workers are replaced after
+        --max_tasks_per_child missions and a worker still busy with a mission
+        well past --mission_timeout is killed.
+        """
+        Path(os.path.join(self.args.base_path, self.vehicle)).mkdir(
+            parents=True, exist_ok=True
+        )
+        journal = MissionJournal(self._journal_path())
+        if self.args.fresh_start:
+            journal.remove()
+        already_done = journal.done() & set(missions)
+        if already_done:
+            self.logger.info(
+                "Skipping %d missions already done according to %s",
+                len(already_done),
+                journal.path,
+            )
+        cost_model, input_bytes, estimates, memory = self._mission_estimates(missions)
+        pending = sorted(
+            (mission for mission in missions if mission not in already_done),
+            key=lambda mission: estimates[mission],
+            reverse=True,
+        )
+        self.logger.info(
+            "Estimated %.1f core-hours for %d missions, largest first: %s",
+            sum(estimates[mission] for mission in pending) / 3600,
+            len(pending),
+            ", ".join(pending[:5]),
+        )
+        budget = self._memory_budget()
+        results = []
+        for mission in [m for m in pending if memory[m] > budget]:
+            if self.args.oversized_alone:
+                self.logger.warning(
+                    "%s needs an estimated %.1f GB, it will be processed alone",
+                    mission,
+                    memory[mission] / 1.0e9,
+                )
+                continue
+            self.logger.warning(
+                "Skipping %s: needs an estimated %.1f GB, more than the budget."
+                " Use --oversized_alone to process it without other missions.",
+                mission,
+                memory[mission] / 1.0e9,
+            )
+            pending.remove(mission)
+            journal.record(
+                mission, "too_large", memory_mb=round(memory[mission] / 1.0e6)
+            )
+            results.append((mission, "too_large", 0.0, None, None))
+        record_metrics = self._records_metrics()
+        # Allow the worker to time out processing and then archiving
+        hard_limit = None
+        if self.args.mission_timeout:
+            hard_limit = 2 * self.args.mission_timeout + 60
+
+        ctx = get_context("spawn")
+        started = ctx.Queue()
+        finished = queue.Queue()
+        running = {}  # mission -> worker pid, None until the worker reports
+        start_times = {}
+        overall_start = time.time()
+        with ctx.Pool(
+            processes=ncores,
+            maxtasksperchild=self.args.max_tasks_per_child,
+            initializer=init_worker,
+            initargs=(started,),
+        ) as pool:
+            while pending or running:
+                while pending and len(running) < ncores:
+                    in_use = sum(memory[m] for m in running)
+                    # The largest mission that fits, any mission if none running
+                    mission = next(
+                        (
+                            m
+                            for m in pending
+                            if not running or memory[m] <= budget - in_use
+                        ),
+                        None,
+                    )
+                    if mission is None:
+                        break
+                    pending.remove(mission)
+                    running[mission] = None
+                    start_times[mission] = time.time()
+                    pool.apply_async(
+                        self.process_mission_job,
+                        (mission, missions[mission]),
+                        callback=finished.put,
+                        error_callback=lambda e, m=mission: finished.put(
+                            (
+                                m,
+                                f"error: {e!r}",
+                                time.time() - start_times[m],
+                                None,
+                                None,
+                            )
+                        ),
+                    )
+                try:
+                    result = finished.get(timeout=5)
+                except queue.Empty:
+                    result = None
+                while not started.empty():
+                    mission, pid, t_start = started.get()
+                    if mission in running:
+                        running[mission] = pid
+                        start_times[mission] = t_start
+                if result is None:
+                    for mission, pid in list(running.items()):
+                        elapsed = time.time() - start_times[mission]
+                        if hard_limit and pid and elapsed > hard_limit:
+                            self.logger.error(
+                                "Killing worker %d: %s still running after %.1f seconds",
+                                pid,
+                                mission,
+                                elapsed,
+                            )
+                            os.kill(pid, signal.SIGKILL)
+                            finished.put((mission, "killed", elapsed, pid, None))
+                    continue
+                mission, status, seconds, pid, peak = result
+                if mission not in running:
+                    # A late result from a mission already reported as killed
+                    continue
+                del running[mission]
+                journal.record(
+                    mission,
+                    status,
+                    seconds=round(seconds, 1),
+                    estimate=round(estimates[mission], 1),
+                    bytes=input_bytes[mission],
+                    memory_mb=round(memory[mission] / 1.0e6),
+                    peak_mb=round(peak / 1.0e6) if peak else None,
+                )
+                if status == JOURNAL_DONE and record_metrics:
+                    cost_model.update(
+                        mission,
+                        input_bytes[mission],
+                        round(seconds, 1),
+                        peak_mb=round(peak / 1.0e6) if peak else None,
+                    )
+                    cost_model.save()
+                results.append(result)
+                self.logger.info(
+                    "[%s] %s: %s in %.1f seconds, estimated %.1f (%d of %d missions finished)",
+                    pid,
+                    mission,
+                    status,
+                    seconds,
+                    estimates[mission],
+                    len(results),
+                    len(missions) - len(already_done),
+                )
+        self.logger.info(
+            "Finished processing %d missions in %.1f seconds",
+            len(results),
+            time.time() - overall_start,
+        )
+        self.logger.info("Results:")
+        self.logger.info(
+            "%-12s %10s %12s %10s %12s %10s  %s",
+            "mission",
+            "MB",
+            "estimated s",
+            "actual s",
+            "estimated MB",
+            "peak MB",
+            "status",
+        )
+        for mission, status, seconds, pid, peak in sorted(results):
+            self.logger.info(
+                "%-12s %10.1f %12.1f %10.1f %12.0f %10s  %s",
+                mission,
+                input_bytes[mission] / 1.0e6,
+                estimates[mission],
+                seconds,
+                memory[mission] / 1.0e6,
+                f"{peak / 1.0e6:.0f}" if peak else "",
+                status,
+            )
+        if all(result[1] == JOURNAL_DONE for result in results):
+            journal.remove()
+        else:
+            self.logger.info(
+                "Rerun with the same arguments to retry the missions not done: %s",
+                journal.path,
+            )
 
     def process_missions(self, start_year: int) -> None:
         if not self.args.start_year:
@@ -401,20 +851,10 @@ class Processor:
             ncores = self.args.num_cores if self.args.num_cores else cpu_count()
             missions = dict(sorted(missions.items()))
             self.logger.info("Using %d cores for %d missions", ncores, len(missions))
-            with get_context("spawn").Pool(processes=ncores) as pool:
-                overall_start = time.time()
-                results = pool.starmap(
-                    self.process_mission_job,
-                    [[mission, missions[mission]] for mission in missions],
-                )
-                self.logger.info(
-                    "Finished processing %d missions in %.1f seconds",
-                    len(missions),
-                    time.time() - overall_start,
-                )
-                self.logger.info("Results:")
-                for result in results:
-                    self.logger.info(result)
+            if self.args.dag:
+                self.run_pipeline(missions, ncores)
+            else:
+                self.run_batch(missions, ncores)
 
     def process_command_line(self):
         parser = argparse.ArgumentParser(
@@ -436,7 +876,8 @@ class Processor:
         parser.add_argument(
             "--clobber",
             action="store_true",
-            help="Use with --noinput to overwrite existing" " downloaded log files",
+            help="Use with --noinput to overwrite existing downloaded log files"
+            " and the netCDF files converted from them",
         )
         parser.add_argument(
             "--noinput",
@@ -483,6 +924,13 @@ class Processor:
             type=int,
             help="Process mission directories modified in the last n days",
         )
+        parser.add_argument(
+            "--no_catalog",
+            action="store_false",
+            dest="catalog",
+            help="Find missions with find instead of the mission catalog kept"
+            f" in {CATALOG_FILE} of the base_path, see catalog.py",
+        )
         parser.add_argument(
             "--download_process",
             action="store_true",
@@ -526,8 +974,9 @@ class Processor:
         parser.add_argument(
             "--freq",
             action="store",
-            default=FREQ,
-            help="Resample freq",
+            nargs="+",
+            default=[FREQ],
+            help="Resample freq, or several to write a file for each, e.g.: 1S 10S 60S",
         )
         parser.add_argument(
             "--mf_width",
@@ -536,6 +985,58 @@ class Processor:
             type=int,
             help="Median filter width",
         )
+        parser.add_argument(
+            "--method",
+            action="store",
+            choices=("median", "decimate"),
+            default=METHOD,
+            help="Resample method: median filter and bin mean (default) or"
+            " anti-aliasing FIR decimation of instruments sampled faster than freq",
+        )
+        parser.add_argument(
+            "--encoding",
+            action="store",
+            choices=ENCODINGS,
+            default=ENCODING,
+            help="Compression and precision of the netCDF files written,"
+            f" default: {ENCODING}, see nc_encoding.py",
+        )
+        parser.add_argument(
+            "--storage",
+            action="store",
+            choices=STORAGES,
+            default=STORAGE,
+            help="Write the calibrated, aligned and resampled products as netCDF"
+            " files, Zarr stores or both, default: netcdf",
+        )
+        add_arguments(parser)
+        parser.add_argument(
+            "--segment_workers",
+            action="store",
+            type=int,
+            default=SEGMENT_WORKERS,
+            help="Threads aligning and resampling the segments of a mission"
+            " between surfacings in parallel, default: 1, see partition.py",
+        )
+        parser.add_argument(
+            "--no_cal_cache",
+            action="store_false",
+            dest="cal_cache",
+            help="Parse the calibration files of each mission instead of using"
+            " those cached by content in calibration_cache of the base_path",
+        )
+        parser.add_argument(
+            "--estimate_lags",
+            action="store_true",
+            help="Estimate the plumbing lags of the pumped sensors and write them"
+            " to the metadata of the _cal.nc files",
+        )
+        parser.add_argument(
+            "--apply_lags",
+            action="store_true",
+            help="Apply the estimated plumbing lags in place of the configured"
+            " lag_secs, implies --estimate_lags",
+        )
         parser.add_argument(
             "--use_portal",
             action="store_true",
@@ -544,6 +1045,19 @@ class Processor:
                 " remote connection), otherwise copy from mount point"
             ),
         )
+        parser.add_argument(
+            "--include_all",
+            action="store_true",
+            help="Download or copy all files of the mission, not only those"
+            " that are read by the processing",
+        )
+        parser.add_argument(
+            "--force_conversion",
+            action="store_true",
+            help="With --use_portal convert log files to netCDF even if they are"
+            " unchanged on the portal since the last download, as is also done"
+            " with --clobber",
+        )
         parser.add_argument(
             "--skip_download_process",
             action="store_true",
@@ -556,6 +1070,54 @@ class Processor:
             type=int,
             help="Number of core processors to use",
         )
+        parser.add_argument(
+            "--dag",
+            action="store_true",
+            help="Run the stages of the missions as tasks, downloading and"
+            " archiving in threads while others are processed, see pipeline.py",
+        )
+        parser.add_argument(
+            "--io_workers",
+            action="store",
+            type=int,
+            default=IO_WORKERS,
+            help="With --dag the number of missions downloaded or archived at"
+            f" the same time, default: {IO_WORKERS}",
+        )
+        parser.add_argument(
+            "--mission_timeout",
+            action="store",
+            type=float,
+            help="Seconds allowed for processing a mission, and again for"
+            " archiving it, before it is abandoned, default: no limit",
+        )
+        parser.add_argument(
+            "--max_tasks_per_child",
+            action="store",
+            type=int,
+            default=MAX_TASKS_PER_CHILD,
+            help="Number of missions a worker process handles before it is"
+            f" replaced to release its memory, default: {MAX_TASKS_PER_CHILD}",
+        )
+        parser.add_argument(
+            "--memory_budget_gb",
+            action="store",
+            type=float,
+            help="Memory that the missions processed at the same time may use,"
+            f" in GB, default: {MEMORY_BUDGET_FRACTION} of the memory available"
+            " at the start",
+        )
+        parser.add_argument(
+            "--oversized_alone",
+            action="store_true",
+            help="Process missions estimated to need more than the memory budget"
+            " one at a time with no other missions, instead of skipping them",
+        )
+        parser.add_argument(
+            "--fresh_start",
+            action="store_true",
+            help="Ignore the journal of an interrupted batch and process all missions",
+        )
         parser.add_argument(
             "-v",
             "--verbose",
@@ -2,7 +2,9 @@ import argparse
 import struct
 import os
 from dataclasses import dataclass
-from typing import List
+from typing import List, Tuple
+
+import numpy as np
 
 __author__ = "Brian Schlining"
 __copyright__ = "Copyright 2020, Monterey Bay Aquarium Research Institute"
@@ -38,6 +40,53 @@ class log_record:
 
         return n
 
+    def format(self):
+        """The little-endian numpy type code of a value of this field"""
+        f = '<f8'
+        if self.data_type == 'float':
+            f = '<f4'
+        elif self.data_type == 'integer':
+            f = '<i4'
+        elif self.data_type == 'short':
+            f = '<i2'
+
+        return f
+
+
+def log_dtype(records: List[log_record]) -> np.dtype:
+    """Structured dtype of one record of the binary section of a log, with a
+    field for each of the `records`.  Duplicated short names are numbered
+    in the field names, e.g. `depth1` and `depth2`.
+    """
+    short_names = [r.short_name for r in records]
+    names = []
+    counts = {}
+    for name in short_names:
+        if short_names.count(name) > 1:
+            counts[name] = counts.get(name, 0) + 1
+            name = f'{name}{counts[name]}'
+        names.append(name)
+    return np.dtype([(n, r.format()) for n, r in zip(names, records)])
+
+
+def read_array(file: str) -> Tuple[List[log_record], bytes, np.ndarray]:
+    """Reads an AUV log into a structured array, with one element per
+    record, without unpacking its values.  Returns the `log_records` of the
+    header, with empty data lists, the header as the bytes in the file and
+    the array.  A partial record at the end of the file is dropped.
+    """
+    (byte_offset, records) = _read_header(file)
+    if byte_offset == 0:
+        raise EOFError(f'{file}: 0 sized file')
+    with open(file, 'rb') as f:
+        header = f.read(byte_offset)
+    dtype = log_dtype(records)
+    data = np.fromfile(file, dtype=np.uint8, offset=byte_offset)
+    n_records = data.size // dtype.itemsize
+    data = data[:n_records * dtype.itemsize].view(dtype)
+
+    return records, header, data
+
 
 def read(file: str) -> List[log_record]:
     """Reads and parses an AUV log and returns a list of `log_records`
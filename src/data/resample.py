@@ -18,7 +18,7 @@ import time
 from collections import defaultdict
 from datetime import datetime, timedelta, timezone
 from socket import gethostname
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple, Union
 
 import cf_xarray  # Needed for the .cf accessor
 import git
@@ -28,19 +28,100 @@ import pandas as pd
 import xarray as xr
 from dorado_info import dorado_info
 from logs2netcdfs import BASE_PATH, MISSIONNETCDFS, SUMMARY_SOURCE, TIME, AUV_NetCDF
+from nc_encoding import ENCODING, ENCODINGS
+from partition import SEGMENT_WORKERS, bin_sums, dataset_bounds, rolling_median
 from pysolar.solar import get_altitude
 from scipy import signal
+from selection import (
+    RESAMPLE_DEPENDENCIES,
+    MergeError,
+    add_arguments,
+    merge_into,
+    product_exists,
+    stage_selection,
+)
+from storage import STORAGE, STORAGES, open_dataset, write_dataset
 from utils import simplify_points
 
 MF_WIDTH = 3
 FREQ = "1S"
 PLOT_SECONDS = 300
+METHOD = "median"
+DECIMATE_CHUNK = 3600  # Output samples per resample_poly() call
 
 
 class InvalidAlignFile(Exception):
     pass
 
 
+def _freq_nests(fine: str, coarse: str) -> bool:
+    """Return True if every `fine` bin (centered on its label) lies entirely
+    within a single `coarse` bin.  Bin edges then coincide, so the coarse bin
+    means can be computed exactly from the sums and counts of the fine bins.
+    This is the case when the coarse interval is an odd multiple of the fine
+    interval and divides a day evenly, so that the bin origin does not matter.
+    """
+    fine_td, coarse_td = pd.to_timedelta(fine), pd.to_timedelta(coarse)
+    ratio, remainder = divmod(coarse_td, fine_td)
+    return (
+        ratio > 1
+        and ratio % 2 == 1
+        and remainder == pd.Timedelta(0)
+        and pd.Timedelta(days=1) % coarse_td == pd.Timedelta(0)
+    )
+
+
+def decimate_series(
+    series: pd.Series, sample_rate_hz: float, freq: str, chunk: int = DECIMATE_CHUNK
+) -> pd.Series:
+    """Decimate `series` sampled at about `sample_rate_hz` to `freq` intervals
+    with the polyphase anti-aliasing FIR filter of scipy.signal.resample_poly().
+    The data are interpolated onto a uniform grid at an integer multiple of the
+    output rate that is aligned with the output time labels.  Segments between
+    gaps longer than `freq` are filtered separately, extended at their ends
+    by odd reflection, and long segments are filtered in overlapping chunks
+    of `chunk` output samples that give the same result as a single pass.
+    """
+    step = pd.to_timedelta(freq).value
+    factor = int(round(sample_rate_hz * step / 1e9))
+    # resample_poly()'s filter extends 10 * factor input samples each side
+    overlap = 11
+    series = series.dropna()
+    if series.empty:
+        return series
+    times = series.index.values.astype("int64")
+    values = series.values.astype("float64")
+    labels = []
+    decimated = []
+    gaps = np.where(np.diff(times) > step)[0]
+    for seg_start, seg_end in zip(np.r_[0, gaps + 1], np.r_[gaps + 1, len(times)]):
+        seg_times = times[seg_start:seg_end]
+        first = -(-seg_times[0] // step) * step
+        last = seg_times[-1] // step * step
+        if last < first:
+            continue
+        n_out = (last - first) // step + 1
+        grid = first + np.arange((n_out - 1) * factor + 1) * step // factor
+        x = np.interp(grid, seg_times, values[seg_start:seg_end])
+        # Odd reflection at the ends, as done by signal.filtfilt()
+        x = np.pad(x, overlap * factor, mode="reflect", reflect_type="odd")
+        for out_start in range(0, n_out, chunk):
+            out_end = min(out_start + chunk, n_out)
+            y = signal.resample_poly(
+                x[out_start * factor : (out_end + 2 * overlap - 1) * factor + 1],
+                1,
+                factor,
+            )
+            decimated.append(y[overlap : overlap + out_end - out_start])
+        labels.append(first + np.arange(n_out) * step)
+    if not labels:
+        return series.iloc[:0]
+    result = pd.Series(
+        np.concatenate(decimated), index=pd.to_datetime(np.concatenate(labels))
+    )
+    return result.reindex(pd.date_range(result.index[0], result.index[-1], freq=freq))
+
+
 class Resampler:
     logger = logging.getLogger(__name__)
     _handler = logging.StreamHandler()
@@ -51,6 +132,9 @@ class Resampler:
     def __init__(self) -> None:
         plt.rcParams["figure.figsize"] = (15, 5)
         self.resampled_nc = xr.Dataset()
+        # Serial until resample_mission() reads the surfacings of the mission
+        self._surfacings = np.array([], dtype="datetime64[ns]")
+        self._workers = SEGMENT_WORKERS
         iso_now = datetime.utcnow().isoformat().split(".")[0] + "Z"
         # Common static attributes for all auv platforms
         self.metadata = {}
@@ -61,7 +145,7 @@ class Resampler:
         self.metadata["date_modified"] = iso_now
         self.metadata["featureType"] = "trajectory"
 
-    def _build_global_metadata(self) -> None:
+    def _build_global_metadata(self, freq: str) -> None:
         """
         Call following saving of coordinates and variables from resample_mission()
         """
@@ -122,7 +206,7 @@ class Resampler:
         self.metadata["summary"] = (
             f"Observational oceanographic data obtained from an Autonomous"
             f" Underwater Vehicle mission with measurements sampled at"
-            f" {self.args.freq} intervals."
+            f" {freq} intervals."
             f" Data processed at {iso_now} using MBARI's auv-python software."
         )
 
@@ -242,6 +326,53 @@ class Resampler:
                 instr_vars[instr].append(variable)
         return instr_vars
 
+    def _read_surfacings(self, nc_file: str) -> np.ndarray:
+        """Return the surfacing times that split the mission into segments
+        processed in parallel, from the GPS fixes in its _cal.nc file"""
+        cal_file = nc_file.replace("_align.nc", "_cal.nc")
+        if self._workers <= 1:
+            return np.array([], dtype="datetime64[ns]")
+        if not product_exists(cal_file):
+            self.logger.info(f"No {cal_file} to partition the mission at surfacings")
+            return np.array([], dtype="datetime64[ns]")
+        with open_dataset(cal_file) as cal_nc:
+            return dataset_bounds(cal_nc)
+
+    def _median_filtered(
+        self, variable: str, mf_width: int, fill_ends: bool = False
+    ) -> pd.Series:
+        """Return `variable` median filtered with `mf_width` samples.  The
+        result is computed once per mission and reused for every frequency.
+        """
+        key = (variable, mf_width, fill_ends)
+        if key not in self._mf_cache:
+            s_mf = rolling_median(
+                self.ds[variable], mf_width, self._surfacings, self._workers
+            )
+            if fill_ends:
+                s_mf = s_mf.fillna(method="bfill").fillna(method="ffill")
+            self._mf_cache[key] = s_mf
+        return self._mf_cache[key]
+
+    def _resample_mean(self, name: str, series: pd.Series, freq: str) -> pd.Series:
+        """Return the mean of `series` in `freq` bins centered on the time
+        labels.  The bin sums and counts are remembered by `name` so that a
+        coarser frequency can be derived from a finer one already done.
+        """
+        binned = self._bin_cache[name]
+        finer = [f for f in binned if _freq_nests(f, freq)]
+        if finer:
+            # Aggregate from the coarsest of the finer grids - fewest points
+            fine_freq = max(finer, key=pd.to_timedelta)
+            fine_sums, fine_counts = binned[fine_freq]
+            self.logger.debug(f"Deriving {name} at {freq} from {fine_freq} bins")
+            sums = fine_sums.shift(0.5, freq=freq).resample(freq).sum()
+            counts = fine_counts.shift(0.5, freq=freq).resample(freq).sum()
+        else:
+            sums, counts = bin_sums(series, freq, self._surfacings, self._workers)
+        binned[freq] = (sums, counts)
+        return sums / counts.where(counts > 0)
+
     def resample_coordinates(self, instr: str, mf_width: int, freq: str) -> None:
         self.logger.info(
             f"Resampling coordinates depth, latitude and longitude with"
@@ -268,63 +399,20 @@ class Resampler:
             self.logger.warning(msg)
             raise InvalidAlignFile(msg)
         # Median Filtered - back & forward filling nan values at ends
-        self.df_o[f"{instr}_depth_mf"] = (
-            self.ds[f"{instr}_depth"]
-            .rolling(**{instr + "_time": mf_width}, center=True)
-            .median()
-            .to_pandas()
-        )
-        self.df_o[f"{instr}_depth_mf"] = self.df_o[f"{instr}_depth_mf"].fillna(
-            method="bfill"
-        )
-        self.df_o[f"{instr}_depth_mf"] = self.df_o[f"{instr}_depth_mf"].fillna(
-            method="ffill"
-        )
-        self.df_o[f"{instr}_latitude_mf"] = (
-            self.ds[f"{instr}_latitude"]
-            .rolling(**{instr + "_time": mf_width}, center=True)
-            .median()
-            .to_pandas()
-        )
-        self.df_o[f"{instr}_latitude_mf"] = self.df_o[f"{instr}_latitude_mf"].fillna(
-            method="bfill"
-        )
-        self.df_o[f"{instr}_latitude_mf"] = self.df_o[f"{instr}_latitude_mf"].fillna(
-            method="ffill"
-        )
-        self.df_o[f"{instr}_longitude_mf"] = (
-            self.ds[f"{instr}_longitude"]
-            .rolling(**{instr + "_time": mf_width}, center=True)
-            .median()
-            .to_pandas()
-        )
-        self.df_o[f"{instr}_longitude_mf"] = self.df_o[f"{instr}_longitude_mf"].fillna(
-            method="bfill"
-        )
-        self.df_o[f"{instr}_longitude_mf"] = self.df_o[f"{instr}_longitude_mf"].fillna(
-            method="ffill"
-        )
+        for coord in ("depth", "latitude", "longitude"):
+            self.df_o[f"{instr}_{coord}_mf"] = self._median_filtered(
+                f"{instr}_{coord}", mf_width, fill_ends=True
+            )
         # Resample to center of freq https://stackoverflow.com/a/69945592/1281657
         aggregator = ".mean() aggregator"
         # This is the common depth for all the instruments - the instruments that
         # matter (ctds, hs2, biolume, lopc) are all in the nose of the vehicle
         # (at least in November 2020)
         # and we want to use the same pitch corrected depth for all of them.
-        self.df_r["depth"] = (
-            self.df_o[f"{instr}_depth_mf"].shift(0.5, freq=freq).resample(freq).mean()
-        )
-        self.df_r["latitude"] = (
-            self.df_o[f"{instr}_latitude_mf"]
-            .shift(0.5, freq=freq)
-            .resample(freq)
-            .mean()
-        )
-        self.df_r["longitude"] = (
-            self.df_o[f"{instr}_longitude_mf"]
-            .shift(0.5, freq=freq)
-            .resample(freq)
-            .mean()
-        )
+        for coord in ("depth", "latitude", "longitude"):
+            self.df_r[coord] = self._resample_mean(
+                f"{instr}_{coord}_mf", self.df_o[f"{instr}_{coord}_mf"], freq
+            )
         return aggregator
 
     def save_coordinates(
@@ -340,8 +428,8 @@ class Resampler:
         self.resampled_nc["depth"].attrs = self.ds[f"{instr}_depth"].attrs
         self.resampled_nc["depth"].attrs["comment"] += (
             f". {self.ds[f'{instr}_depth'].attrs['comment']}"
-            f" mean sampled at {self.args.freq} intervals following"
-            f" {self.args.mf_width} point median filter."
+            f" mean sampled at {freq} intervals following"
+            f" {mf_width} point median filter."
         )
         self.resampled_nc["latitude"].attrs = self.ds[f"{instr}_latitude"].attrs
         self.resampled_nc["latitude"].attrs["comment"] += (
@@ -466,22 +554,19 @@ class Resampler:
             "long_name": "Profile number",
         }
 
-    def add_biolume_proxies(
+    def _biolume_intermediates(
         self,
-        freq,
-        window_size_secs: int = 5,
-        envelope_mini: float = 1.5e10,
-        flash_threshold: float = 1.5e11,
-        proxy_ratio_adinos: float = 3.9811e13,  # 4-Oct-2010 to 2-Dec-2020 value
-        proxy_cal_factor=0.00470,  # Same as used in 5.2-mpm-bg_biolume-PiO-paper.ipynb
-    ) -> None:
-        # Add variables via the calculations according to Appendix B in
-        # "Using fluorescence and bioluminescence sensors to characterize
-        # auto- and heterotrophic plankton communities" by Messie et al."
-        # https://www.sciencedirect.com/science/article/pii/S0079661118300478
-        # Translation to Python demonstrated in notebooks/5.2-mpm-bg_biolume-PiO-paper.ipynb
-
-        self.logger.info("Adding biolume proxy variables computed from biolume_raw")
+        window_size_secs: int,
+        envelope_mini: float,
+        flash_threshold: float,
+        flash_count_seconds: int,
+    ) -> dict:
+        """Return the 60 Hz series from which the biolume proxies are computed.
+        These do not depend on the resample frequency and are computed once
+        per mission.
+        """
+        if self._biolume_cache is not None:
+            return self._biolume_cache
         sample_rate = 60  # Assume all biolume_raw data is sampled at 60 Hz
         window_size = window_size_secs * sample_rate
 
@@ -528,28 +613,76 @@ class Resampler:
         s_nbflash_low.loc[nbflash_low.index] = nbflash_low
 
         # Count the number of flashes per second - use 15 second window stepping every second
-        flash_count_seconds = 15
         flash_window = flash_count_seconds * sample_rate
         self.logger.debug(f"Counting flashes using {flash_count_seconds} second window")
+        nbflash_high_counts = s_nbflash_high.rolling(
+            flash_window, step=1, min_periods=0, center=True
+        ).count()
+        nbflash_low_counts = s_nbflash_low.rolling(
+            flash_window, step=1, min_periods=0, center=True
+        ).count()
+
+        # Flash intensity in ph/s - proxy for small jellies - for entire mission, not just nightime
+        all_raw = self.ds[["biolume_raw"]]["biolume_raw"].to_pandas()
+        med_bg_60 = pd.Series(
+            np.interp(all_raw.index, s_med_bg.index, med_bg),
+            index=all_raw.index,
+        )
+        intflash = (
+            (all_raw - med_bg_60)
+            .rolling(flash_window, min_periods=0, center=True)
+            .max()
+        )
+
+        s_min_bg = min_bg_unsmoothed.rolling(
+            window_size, min_periods=0, center=True
+        ).mean()
+        nighttime_bl_raw, sunset, sunrise = self.select_nighttime_bl_raw()
+
+        self._biolume_cache = {
+            "sample_rate": sample_rate,
+            "s_biolume_raw": s_biolume_raw,
+            "nbflash_high_counts": nbflash_high_counts,
+            "nbflash_low_counts": nbflash_low_counts,
+            "intflash": intflash,
+            "s_min_bg": s_min_bg,
+            "nighttime_bl_raw": nighttime_bl_raw,
+            "sunset": sunset,
+            "sunrise": sunrise,
+        }
+        return self._biolume_cache
+
+    def add_biolume_proxies(
+        self,
+        freq,
+        window_size_secs: int = 5,
+        envelope_mini: float = 1.5e10,
+        flash_threshold: float = 1.5e11,
+        proxy_ratio_adinos: float = 3.9811e13,  # 4-Oct-2010 to 2-Dec-2020 value
+        proxy_cal_factor=0.00470,  # Same as used in 5.2-mpm-bg_biolume-PiO-paper.ipynb
+    ) -> None:
+        # Add variables via the calculations according to Appendix B in
+        # "Using fluorescence and bioluminescence sensors to characterize
+        # auto- and heterotrophic plankton communities" by Messie et al."
+        # https://www.sciencedirect.com/science/article/pii/S0079661118300478
+        # Translation to Python demonstrated in notebooks/5.2-mpm-bg_biolume-PiO-paper.ipynb
+
+        self.logger.info("Adding biolume proxy variables computed from biolume_raw")
+        flash_count_seconds = 15
+        bl = self._biolume_intermediates(
+            window_size_secs, envelope_mini, flash_threshold, flash_count_seconds
+        )
         nbflash_high_counts = (
-            s_nbflash_high.rolling(flash_window, step=1, min_periods=0, center=True)
-            .count()
-            .resample(freq)
-            .mean()
-            / flash_count_seconds
+            bl["nbflash_high_counts"].resample(freq).mean() / flash_count_seconds
         )
         nbflash_low_counts = (
-            s_nbflash_low.rolling(flash_window, step=1, min_periods=0, center=True)
-            .count()
-            .resample(freq)
-            .mean()
-            / flash_count_seconds
+            bl["nbflash_low_counts"].resample(freq).mean() / flash_count_seconds
         )
 
         flow = (
             self.ds[["biolume_flow"]]["biolume_flow"]
             .to_pandas()
-            .resample("1S")
+            .resample(freq)
             .mean()
             .fillna(method="ffill")
         )
@@ -579,19 +712,7 @@ class Resampler:
         self.df_r["biolume_nbflash_low"].attrs["units"] = "flashes/liter"
         self.df_r["biolume_nbflash_low"].attrs["comment"] = zero_note
 
-        # Flash intensity in ph/s - proxy for small jellies - for entire mission, not just nightime
-        all_raw = self.ds[["biolume_raw"]]["biolume_raw"].to_pandas()
-        med_bg_60 = pd.Series(
-            np.interp(all_raw.index, s_med_bg.index, med_bg),
-            index=all_raw.index,
-        )
-        intflash = (
-            (all_raw - med_bg_60)
-            .rolling(flash_window, min_periods=0, center=True)
-            .max()
-            .resample("1S")
-            .mean()
-        )
+        intflash = bl["intflash"].resample(freq).mean()
         self.logger.info(
             "Saving flash intensity: biolume_intflash - the upper bound of the background envelope"
         )
@@ -601,16 +722,14 @@ class Resampler:
         ] = "Flashes intensity (small jellies proxy)"
         self.df_r["biolume_intflash"].attrs["units"] = "photons/s"
         self.df_r["biolume_intflash"].attrs["comment"] = (
-            f" intensity of flashes from {sample_rate} Hz biolume_raw variable"
+            f" intensity of flashes from {bl['sample_rate']} Hz biolume_raw variable"
             f" in {freq} intervals."
         )
 
-        # Make min_bg a 1S pd.Series so that we can divide by flow, matching indexes
-        s_min_bg = min_bg_unsmoothed.rolling(
-            window_size, min_periods=0, center=True
-        ).mean()
+        # Make min_bg a freq pd.Series so that we can divide by flow, matching indexes
+        s_min_bg = bl["s_min_bg"]
         bg_biolume = (
-            pd.Series(s_min_bg, index=s_biolume_raw.index).resample("1S").mean()
+            pd.Series(s_min_bg, index=bl["s_biolume_raw"].index).resample(freq).mean()
         )
         self.logger.info("Saving Background bioluminescence (dinoflagellates proxy)")
         self.df_r["biolume_bg_biolume"] = bg_biolume.divide(flow) * 1000
@@ -620,13 +739,14 @@ class Resampler:
         self.df_r["biolume_bg_biolume"].attrs["units"] = "photons/liter"
         self.df_r["biolume_bg_biolume"].attrs["comment"] = zero_note
 
-        nighttime_bl_raw, sunset, sunrise = self.select_nighttime_bl_raw()
+        nighttime_bl_raw = bl["nighttime_bl_raw"]
+        sunset, sunrise = bl["sunset"], bl["sunrise"]
         if nighttime_bl_raw.empty:
             self.logger.info(
                 "No nighttime_bl_raw data to compute adinos, diatoms, hdinos proxies"
             )
         else:
-            # (2) Phytoplankton proxies - use median filtered hs2_fl700 1S data
+            # (2) Phytoplankton proxies - use median filtered hs2_fl700 data
             if "hs2_fl700" not in self.ds:
                 self.logger.info(
                     "No hs2_fl700 data. Not computing adinos, diatoms, and hdinos"
@@ -648,7 +768,7 @@ class Resampler:
             self.logger.info(f"Using proxy_cal_factor = {proxy_cal_factor:.6f}")
 
             nighttime_bg_biolume = (
-                pd.Series(s_min_bg, index=nighttime_bl_raw.index).resample("1S").mean()
+                pd.Series(s_min_bg, index=nighttime_bl_raw.index).resample(freq).mean()
             )
             nighttime_bg_biolume_perliter = nighttime_bg_biolume.divide(flow) * 1000
             pseudo_fluorescence = nighttime_bg_biolume_perliter / proxy_ratio_adinos
@@ -683,45 +803,58 @@ class Resampler:
         mission_start: pd.Timestamp,
         mission_end: pd.Timestamp,
         instrs_to_pad: Dict[str, timedelta],
-    ) -> None:
-        timevar = f"{instr}_{TIME}"
+    ) -> str:
         if instr == "biolume" and variable == "biolume_raw":
             # Only biolume_avg_biolume and biolume_flow treated like other data
             # All other biolume variables in self.df_r[] are computed from biolume_raw
             self.add_biolume_proxies(freq)
         else:
             self.df_o[variable] = self.ds[variable].to_pandas()
-            self.df_o[f"{variable}_mf"] = (
-                self.ds[variable]
-                .rolling(**{timevar: mf_width}, center=True)
-                .median()
-                .to_pandas()
-            )
-            # Resample to center of freq https://stackoverflow.com/a/69945592/1281657
-            self.logger.info(
-                f"Resampling {variable} with frequency {freq} following {mf_width} point median filter "
-            )
+            factor = self._decimation_factor(variable, freq)
+            if self.args.method == "decimate" and factor > 1:
+                sample_rate = float(
+                    self.ds[variable].attrs["instrument_sample_rate_hz"]
+                )
+                self.logger.info(
+                    f"Decimating {variable} by {factor} from {sample_rate} Hz to frequency {freq}"
+                )
+                instr_data = decimate_series(self.df_o[variable], sample_rate, freq)
+                processing = (
+                    f"decimated from {sample_rate} Hz with resample_poly()"
+                    " anti-aliasing FIR filter"
+                )
+            else:
+                self.df_o[f"{variable}_mf"] = self._median_filtered(variable, mf_width)
+                # Resample to center of freq https://stackoverflow.com/a/69945592/1281657
+                self.logger.info(
+                    f"Resampling {variable} with frequency {freq} following {mf_width} point median filter "
+                )
+                instr_data = self._resample_mean(
+                    f"{variable}_mf", self.df_o[f"{variable}_mf"], freq
+                )
+                processing = (
+                    f"median filtered with {mf_width} samples"
+                    " and resampled with .mean() aggregator"
+                )
             if instr in instrs_to_pad.keys():
                 self.logger.info(
                     f"Padding {variable} with {instrs_to_pad[instr]} of NaNs to the end of mission"
                 )
                 dt_index = pd.date_range(mission_start, mission_end, freq=freq)
                 self.df_r[variable] = pd.Series(np.NaN, index=dt_index)
-                instr_data = (
-                    self.df_o[f"{variable}_mf"]
-                    .shift(0.5, freq=freq)
-                    .resample(freq)
-                    .mean()
-                )
                 self.df_r[variable].loc[instr_data.index] = instr_data
             else:
-                self.df_r[variable] = (
-                    self.df_o[f"{variable}_mf"]
-                    .shift(0.5, freq=freq)
-                    .resample(freq)
-                    .mean()
-                )
-        return ".mean() aggregator"
+                self.df_r[variable] = instr_data
+            return processing
+
+    def _decimation_factor(self, variable: str, freq: str) -> int:
+        """Number of `variable`'s samples per `freq` interval, from its
+        instrument_sample_rate_hz attribute, 0 if unknown"""
+        try:
+            sample_rate = float(self.ds[variable].attrs["instrument_sample_rate_hz"])
+        except (KeyError, ValueError):
+            return 0
+        return int(round(sample_rate * pd.to_timedelta(freq).total_seconds()))
 
     def plot_coordinates(self, instr: str, freq: str, plot_seconds: float) -> None:
         self.logger.info("Plotting resampled data")
@@ -764,7 +897,8 @@ class Resampler:
         df_rp = self.df_r.iloc[:r_end]
 
         # Different freqs on same axes - https://stackoverflow.com/a/13873014/1281657
-        ax = df_op.plot.line(y=[variable, f"{variable}_mf"])
+        filtered = [f"{variable}_mf"] if f"{variable}_mf" in df_op else []
+        ax = df_op.plot.line(y=[variable] + filtered)
         df_rp.plot.line(
             y=[variable],
             ax=ax,
@@ -777,7 +911,7 @@ class Resampler:
         except KeyError:
             units = ""
         ax.set_ylabel(f"{self.ds[variable].attrs['long_name']} ({units})")
-        ax.legend(["Original", "Median Filtered", "Resampled"])
+        ax.legend(["Original"] + ["Median Filtered"] * len(filtered) + ["Resampled"])
         ax.set_xlabel("Time")
         ax.set_title(f"{instr} {variable}")
         plt.show()
@@ -833,12 +967,65 @@ class Resampler:
         self,
         nc_file: str,  # align.nc file
         mf_width: int = MF_WIDTH,
-        freq: str = FREQ,
+        freq: Union[str, List[str]] = FREQ,
         plot_seconds: float = PLOT_SECONDS,
+        selective: bool = True,
     ) -> None:
+        """Resample `nc_file` to each frequency in `freq`, which may be a single
+        frequency or a list of them, writing one _<freq>.nc file for each.
+        The median filtered and biolume intermediates are computed once and
+        shared by all the frequencies.  With `selective` only the variables
+        selected with --sensors or --variables are resampled and merged into
+        the existing files, see selection.py.
+        """
         pd.options.plotting.backend = "matplotlib"
-        self.ds = xr.open_dataset(nc_file)
+        self.ds = open_dataset(nc_file)
+        self._mf_cache = {}
+        self._bin_cache = defaultdict(dict)
+        self._biolume_cache = None
+        self._workers = getattr(self.args, "segment_workers", SEGMENT_WORKERS)
+        self._surfacings = self._read_surfacings(nc_file)
         mission_start, mission_end, instrs_to_pad = self.get_mission_start_end(nc_file)
+        static_metadata = self.metadata.copy()
+        freqs = [freq] if isinstance(freq, str) else list(freq)
+        self.selection = None
+        if selective:
+            self.selection = stage_selection(
+                self.args,
+                [nc_file.replace("_align.nc", f"_{f}.nc") for f in freqs],
+                self.logger,
+            )
+        if self.selection:
+            self._resample_sensors = self.selection.expand(RESAMPLE_DEPENDENCIES)
+        try:
+            # Finest first so that coarser frequencies may be derived from it
+            for freq in sorted(set(freqs), key=pd.to_timedelta):
+                self.metadata = static_metadata.copy()
+                self.resampled_nc = xr.Dataset()
+                self.resample_freq(
+                    nc_file,
+                    mf_width,
+                    freq,
+                    plot_seconds,
+                    mission_start,
+                    mission_end,
+                    instrs_to_pad,
+                )
+        except MergeError as e:
+            self.logger.warning(f"Cannot merge {self.selection}: {e}")
+            self.metadata = static_metadata
+            self.resample_mission(nc_file, mf_width, freqs, plot_seconds, False)
+
+    def resample_freq(
+        self,
+        nc_file: str,
+        mf_width: int,
+        freq: str,
+        plot_seconds: float,
+        mission_start: datetime,
+        mission_end: datetime,
+        instrs_to_pad: Dict[str, timedelta],
+    ) -> None:
         last_instr = ""
         for icount, (instr, variables) in enumerate(
             self.instruments_variables(nc_file).items()
@@ -865,11 +1052,19 @@ class Resampler:
                 self.save_coordinates(instr, mf_width, freq, aggregator)
                 if self.args.plot:
                     self.plot_coordinates(instr, freq, plot_seconds)
+            if self.selection and instr not in self._resample_sensors:
+                continue
             if instr != last_instr:
                 # Start with new dataframes for each instrument
                 self.df_o = pd.DataFrame()
                 self.df_r = pd.DataFrame()
             for variable in variables:
+                if (
+                    self.selection
+                    and instr in self.selection.sensors
+                    and not self.selection.selects(variable)
+                ):
+                    continue
                 if instr == "biolume" and variable == "biolume_raw":
                     # resample_variable() creates new proxy variables not in the original align.nc file
                     self.resample_variable(
@@ -895,7 +1090,7 @@ class Resampler:
                         f"Not saving instrument coordinate variable {variable} to resampled file"
                     )
                 else:
-                    aggregator = self.resample_variable(
+                    processing = self.resample_variable(
                         instr,
                         variable,
                         mf_width,
@@ -911,14 +1106,13 @@ class Resampler:
                         "coordinates"
                     ] = "time depth latitude longitude"
                     self.resampled_nc[variable].attrs["comment"] += (
-                        f" median filtered with {mf_width} samples"
-                        f" and resampled with {aggregator} to {freq} intervals."
+                        f" {processing} to {freq} intervals."
                     )
                     if self.args.plot:
                         self.plot_variable(instr, variable, freq, plot_seconds)
         self.add_profile()
         try:
-            self._build_global_metadata()
+            self._build_global_metadata(freq)
         except KeyError as e:
             self.logger.error(
                 f"Missing global attribute {e} in {nc_file}. "
@@ -933,7 +1127,16 @@ class Resampler:
             "long_name": "Time (UTC)",
         }
         out_fn = nc_file.replace("_align.nc", f"_{freq}.nc")
-        self.resampled_nc.to_netcdf(path=out_fn, format="NETCDF4_CLASSIC")
+        if self.selection:
+            self.resampled_nc = merge_into(out_fn, self.resampled_nc, self.selection)
+        write_dataset(
+            self.resampled_nc,
+            out_fn,
+            getattr(self.args, "storage", STORAGE),
+            getattr(self.args, "encoding", ENCODING),
+            self.logger,
+            format="NETCDF4_CLASSIC",
+        )
         self.logger.info(f"Saved resampled mission to {out_fn}")
 
     def process_command_line(self):
@@ -960,6 +1163,30 @@ class Resampler:
             help="Mission directory, e.g.: 2020.064.10",
         ),
         parser.add_argument("--plot", action="store_true", help="Plot data")
+        parser.add_argument(
+            "--encoding",
+            action="store",
+            choices=ENCODINGS,
+            default=ENCODING,
+            help="Compression and precision of the netCDF file written,"
+            f" default: {ENCODING}, see nc_encoding.py",
+        )
+        parser.add_argument(
+            "--storage",
+            action="store",
+            choices=STORAGES,
+            default=STORAGE,
+            help="Write a netCDF file, a Zarr store or both, default: netcdf",
+        )
+        add_arguments(parser)
+        parser.add_argument(
+            "--segment_workers",
+            action="store",
+            type=int,
+            default=SEGMENT_WORKERS,
+            help="Threads processing the segments of the mission between"
+            " surfacings in parallel, default: 1, see partition.py",
+        )
         parser.add_argument(
             "--plot_seconds",
             action="store",
@@ -977,8 +1204,18 @@ class Resampler:
         parser.add_argument(
             "--freq",
             action="store",
-            default=FREQ,
-            help="Resample freq",
+            nargs="+",
+            default=[FREQ],
+            help="Resample freq, or several to write a file for each, e.g.: 1S 10S 60S",
+        )
+        parser.add_argument(
+            "--method",
+            action="store",
+            choices=("median", "decimate"),
+            default=METHOD,
+            help="median: median filter followed by bin mean (default),"
+            " decimate: anti-aliasing FIR decimation of record variables"
+            " sampled faster than freq, median for the others",
         )
         parser.add_argument(
             "-v",
@@ -0,0 +1,217 @@
+"""
+Reprocess selected sensors or variables of a mission and merge them into
+its existing products.
+
+With --sensors and/or --variables calibrate.py, align.py and resample.py
+recompute only the selected groups of variables, each group being the
+variables of a sensor as named by their prefix, e.g. biolume_raw.  The
+sensors that a selected one needs at each stage are processed with it, e.g.
+any CTD needs navigation and depth to be calibrated, but only the selected
+variables replace those in the existing _cal.nc, _align.nc and _<freq>.nc
+files.  If a product does not exist yet, or the time coordinate of a
+selected sensor changed in a way that cannot be merged, the stage falls
+back to processing all of the sensors.
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+import logging
+import os
+from argparse import ArgumentParser, Namespace
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import xarray as xr
+from lag_estimation import LAG_PAIRS
+from sensor_data import SENSOR_VARIABLES
+from storage import open_dataset, zarr_path
+
+SENSORS = tuple(SENSOR_VARIABLES)
+# Variables of a group that are not named by the sensor
+GROUP_ALIASES = {"nudged": "gps"}
+# Sensors whose calibrated data are needed to calibrate each sensor
+CALIBRATE_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    sensor: ("navigation", "depth")
+    for sensor in SENSORS
+    if sensor not in ("navigation", "depth")
+}
+CALIBRATE_DEPENDENCIES["gps"] = ("navigation",)
+# Reference sensors of the plumbing lags, needed with --estimate_lags
+LAG_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {
+    sensor: (reference.split("_")[0],)
+    for sensor, (_, reference, _) in LAG_PAIRS.items()
+    if not reference.startswith(f"{sensor}_")
+}
+# The biolume proxies are computed from the resampled hs2_fl700
+RESAMPLE_DEPENDENCIES: Dict[str, Tuple[str, ...]] = {"biolume": ("hs2",)}
+# Coordinates of a sensor that are merged with any of its variables
+COORDINATE_SUFFIXES = ("depth", "latitude", "longitude")
+
+logger = logging.getLogger(__name__)
+
+
+class MergeError(Exception):
+    pass
+
+
+def group(variable: str) -> str:
+    "Return the sensor whose group `variable` belongs to"
+    prefix = variable.split("_")[0]
+    return GROUP_ALIASES.get(prefix, prefix)
+
+
+class Selection:
+    """Sensors selected with all of their variables and variables selected
+    by name, whose sensors are also processed"""
+
+    def __init__(
+        self, sensors: Iterable[str] = (), variables: Iterable[str] = ()
+    ) -> None:
+        self.whole = set(sensors or ())
+        self.variables = set(variables or ())
+        self.sensors = self.whole | {group(v) for v in self.variables}
+        unknown = self.sensors - set(SENSORS)
+        if unknown:
+            raise ValueError(f"Unknown sensor(s): {', '.join(sorted(unknown))}")
+
+    def __str__(self) -> str:
+        return ", ".join(sorted(self.whole) + sorted(self.variables))
+
+    def expand(self, dependencies: Dict[str, Iterable[str]]) -> Set[str]:
+        "Return the selected sensors and all of those that they depend on"
+        expanded = set()
+        to_visit = list(self.sensors)
+        while to_visit:
+            sensor = to_visit.pop()
+            if sensor not in expanded:
+                expanded.add(sensor)
+                to_visit.extend(dependencies.get(sensor, ()))
+        return expanded
+
+    def selects(self, variable: str) -> bool:
+        "Return True if `variable` is to be replaced in the products"
+        sensor = group(variable)
+        if sensor in self.whole or variable in self.variables:
+            return True
+        suffix = variable.split("_", 1)[-1]
+        return sensor in self.sensors and suffix in COORDINATE_SUFFIXES
+
+
+def add_arguments(parser: ArgumentParser) -> None:
+    "Add the --sensors and --variables options to `parser`"
+    parser.add_argument(
+        "--sensors",
+        nargs="+",
+        choices=SENSORS,
+        metavar="SENSOR",
+        help="Reprocess only these sensors, and those they depend on, and"
+        " merge them into the existing products, one or more of: "
+        + ", ".join(SENSORS),
+    )
+    parser.add_argument(
+        "--variables",
+        nargs="+",
+        metavar="VARIABLE",
+        help="Reprocess the sensors of these variables, e.g. ctd1_salinity, and"
+        " merge only these variables into the existing products",
+    )
+
+
+def from_args(args: Namespace) -> Optional[Selection]:
+    "Return the Selection of --sensors and --variables, None if neither given"
+    sensors = getattr(args, "sensors", None)
+    variables = getattr(args, "variables", None)
+    if not sensors and not variables:
+        return None
+    return Selection(sensors, variables)
+
+
+def product_exists(path: str) -> bool:
+    "Return True if the product `path` exists as a netCDF file or Zarr store"
+    return os.path.exists(path) or os.path.isdir(zarr_path(path))
+
+
+def stage_selection(
+    args: Namespace, products: Iterable[str], log: logging.Logger = logger
+) -> Optional[Selection]:
+    """Return the Selection of `args` for a stage writing `products`, or None
+    to process all sensors if there is no selection or a product is missing"""
+    selection = from_args(args)
+    if selection is None:
+        return None
+    missing = [path for path in products if not product_exists(path)]
+    if missing:
+        log.info(
+            f"Processing all sensors, not only {selection}, as there is no"
+            f" {', '.join(os.path.basename(path) for path in missing)} to merge into"
+        )
+        return None
+    log.info(f"Reprocessing {selection}")
+    return selection
+
+
+def _replaced_dims(
+    existing: xr.Dataset, new: xr.Dataset, names: List[str], selection: Selection
+) -> Set[str]:
+    """Return the dimensions of `names` whose coordinates differ between
+    `existing` and `new`.  Raises MergeError if variables that are not
+    selected also use one of them."""
+    changed = set()
+    for name in names:
+        for dim in new[name].dims:
+            if dim in changed or dim not in existing.indexes:
+                continue
+            if existing.indexes[dim].equals(new.indexes[dim]):
+                continue
+            others = [
+                var
+                for var in existing.data_vars
+                if dim in existing[var].dims and group(var) not in selection.sensors
+            ]
+            if others:
+                raise MergeError(
+                    f"Coordinate {dim} changed and is also used by {', '.join(others)}"
+                )
+            changed.add(dim)
+    return changed
+
+
+def merge(existing: xr.Dataset, new: xr.Dataset, selection: Selection) -> xr.Dataset:
+    """Return `existing` with its variables selected by `selection` replaced
+    by those of `new`.  All the variables on a time coordinate that changed
+    are replaced, as are all those of a sensor selected as a whole."""
+    names = [name for name in new.data_vars if selection.selects(name)]
+    changed = _replaced_dims(existing, new, names, selection)
+    names += [
+        name
+        for name in new.data_vars
+        if name not in names and set(new[name].dims) & changed
+    ]
+    dropped = [
+        name
+        for name in existing.data_vars
+        if name in names
+        or group(name) in selection.whole
+        or set(existing[name].dims) & changed
+    ]
+    merged = existing.drop_vars(dropped + [dim for dim in changed if dim in existing])
+    merged.update(new[names])
+
+    merged.attrs = dict(existing.attrs)
+    for key, value in new.attrs.items():
+        if key in ("date_update", "date_modified") or group(key) in selection.sensors:
+            merged.attrs[key] = value
+    if "history" in new.attrs:
+        merged.attrs["history"] = (
+            f"{existing.attrs.get('history', '')}. {new.attrs['history']}"
+            f" reprocessing {selection}"
+        ).lstrip(". ")
+    return merged
+
+
+def merge_into(path: str, new: xr.Dataset, selection: Selection) -> xr.Dataset:
+    """Return the product at `path` with the selected variables of `new`
+    merged into it, read into memory so that `path` can be written over"""
+    with open_dataset(path) as existing:
+        existing.load()
+    return merge(existing, new, selection)
@@ -0,0 +1,152 @@
+"""
+Lazy access to the original netCDF files of the sensors of a mission.
+
+Each sensor's file is opened on the first access of its orig_data and only
+the variables that its _*_process() method of Calibrate_NetCDF declares in
+SENSOR_VARIABLES are selected from it.  At most MAX_OPEN_FILES files are
+kept open, the least recently used being closed first, and all are closed
+once the calibrated data are written.  Variables that were loaded lazily
+from a closed file are read again by xarray, which reopens the file.
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import xarray as xr
+
+MAX_OPEN_FILES = 4
+_CTD_VARIABLES = (
+    "temp_frequency",
+    "cond_frequency",
+    "temperature",
+    "conductivity",
+    "salinity",
+    "dissolvedO2",
+    "dissolvedO2_port",
+    "dissolvedO2_stbd",
+    "flow1",
+    "flow2",
+    "transmissometer",
+)
+# Variables read by the processing of each sensor, all variables if None
+SENSOR_VARIABLES: Dict[str, Optional[Tuple[str, ...]]] = {
+    "navigation": (
+        "mPhi",
+        "mTheta",
+        "mPsi",
+        "mPos_x",
+        "mPos_y",
+        "mDepth",
+        "mWaterSpeed",
+        "latitude",
+        "longitude",
+        "latitudeNav",
+        "longitudeNav",
+    ),
+    "gps": ("latitude", "longitude"),
+    "depth": ("depth",),
+    "hs2": None,
+    "ctd1": _CTD_VARIABLES,
+    "ctd2": _CTD_VARIABLES,
+    "seabird25p": _CTD_VARIABLES,
+    "ecopuck": ("BB_Sig", "CDOM_Sig", "Chl_Sig"),
+    "tailcone": ("propRpm",),
+    "lopc": ("LCcount", "countListSum", "flowSpeed", "nonTransCount", "transCount"),
+    "isus": ("isusNitrate", "isusTemp"),
+    "biolume": ("avg_biolume", "flow", "raw"),
+}
+
+logger = logging.getLogger(__name__)
+
+
+class SensorFiles:
+    """Original netCDF files opened on demand, at most `max_open` at a time.
+    The summary attributes of the files opened are collected in `summaries`.
+    """
+
+    def __init__(
+        self, max_open: int = MAX_OPEN_FILES, log: logging.Logger = logger
+    ) -> None:
+        self.max_open = max_open
+        self.logger = log
+        self.summaries: Set[str] = set()
+        # Path: (dataset of the file, dataset of the variables selected)
+        self._open: OrderedDict = OrderedDict()
+
+    def open(self, path: str, variables: Iterable[str] = None) -> xr.Dataset:
+        """Return the dataset of `variables`, or of all variables, of the
+        netCDF file `path`, opening it if it is not open"""
+        if path in self._open:
+            self._open.move_to_end(path)
+            return self._open[path][1]
+        self.logger.debug(f"Opening {path}")
+        ds = xr.open_dataset(path)
+        selected = ds
+        if variables is not None:
+            selected = ds[[name for name in ds.data_vars if name in variables]]
+        try:
+            self.summaries.add(ds.attrs["summary"])
+        except KeyError:
+            self.logger.warning(f"{path}: No summary field")
+        self._open[path] = (ds, selected)
+        while len(self._open) > self.max_open:
+            old_path, (old_ds, _) = self._open.popitem(last=False)
+            self.logger.debug(f"Closing least recently used {old_path}")
+            old_ds.close()
+        return selected
+
+    def close(self) -> None:
+        "Close all the open files"
+        for ds, _ in self._open.values():
+            ds.close()
+        self._open.clear()
+
+    def __len__(self) -> int:
+        return len(self._open)
+
+
+class SensorInfo:
+    """Calibrations and original data of a sensor.  The orig_data of the
+    netCDF file at `path` is opened with `files` on first access, raising
+    AttributeError if the file cannot be opened."""
+
+    def __init__(
+        self,
+        files: SensorFiles = None,
+        path: str = None,
+        variables: Iterable[str] = None,
+    ) -> None:
+        self.files = files
+        self.path = path
+        self.variables = variables
+        self._orig_data = None
+        self._error = None
+
+    @property
+    def orig_data(self) -> xr.Dataset:
+        if self._orig_data is not None:
+            return self._orig_data
+        if self.files is None or self.path is None:
+            raise AttributeError("orig_data")
+        if self._error is None:
+            try:
+                return self.files.open(self.path, self.variables)
+            except (FileNotFoundError, ValueError) as e:
+                self.files.logger.debug(f"Cannot open file {self.path}: {e}")
+                self._error = e
+            except OverflowError as e:
+                self.files.logger.error(f"Cannot open file {self.path}: {e}")
+                self.files.logger.info(
+                    "Perhaps _remove_bad_values() needs to be called for it"
+                    " in logs2netcdfs.py"
+                )
+                self._error = e
+        raise AttributeError(f"orig_data: {self._error}")
+
+    @orig_data.setter
+    def orig_data(self, ds: xr.Dataset) -> None:
+        self._orig_data = ds
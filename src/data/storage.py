@@ -0,0 +1,116 @@
+"""
+Storage backends for the calibrated, aligned and resampled products.
+
+Products are written as netCDF files, as consolidated Zarr stores next to
+them, or both, selected with --storage.  A Zarr store has the same name as
+the netCDF file with a .zarr suffix, e.g. Dorado389_2020.245.00_align.zarr,
+the same CF attributes and the same chunking along time as nc_encoding
+gives the netCDF file, so that single variables and time ranges can be read
+in parallel from an object store or network file system.  The readers use
+open_dataset() which accepts either format.
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+import logging
+import os
+import shutil
+import time
+from typing import Dict
+
+import xarray as xr
+from nc_encoding import COMPLEVEL, ENCODING, xarray_encoding
+from nc_encoding import to_netcdf as write_netcdf
+
+try:
+    import numcodecs
+    import zarr  # noqa: F401 needed by xarray's zarr backend
+except ModuleNotFoundError:
+    # zarr is not installed, will not be able to use --storage zarr
+    zarr = None
+
+STORAGES = ("netcdf", "zarr", "both")
+STORAGE = "netcdf"
+ZARR_SUFFIX = ".zarr"
+
+logger = logging.getLogger(__name__)
+
+
+def zarr_path(nc_path: str) -> str:
+    "Return the path of the Zarr store for netCDF file `nc_path`"
+    return os.path.splitext(nc_path)[0] + ZARR_SUFFIX
+
+
+def zarr_encoding(ds: xr.Dataset, profile: str = ENCODING) -> Dict[str, Dict]:
+    """Return the `encoding` argument of Dataset.to_zarr() equivalent to the
+    netCDF encoding of nc_encoding's `profile`"""
+    encoding = {}
+    for name, var_encoding in xarray_encoding(ds, profile).items():
+        zarr_var = {"chunks": var_encoding["chunksizes"]}
+        zarr_var["compressor"] = numcodecs.Blosc(
+            cname="zlib", clevel=COMPLEVEL, shuffle=numcodecs.Blosc.SHUFFLE
+        )
+        if "dtype" in var_encoding:
+            zarr_var["dtype"] = var_encoding["dtype"]
+        if "least_significant_digit" in var_encoding:
+            zarr_var["filters"] = [
+                numcodecs.Quantize(
+                    var_encoding["least_significant_digit"], dtype=ds[name].dtype
+                )
+            ]
+        encoding[name] = zarr_var
+    return encoding
+
+
+def _size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, file_name))
+        for root, _, file_names in os.walk(path)
+        for file_name in file_names
+    )
+
+
+def write_dataset(
+    ds: xr.Dataset,
+    nc_path: str,
+    storage: str = STORAGE,
+    profile: str = ENCODING,
+    log: logging.Logger = logger,
+    **to_netcdf_kwargs,
+) -> None:
+    """Write `ds` to netCDF file `nc_path` and/or to the Zarr store next to
+    it according to `storage`.  The `to_netcdf_kwargs` apply to the netCDF
+    file only."""
+    if storage in ("netcdf", "both"):
+        write_netcdf(ds, nc_path, profile, log, **to_netcdf_kwargs)
+    if storage in ("zarr", "both"):
+        if zarr is None:
+            raise ModuleNotFoundError(f"zarr is needed for --storage {storage}")
+        store = zarr_path(nc_path)
+        if os.path.exists(store):
+            log.debug(f"Removing {store}")
+            shutil.rmtree(store)
+        w_start = time.time()
+        ds.to_zarr(
+            store,
+            mode="w",
+            consolidated=True,
+            encoding=zarr_encoding(ds, profile),
+        )
+        log.info(
+            f"Wrote {_size(store) / 1.0e6:.1f} MB to {os.path.basename(store)}"
+            f" with {profile} encoding in {time.time() - w_start:.1f} seconds"
+        )
+
+
+def open_dataset(path: str, **kwargs) -> xr.Dataset:
+    """Open the product at `path`, a netCDF file or Zarr store.  If the
+    netCDF file `path` does not exist its Zarr store is opened instead."""
+    if path.endswith(ZARR_SUFFIX):
+        return xr.open_dataset(path, engine="zarr", chunks=None, **kwargs)
+    if not os.path.exists(path) and os.path.isdir(zarr_path(path)):
+        return xr.open_dataset(zarr_path(path), engine="zarr", chunks=None, **kwargs)
+    return xr.open_dataset(path, **kwargs)
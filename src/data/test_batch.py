@@ -0,0 +1,172 @@
+import json
+import os
+import time
+from argparse import Namespace
+
+from batch import (
+    DEFAULT_SECONDS_PER_MB,
+    JOURNAL_DONE,
+    METRICS_FILE,
+    CostModel,
+    MissionJournal,
+)
+from process import Processor
+
+
+class FakeJob(Processor):
+    "Sleeps for each mission the seconds given in its file seconds.txt"
+
+    def process_mission(self, mission: str, src_dir: str = None) -> None:
+        t_start = time.time()
+        with open(os.path.join(src_dir, "seconds.txt")) as fh:
+            time.sleep(float(fh.read()))
+        with open(os.path.join(self.args.base_path, "jobs.jsonl"), "a") as fh:
+            fh.write(json.dumps([mission, t_start, time.time()]) + "\n")
+
+    def archive(self, mission: str) -> None:
+        pass
+
+
+def _args(tmp_path, **kwargs) -> Namespace:
+    args = Namespace(
+        base_path=str(tmp_path),
+        start_year=2020,
+        start_yd=245,
+        end_year=2020,
+        end_yd=250,
+        fresh_start=False,
+        mission_timeout=None,
+        max_tasks_per_child=4,
+        memory_budget_gb=100,
+        oversized_alone=False,
+        no_cleanup=True,
+        verbose=0,
+    )
+    for step in ("download_process", "calibrate", "align", "resample"):
+        setattr(args, step, False)
+    args.archive = args.cleanup = False
+    vars(args).update(kwargs)
+    return args
+
+
+def _missions(tmp_path, seconds: dict, sizes: dict = None) -> dict:
+    "Return the source directories of missions with navigation.log of `sizes`"
+    missions = {}
+    for mission, secs in seconds.items():
+        src_dir = tmp_path / "missionlogs" / mission
+        src_dir.mkdir(parents=True)
+        (src_dir / "seconds.txt").write_text(str(secs))
+        for name, size in (sizes or {}).get(mission, {"navigation.log": 1}).items():
+            with open(src_dir / name, "wb") as fh:
+                fh.truncate(size)
+        missions[mission] = str(src_dir)
+    return missions
+
+
+def _jobs(tmp_path) -> list:
+    try:
+        with open(tmp_path / "jobs.jsonl") as fh:
+            return [json.loads(line) for line in fh]
+    except FileNotFoundError:
+        return []
+
+
+def test_timeout_journal(tmp_path):
+    proc = FakeJob("dorado", str(tmp_path), None)
+    proc.args = _args(tmp_path, mission_timeout=1)
+    missions = _missions(
+        tmp_path, {"2020.245.00": 0, "2020.246.00": 5, "2020.247.00": 0}
+    )
+    proc.run_batch(missions, 2)
+
+    journal = MissionJournal(proc._journal_path())
+    with open(journal.path) as fh:
+        statuses = {e["mission"]: e["status"] for e in map(json.loads, fh)}
+    assert statuses == {
+        "2020.245.00": JOURNAL_DONE,
+        "2020.246.00": "timeout",
+        "2020.247.00": JOURNAL_DONE,
+    }
+    assert [mission for mission, *_ in _jobs(tmp_path)] == [
+        "2020.245.00",
+        "2020.247.00",
+    ]
+
+    # A rerun only processes the mission not done and then removes the journal
+    (tmp_path / "missionlogs" / "2020.246.00" / "seconds.txt").write_text("0")
+    proc.run_batch(missions, 2)
+    assert [mission for mission, *_ in _jobs(tmp_path)][2:] == ["2020.246.00"]
+    assert not os.path.exists(journal.path)
+
+
+def test_cost_model(tmp_path):
+    cost_model = CostModel(str(tmp_path / METRICS_FILE))
+    assert cost_model.seconds_per_byte() == DEFAULT_SECONDS_PER_MB / 1.0e6
+    cost_model.update("2020.245.00", 1_000_000, 10.0)
+    cost_model.update("2020.246.00", 3_000_000, 50.0)
+    cost_model.save()
+
+    cost_model = CostModel(str(tmp_path / METRICS_FILE))
+    assert cost_model.seconds_per_byte() == 60.0 / 4_000_000
+    # Missions timed before keep their time unless their input changed
+    assert cost_model.estimate("2020.245.00", 1_000_000) == 10.0
+    assert cost_model.estimate("2020.245.00", 2_000_000) == 30.0
+    assert cost_model.estimate("2020.247.00", 4_000_000) == 60.0
+
+
+def test_largest_first(tmp_path):
+    proc = FakeJob("dorado", str(tmp_path), None)
+    proc.args = _args(tmp_path)
+    sizes = {"2020.245.00": 1_000, "2020.246.00": 3_000, "2020.247.00": 2_000}
+    missions = _missions(
+        tmp_path,
+        dict.fromkeys(sizes, 0),
+        {mission: {"navigation.log": size} for mission, size in sizes.items()},
+    )
+    # Timed before as taking longer than its input suggests
+    cost_model = CostModel(os.path.join(tmp_path, "dorado", METRICS_FILE))
+    cost_model.update("2019.100.00", 1_000_000_000, 1.0)
+    cost_model.update("2020.245.00", 1_000, 100.0)
+    os.makedirs(os.path.dirname(cost_model.path))
+    cost_model.save()
+    proc.run_batch(missions, 1)
+
+    assert [mission for mission, *_ in _jobs(tmp_path)] == [
+        "2020.245.00",
+        "2020.246.00",
+        "2020.247.00",
+    ]
+    assert set(CostModel(cost_model.path).metrics) == {"2019.100.00", *missions}
+
+
+def test_memory_admission(tmp_path):
+    proc = FakeJob("dorado", str(tmp_path), None)
+    # Room for two of the small missions, estimated at 504 MB, at a time
+    proc.args = _args(tmp_path, memory_budget_gb=1.2)
+    small = {f"2020.24{n}.00": {"navigation.log": 1_000_000} for n in range(5, 9)}
+    # Estimated at 1700 MB
+    large = {"2020.249.00": {"biolume.log": 100_000_000}}
+    missions = _missions(
+        tmp_path, dict.fromkeys([*small, *large], 0.5), {**small, **large}
+    )
+    proc.run_batch(missions, 3)
+    jobs = _jobs(tmp_path)
+    assert sorted(mission for mission, *_ in jobs) == sorted(small)
+    for _, t_start, _ in jobs:
+        assert sum(start <= t_start < end for _, start, end in jobs) <= 2
+    with open(proc._journal_path()) as fh:
+        statuses = {e["mission"]: e["status"] for e in map(json.loads, fh)}
+    assert statuses["2020.249.00"] == "too_large"
+
+    # Processed alone with --oversized_alone
+    os.remove(tmp_path / "jobs.jsonl")
+    proc.args.oversized_alone = proc.args.fresh_start = True
+    proc.run_batch(missions, 3)
+    jobs = _jobs(tmp_path)
+    assert len(jobs) == len(missions)
+    ((_, start, end),) = [job for job in jobs if job[0] in large]
+    assert all(
+        t_end <= start or t_start >= end
+        for mission, t_start, t_end in jobs
+        if mission in small
+    )
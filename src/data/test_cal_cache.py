@@ -0,0 +1,82 @@
+import logging
+
+import cal_cache
+from cal_cache import CalibrationCache
+from calibrate import Calibrate_NetCDF, Coeffs
+from hs2_proc import hs2_read_cal_file
+
+DEV = """ECO\tFLBBCD2K-3695
+Created on:\t{date}
+
+COLUMNS=9
+CHL=4\t\t{chl}\t\t45
+Lambda=6\t1.633E-06\t46\t700\t700
+CDOM=8\t\t0.0909\t\t45
+"""
+HS2 = """[General]
+Serial=H2D021004
+[Channel 1]
+SigmaExp=0.145
+[Channel 2]
+SigmaExp=0.153
+[End]
+"""
+
+
+def test_load(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(cal_cache, "_memory", {})
+    cache_dir = str(tmp_path / "cache")
+    cal_netcdf = Calibrate_NetCDF()
+    parsed = []
+
+    def _read_eco_dev(dev_filename):
+        parsed.append(dev_filename)
+        return cal_netcdf._read_eco_dev(dev_filename)
+
+    for mission, chl in (("2020.245.00", 0.0073), ("2020.246.00", 0.0073)):
+        (tmp_path / mission).mkdir()
+        (tmp_path / mission / "FLBBCD2K-3695.dev").write_text(
+            DEV.format(chl=chl, date="10/29/2014")
+        )
+    for mission in ("2020.245.00", "2020.246.00"):
+        # A new cache, as in another worker process, reads the parsed file
+        cals = CalibrationCache(cache_dir).load(
+            str(tmp_path / mission / "FLBBCD2K-3695.dev"), _read_eco_dev, Coeffs
+        )
+        monkeypatch.setattr(cal_cache, "_memory", {})
+        assert isinstance(cals, Coeffs)
+        assert cals.chl_scale_factor == 0.0073
+        assert cals.cdom_dark_counts == 45.0
+    assert len(parsed) == 1
+
+    # Another date with the same coefficients is not a conflict
+    (tmp_path / "2020.300.00").mkdir()
+    dev_file = tmp_path / "2020.300.00" / "FLBBCD2K-3695.dev"
+    dev_file.write_text(DEV.format(chl=0.0073, date="10/30/2014"))
+    with caplog.at_level(logging.WARNING):
+        CalibrationCache(cache_dir).load(str(dev_file), _read_eco_dev, Coeffs)
+    assert len(parsed) == 2
+    assert "serial number" not in caplog.text
+    assert CalibrationCache(cache_dir).conflicts() == {}
+
+    (tmp_path / "2021.001.00").mkdir()
+    dev_file = tmp_path / "2021.001.00" / "FLBBCD2K-3695.dev"
+    dev_file.write_text(DEV.format(chl=0.0081, date="10/29/2014"))
+    with caplog.at_level(logging.WARNING):
+        cals = CalibrationCache(cache_dir).load(str(dev_file), _read_eco_dev, Coeffs)
+    assert cals.chl_scale_factor == 0.0081
+    assert "serial number FLBBCD2K-3695" in caplog.text
+    (conflict,) = CalibrationCache(cache_dir).conflicts().values()
+    assert len(conflict) == 3
+
+
+def test_load_hs2(tmp_path, monkeypatch):
+    monkeypatch.setattr(cal_cache, "_memory", {})
+    cal_file = tmp_path / "hs2Calibration.dat"
+    cal_file.write_text(HS2)
+    cache = CalibrationCache()
+    cals = cache.load(str(cal_file), hs2_read_cal_file)
+    assert cals == hs2_read_cal_file(str(cal_file))
+    # Each call returns a copy that can be changed without affecting others
+    cals["Ch1"]["SigmaExp"] = "0"
+    assert cache.load(str(cal_file), hs2_read_cal_file)["Ch1"]["SigmaExp"] == "0.145"
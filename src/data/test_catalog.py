@@ -0,0 +1,47 @@
+import os
+import shutil
+import time
+
+from catalog import MissionCatalog
+
+
+def _make_mission(root, mission: str) -> str:
+    path = os.path.join(root, "".join(mission.split(".")[:2]), mission)
+    os.makedirs(path)
+    with open(os.path.join(path, "navigation.log"), "wb") as fh:
+        fh.write(b"\0" * 10)
+    return path
+
+
+def test_refresh(tmp_path):
+    root = str(tmp_path / "missionlogs")
+    for mission in ("2020.245.00", "2020.245.01", "2021.062.01"):
+        _make_mission(root, mission)
+    catalog = MissionCatalog(str(tmp_path / "catalog.sqlite"), root, "dorado")
+    assert catalog.refresh() == 3  # The root and the two year day directories
+    assert list(catalog.missions(2020, 2021)) == [
+        "2020.245.00",
+        "2020.245.01",
+        "2021.062.01",
+    ]
+    assert list(catalog.missions(2021, 2021)) == ["2021.062.01"]
+
+    # Only the directory with a new mission is listed again
+    path = _make_mission(root, "2021.062.02")
+    os.utime(os.path.join(root, "2020245", "2020.245.00"), (0, 0))
+    assert catalog.refresh() == 1
+    assert catalog.path("2021.062.02") == path
+    assert list(catalog.missions(2020, 2021, since=time.time() - 3600)) == [
+        "2020.245.01",
+        "2021.062.01",
+        "2021.062.02",
+    ]
+
+    shutil.rmtree(os.path.join(root, "2020245", "2020.245.01"))
+    assert catalog.refresh() == 1
+    assert catalog.path("2020.245.01") is None
+
+    catalog.record_stage("2021.062.02", "calibrate")
+    catalog.record_stage("2021.062.02", "align")
+    assert catalog.last_stage("2021.062.02") == "align"
+    assert catalog.last_stage("2020.245.00") is None
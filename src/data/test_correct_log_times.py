@@ -0,0 +1,86 @@
+import struct
+from argparse import Namespace
+
+import numpy as np
+from correct_log_times import TimeCorrect
+
+HEADER = (
+    "# binary navigation.log\n"
+    "# timeTag time , Time, seconds since 1970-01-01\n"
+    "# double depth , Depth, m\n"
+    "# float depth , Depth, m\n"
+    "# short mode , Mode, n/a\n"
+    "# integer count , Count, n/a\n"
+    "# begin\n"
+)
+
+
+def test_add_and_write(tmp_path):
+    values = [(1.6e9 + i, 10.0 + i, 11.5 + i, i, 1000 * i) for i in range(1000)]
+    log = tmp_path / "navigation.log"
+    with open(log, "wb") as fh:
+        fh.write(HEADER.encode())
+        for record in values:
+            fh.write(struct.pack("<ddfhi", *record))
+        fh.write(b"\x00\x01\x02")  # Partial record
+    tc = TimeCorrect()
+    tc.args = Namespace(add_seconds=3600.25)
+
+    header, data = tc.read(str(log))
+    assert header == HEADER.encode()
+    assert data.dtype.names == ("time", "depth1", "depth2", "mode", "count")
+    assert len(data) == 1000
+    (tmp_path / "new").mkdir()
+    tc._add_and_write(header, data, str(tmp_path / "new"), "navigation.log")
+
+    new_log = tmp_path / "new" / "navigation.log"
+    expected = HEADER.encode() + b"".join(
+        struct.pack("<ddfhi", t + 3600.25, *others) for t, *others in values
+    )
+    assert new_log.read_bytes() == expected
+    _, new_data = tc.read(str(new_log))
+    np.testing.assert_array_equal(new_data["count"], np.arange(1000) * 1000)
+
+
+def _write_log(path, fields, records):
+    header = "# binary log\n"
+    header += "".join(f"# {t} {n} , {n}, n/a\n" for t, n in fields)
+    header += "# begin\n"
+    fmt = "<" + "".join("d" if t in ("timeTag", "double") else "f" for t, _ in fields)
+    with open(path, "wb") as fh:
+        fh.write(header.encode())
+        fh.write(b"".join(struct.pack(fmt, *record) for record in records))
+
+
+def test_estimate_offsets(tmp_path):
+    rng = np.random.default_rng(42)
+    logs_dir = tmp_path / "Dorado389" / "missionlogs" / "2020.245.00"
+    logs_dir.mkdir(parents=True)
+    times = 1.6e9 + np.arange(0, 7200, 0.5)
+    depths = 50 + 40 * np.sin(2 * np.pi * times / 600) * np.sin(times / 2000)
+    depths += np.cumsum(rng.normal(0, 0.05, times.size))
+    _write_log(
+        logs_dir / "parosci.log",
+        [("timeTag", "time"), ("double", "depth")],
+        zip(times, depths),
+    )
+    # The instrument's clock is 37.3 seconds behind the vehicle's
+    _write_log(
+        logs_dir / "seabird25p.log",
+        [("timeTag", "time"), ("float", "temperature"), ("float", "pressure")],
+        zip(times[::3] - 37.3, np.ones(times.size), 1.01 * depths[::3]),
+    )
+    _write_log(
+        logs_dir / "gps.log", [("timeTag", "time"), ("double", "latitude")], []
+    )
+    tc = TimeCorrect()
+    tc.args = Namespace(
+        base_path=str(tmp_path), auv_name="Dorado389", mission="2020.245.00"
+    )
+
+    (estimate,) = tc.estimate_offsets()
+    assert estimate.log == "seabird25p.log"
+    assert estimate.reference == "parosci.log"
+    assert abs(estimate.offset - 37.3) < 0.1
+    assert estimate.confidence > 0.99
+    assert tc.estimated_offsets() == {"seabird25p.log": estimate.offset}
@@ -1,7 +1,7 @@
 import numpy as np
 
 from calibrate import Calibrate_NetCDF
-from ctd_proc import _calibrated_O2_from_volts, _oxsat
+from ctd_proc import CTDKernel, _calibrated_O2_from_volts, _oxsat
 
 
 def test_oxsat(mission_data):
@@ -101,3 +101,22 @@ def test_calibrated_O2_from_volts(mission_data):
         np.array([278.93817, 278.80129, 278.22544, 277.79378]),
         atol=1e-1,
     )
+
+
+def test_ctd_kernel(mission_data):
+    # The shared terms of the kernel must give the same oxygen as computing
+    # each of them for the dissolvedO2 sensor alone
+    md = mission_data
+    kernel = CTDKernel(
+        md.args, md.combined_nc, md.logger, md.ctd1.cals, md.ctd1.orig_data
+    )
+    expected = _calibrated_O2_from_volts(
+        md.combined_nc,
+        md.ctd1.cals,
+        md.ctd1.orig_data,
+        "dissolvedO2",
+        kernel.temperature,
+        kernel.salinity,
+    )
+    for values, expected_values in zip(kernel.oxygen("dissolvedO2"), expected):
+        np.testing.assert_array_equal(values, expected_values)
@@ -0,0 +1,29 @@
+import numpy as np
+from depth_engine import butter_sos, interp_extrapolate, zero_phase_filter
+from scipy import signal
+from scipy.interpolate import interp1d
+
+
+def test_zero_phase_filter():
+    rng = np.random.default_rng(0)
+    depth = 50 + rng.normal(size=5000).cumsum()
+    pres = 1.01 * depth
+    filtered = zero_phase_filter(np.vstack((pres, depth)), 10.0, 1)
+    b, a = signal.butter(8, 1 / 5.0)
+    assert np.allclose(filtered[0], signal.filtfilt(b, a, pres))
+    assert np.allclose(filtered[1], signal.filtfilt(b, a, depth))
+    assert butter_sos(1, 10.0) is butter_sos(1, 10.0)
+
+
+def test_interp_extrapolate():
+    xp = np.datetime64("2020-09-01") + np.arange(0, 10000, 100).astype(
+        "timedelta64[ms]"
+    )
+    fp = np.sin(np.arange(xp.size) / 7)
+    x = np.datetime64("2020-08-31T23:59:58") + np.arange(0, 15000, 33).astype(
+        "timedelta64[ms]"
+    )
+    expected = interp1d(
+        xp.astype("datetime64[ns]").tolist(), fp, fill_value="extrapolate"
+    )(x.astype("datetime64[ns]").tolist())
+    assert np.allclose(interp_extrapolate(x, xp, fp), expected, rtol=0, atol=1e-12)
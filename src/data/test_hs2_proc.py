@@ -1,12 +1,18 @@
 import numpy as np
 import pytest
 from calibrate import Calibrate_NetCDF
-from hs2_proc import typ_absorption, purewater_scatter, _get_gains, hs2_calc_bb
+from hs2_proc import typ_absorption, purewater_scatter, _get_gains, hs2_calc_bb, _int_signer
 
 def test_typ_absorption():
     assert round(typ_absorption(420), 4) == 0.0235
     assert round(typ_absorption(470), 4) == 0.0179
 
+def test_int_signer():
+    ints = np.array([0, 1, 32767, 32768, 65534, 65535])
+    assert np.array_equal(_int_signer(ints), [0, 1, 32767, -32768, -2, -1])
+    signed = _int_signer(np.array([1.0, 40000.0, np.nan]))
+    assert np.array_equal(signed, [1, -25536, np.nan], equal_nan=True)
+
 def test_purewater_scatter():
 
     # Matlab RunReprocess on 2020.245.00
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from lag_estimation import LagEstimate, apply_lag, estimate_lag
+
+
+def _dataset(lag_secs):
+    rng = np.random.default_rng(1)
+    seconds = np.arange(0, 6 * 3600, 1.0)
+    depth = 40 + 35 * np.sin(2 * np.pi * seconds / 900)
+
+    def profile(depth):
+        # A thermocline and a chlorophyll maximum
+        return 10 + 4 * np.tanh((25 - depth) / 3), np.exp(-(((depth - 30) / 5) ** 2))
+
+    temperature, fl700 = profile(depth)
+    _, lagged_chl = profile(np.interp(seconds - lag_secs, seconds, depth))
+    times = pd.Timestamp("2020-09-01") + pd.to_timedelta(seconds, "s")
+    ds = xr.Dataset()
+    for name, values in (
+        ("navigation_depth", depth),
+        ("ctd1_temperature", temperature),
+        ("hs2_fl700", fl700),
+        ("ecopuck_chl", 3 * lagged_chl + rng.normal(0, 0.01, seconds.size)),
+    ):
+        sensor = name.split("_")[0]
+        ds[name] = xr.DataArray(
+            values, coords=[times], dims=[f"{sensor}_time"], name=name
+        )
+    ds["ecopuck_chl"].attrs["comment"] = "Chl_Sig from FLBBCD2K.nc"
+    return ds
+
+
+def test_estimate_lag():
+    ds = _dataset(lag_secs=4.5)
+    estimate = estimate_lag(ds, "ecopuck")
+    assert estimate.n_profiles > 40
+    assert abs(estimate.lag_secs - 4.5) < 0.1
+    assert estimate.ci[0] <= estimate.lag_secs <= estimate.ci[1]
+    assert not estimate.within_sensor
+    assert estimate_lag(ds, "biolume") is None
+
+    lagged = apply_lag(ds, estimate)
+    shift = ds["ecopuck_time"].values - lagged["ecopuck_time"].values
+    assert np.allclose(shift / np.timedelta64(1, "s"), round(estimate.lag_secs, 3))
+    assert np.array_equal(ds["hs2_time"].values, lagged["hs2_time"].values)
+    assert "plumbing lag correction" in lagged["ecopuck_chl"].attrs["comment"]
+    again = estimate_lag(lagged, "ecopuck", applied_secs=estimate.lag_secs)
+    assert abs(again.lag_secs - estimate.lag_secs) < 0.1
+
+    ctd = LagEstimate("ctd1", "ctd1_conductivity", "ctd1_temperature", 1, (0, 2), 3, 4)
+    assert ctd.within_sensor
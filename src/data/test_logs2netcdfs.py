@@ -0,0 +1,185 @@
+import json
+import os
+import time
+from argparse import Namespace
+
+import logs2netcdfs
+from deployment_index import INDEX_TTL, DeploymentIndex
+from logs2netcdfs import PART_SUFFIX, PART_VALIDATORS, AUV_NetCDF
+
+
+def test_portal_download(portal_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(logs2netcdfs, "BACKOFF", 0.01)
+    auv_netcdf = AUV_NetCDF()
+    auv_netcdf.args = Namespace(
+        base_path=str(tmp_path),
+        portal=portal_server["url"],
+        download_concurrency=2,
+        verbose=0,
+    )
+    auv_netcdf.set_portal()
+    logs_dir = os.path.join(tmp_path, "2020.245.00")
+    auv_netcdf._portal_download(logs_dir, name="2020.245.00", vehicle="dorado")
+
+    for file_name, data in portal_server["files"].items():
+        with open(os.path.join(logs_dir, file_name), "rb") as fh:
+            assert fh.read() == data
+    assert not [f for f in os.listdir(logs_dir) if f.endswith(PART_SUFFIX)]
+    # Every file was disconnected half way and resumed from where it stopped
+    assert sorted(portal_server["ranges"]) == sorted(
+        (file_name, f"bytes={len(data) // 2}-")
+        for file_name, data in portal_server["files"].items()
+    )
+    assert portal_server["max_active"] <= 2
+
+
+def test_conditional_download(portal_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(logs2netcdfs, "BACKOFF", 0.01)
+    auv_netcdf = AUV_NetCDF()
+    auv_netcdf.args = Namespace(
+        base_path=str(tmp_path), portal=portal_server["url"], verbose=0
+    )
+    auv_netcdf.set_portal()
+    logs_dir = os.path.join(tmp_path, "2020.245.00")
+    changed = auv_netcdf._portal_download(logs_dir, "2020.245.00", "dorado")
+    assert changed == set(portal_server["files"])
+
+    # Nothing is downloaded again until a file changes on the portal
+    portal_server["statuses"].clear()
+    changed = auv_netcdf._portal_download(logs_dir, "2020.245.00", "dorado")
+    assert changed == set()
+    assert {status for _, status in portal_server["statuses"]} == {304}
+
+    portal_server["files"]["gps.log"] = b"new data"
+    changed = auv_netcdf._portal_download(logs_dir, "2020.245.00", "dorado")
+    assert changed == {"gps.log"}
+    with open(os.path.join(logs_dir, "gps.log"), "rb") as fh:
+        assert fh.read() == b"new data"
+
+
+def test_convert_as_downloaded(portal_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(logs2netcdfs, "BACKOFF", 0.01)
+    auv_netcdf = AUV_NetCDF()
+    auv_netcdf.args = Namespace(
+        base_path=str(tmp_path), portal=portal_server["url"], verbose=0
+    )
+    auv_netcdf.set_portal()
+    logs_dir = os.path.join(tmp_path, "2020.245.00")
+    converted = []
+
+    def convert(log, changed):
+        # The log is complete on disk when handed over for conversion
+        assert os.path.getsize(os.path.join(logs_dir, log)) == len(
+            portal_server["files"][log]
+        )
+        converted.append((log, changed))
+
+    auv_netcdf._portal_download(logs_dir, "2020.245.00", "dorado", convert)
+    assert sorted(converted) == [
+        ("biolume.log", True),
+        ("gps.log", True),
+        ("navigation.log", True),
+    ]
+
+
+def test_resume_changed_file(portal_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(logs2netcdfs, "BACKOFF", 0.01)
+    auv_netcdf = AUV_NetCDF()
+    auv_netcdf.args = Namespace(
+        base_path=str(tmp_path), portal=portal_server["url"], verbose=0
+    )
+    auv_netcdf.set_portal()
+    logs_dir = os.path.join(tmp_path, "2020.245.00")
+    os.makedirs(logs_dir)
+    # Left by an earlier run before the file changed on the portal
+    gps_log = os.path.join(logs_dir, "gps.log")
+    with open(gps_log + PART_SUFFIX, "wb") as fh:
+        fh.write(b"old data")
+    with open(gps_log + PART_VALIDATORS, "w") as fh:
+        json.dump({"etag": '"old"', "last_modified": None}, fh)
+    auv_netcdf._portal_download(logs_dir, "2020.245.00", "dorado")
+
+    with open(gps_log, "rb") as fh:
+        assert fh.read() == portal_server["files"]["gps.log"]
+    assert not os.path.exists(gps_log + PART_VALIDATORS)
+
+
+def test_manifest_download(portal_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(logs2netcdfs, "BACKOFF", 0.01)
+    portal_server["files"]["mission.xml"] = b"not read by the processing"
+    auv_netcdf = AUV_NetCDF()
+    auv_netcdf.args = Namespace(
+        base_path=str(tmp_path), portal=portal_server["url"], verbose=0
+    )
+    auv_netcdf.set_portal()
+    logs_dir = os.path.join(tmp_path, "2020.245.00")
+    auv_netcdf._portal_download(logs_dir, "2020.245.00", "Dorado389")
+    assert "mission.xml" not in os.listdir(logs_dir)
+    assert "navigation.log" in os.listdir(logs_dir)
+
+    auv_netcdf.args.include_all = True
+    auv_netcdf._portal_download(logs_dir, "2020.245.00", "Dorado389")
+    assert "mission.xml" in os.listdir(logs_dir)
+
+
+def test_deployment_index(portal_server, tmp_path):
+    index_file = os.path.join(tmp_path, "index.json")
+    index = DeploymentIndex(portal_server["url"], index_file)
+    assert index.vehicles() == {"dorado", "i2map"}
+    items = index.deployments_between("20200902", "20200902")
+    assert [item["name"] for item in items] == ["2020.246.00", "2020.246.01"]
+    index.prefetch_files([(item["vehicle"], item["name"]) for item in items])
+    assert index.files("dorado", "2020.246.01") == list(portal_server["files"])
+    assert len(portal_server["requests"]) == 3
+
+    # A new index from the same file makes no requests until the TTL expires
+    index = DeploymentIndex(portal_server["url"], index_file)
+    index.vehicles()
+    index.files("i2map", "2020.246.00")
+    assert len(portal_server["requests"]) == 3
+    portal_server["deployments"].append({"vehicle": "dorado", "name": "2020.247.00"})
+    index = DeploymentIndex(portal_server["url"], index_file, ttl=0)
+    assert len(index.deployments_between("20200901", "20200903")) == 4
+    # Only the deployments since the last refresh are requested
+    assert "?from=" in portal_server["requests"][-1]
+
+
+def test_deployment_index_merge(tmp_path):
+    index_file = str(tmp_path / "deployment_index.json")
+    # Two worker processes that read the index before either saved it
+    first = DeploymentIndex("http://portal", index_file)
+    second = DeploymentIndex("http://portal", index_file)
+    first.index["files"]["dorado/2020.245.00"] = {"fetched": 1.0, "names": ["a"]}
+    second.index["files"]["dorado/2020.246.00"] = {"fetched": 2.0, "names": ["b"]}
+    first.save()
+    second.save()
+    assert set(DeploymentIndex("http://portal", index_file).file_lists()) == {
+        "dorado/2020.245.00",
+        "dorado/2020.246.00",
+    }
+    assert [f for f in os.listdir(tmp_path) if f.endswith(".tmp")] == []
+
+
+def test_deployment_index_expiry(portal_server, tmp_path):
+    index_file = os.path.join(tmp_path, "index.json")
+    index = DeploymentIndex(portal_server["url"], index_file)
+    # Fetched long after the missions, so kept until forgotten
+    fetched = time.time() - 2 * INDEX_TTL
+    index.index["files"]["dorado/2020.245.00"] = {"fetched": fetched, "names": ["a"]}
+    index.index["files"]["dorado/2020.246.00"] = {"fetched": fetched, "names": []}
+    index.index["files"]["i2map/2020.246.00"] = {"fetched": fetched, "names": ["c"]}
+    index.save()
+    assert index.files("dorado", "2020.245.00") == ["a"]
+    # An empty file list is requested again once the TTL expires
+    assert index.files("dorado", "2020.246.00") == list(portal_server["files"])
+    assert len(portal_server["requests"]) == 1
+    # And with a TTL of 0 any file list, but only once
+    index = DeploymentIndex(portal_server["url"], index_file, ttl=0)
+    assert index.files("dorado", "2020.245.00") == list(portal_server["files"])
+    index.files("dorado", "2020.245.00")
+    assert len(portal_server["requests"]) == 2
+
+    DeploymentIndex(portal_server["url"], index_file).forget("Dorado")
+    assert set(DeploymentIndex(portal_server["url"], index_file).file_lists()) == {
+        "i2map/2020.246.00"
+    }
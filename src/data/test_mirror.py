@@ -0,0 +1,35 @@
+import os
+
+from mirror import TMP_SUFFIX, mirror
+
+
+def test_mirror(tmp_path):
+    src = tmp_path / "src"
+    dst = tmp_path / "dst"
+    (src / "sub").mkdir(parents=True)
+    (src / "navigation.log").write_bytes(b"n" * 100_000)
+    (src / "gps.log").write_bytes(b"g" * 1000)
+    (src / "sub" / "vehicle.cfg").write_bytes(b"c" * 10)
+
+    report = mirror(str(src), str(dst), buffer_size=4096)
+    assert report.ok
+    assert sorted(report.copied) == ["gps.log", "navigation.log", "sub/vehicle.cfg"]
+    assert report.bytes_copied == 101_010
+    assert (dst / "sub" / "vehicle.cfg").read_bytes() == b"c" * 10
+    assert os.path.getmtime(dst / "gps.log") == os.path.getmtime(src / "gps.log")
+
+    # Only changed files are copied, and only the names asked for
+    (src / "gps.log").write_bytes(b"G" * 1001)
+    report = mirror(str(src), str(dst), ["gps.log", "navigation.log", "lopc.bin"])
+    assert report.copied == ["gps.log"]
+    assert report.skipped == ["navigation.log"]
+    assert report.missing == ["lopc.bin"]
+
+    # Same size and modification time but different content
+    stat = os.stat(src / "navigation.log")
+    (dst / "navigation.log").write_bytes(b"x" * 100_000)
+    os.utime(dst / "navigation.log", ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert mirror(str(src), str(dst)).copied == []
+    assert mirror(str(src), str(dst), checksum=True).copied == ["navigation.log"]
+    assert (dst / "navigation.log").read_bytes() == b"n" * 100_000
+    assert not [f for f in os.listdir(dst) if f.endswith(TMP_SUFFIX)]
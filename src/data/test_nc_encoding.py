@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+from nc_encoding import to_netcdf, xarray_encoding
+
+
+def test_encoding_profiles(tmp_path):
+    time = pd.date_range("2020-09-01", periods=20000, freq="100ms")
+    rng = np.random.default_rng(1)
+    ds = xr.Dataset(
+        {
+            "ctd1_temperature": (
+                "ctd1_time",
+                12 + rng.normal(size=time.size).cumsum() / 100,
+            ),
+            "ctd1_latitude": ("ctd1_time", np.linspace(36.8, 36.9, time.size)),
+            "ctd1_flag": ("ctd1_time", np.zeros(time.size, dtype=np.int32)),
+        },
+        coords={"ctd1_time": time},
+    )
+    encoding = xarray_encoding(ds, "zlib")
+    # Chunks hold an hour of the 10 Hz data
+    assert encoding["ctd1_temperature"]["chunksizes"] == (20000,)
+    assert "ctd1_time" not in encoding
+
+    sizes = {}
+    for profile in ("none", "zlib", "lossy", "float32"):
+        path = os.path.join(tmp_path, f"{profile}.nc")
+        to_netcdf(ds, path, profile)
+        sizes[profile] = os.path.getsize(path)
+        with xr.open_dataset(path) as written:
+            assert (written["ctd1_time"] == ds["ctd1_time"]).all()
+            if profile in ("none", "zlib"):
+                xr.testing.assert_identical(written, ds)
+            elif profile == "lossy":
+                np.testing.assert_allclose(
+                    written["ctd1_temperature"], ds["ctd1_temperature"], atol=1e-4
+                )
+                np.testing.assert_allclose(
+                    written["ctd1_latitude"], ds["ctd1_latitude"], atol=1e-6
+                )
+            else:
+                assert written["ctd1_temperature"].encoding["dtype"] == np.float32
+                assert written["ctd1_flag"].dtype == np.int32
+    assert sizes["zlib"] < sizes["none"]
+    assert sizes["lossy"] < sizes["zlib"]
+    assert sizes["float32"] < sizes["zlib"]
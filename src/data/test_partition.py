@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import partition
+import xarray as xr
+from partition import (
+    bin_sums,
+    interp_segments,
+    rolling_median,
+    segment_edges,
+    surfacing_bounds,
+)
+from scipy.interpolate import interp1d
+
+
+def test_segments_match_serial(monkeypatch):
+    monkeypatch.setattr(partition, "MIN_SEGMENT_POINTS", 100)
+    rng = np.random.default_rng(2)
+    start = np.datetime64("2020-09-01T23:40:00", "ns")
+    steps = rng.integers(100_000_000, 400_000_000, size=20000)
+    times = start + np.cumsum(steps).astype("timedelta64[ns]")
+    # Three surfacings with GPS fixes every 10 seconds
+    fixes = np.arange(0, 60, 10) * np.timedelta64(1, "s")
+    gps_times = np.concatenate(
+        [start + fixes, times[5000] + fixes, times[12000] + fixes]
+    )
+    bounds = surfacing_bounds(gps_times)
+    assert list(bounds) == [start + fixes[-1], times[5000] + fixes[-1]]
+    edges = segment_edges(times, bounds)
+    assert len(edges) == 4
+    assert times[edges[2] - 1] <= bounds[1] < times[edges[2]]
+
+    values = rng.normal(size=times.size)
+    values[rng.integers(0, times.size, 50)] = np.nan
+    da = xr.DataArray(values, coords={"ctd1_time": times}, dims="ctd1_time")
+    serial = da.rolling(ctd1_time=3, center=True).median().to_pandas()
+    pd.testing.assert_series_equal(
+        rolling_median(da, 3, bounds, workers=3), serial, check_exact=True
+    )
+
+    nanosecs = times.view(np.int64)
+    interp = interp1d(nanosecs[::7].tolist(), values[::7], fill_value="extrapolate")
+    np.testing.assert_array_equal(
+        interp_segments(interp, times, bounds, workers=3), interp(nanosecs.tolist())
+    )
+
+    for freq in ("1S", "60S", "7S"):
+        sums, counts = bin_sums(serial, freq, bounds, workers=3)
+        resampler = serial.shift(0.5, freq=freq).resample(freq)
+        pd.testing.assert_series_equal(sums, resampler.sum(), check_exact=True)
+        pd.testing.assert_series_equal(counts, resampler.count(), check_exact=True)
@@ -0,0 +1,109 @@
+import os
+import time
+from argparse import Namespace
+
+from align import InvalidCalFile
+from archive import LOG_NAME
+from batch import JOURNAL_DONE
+from logs2netcdfs import MISSIONNETCDFS
+from pipeline import PipelineScheduler, dependencies, mission_stages
+from process import Processor
+
+
+class StageRecorder(Processor):
+    "Records the stages run in the processing log of each mission"
+
+    def _record(self, stage: str, mission: str) -> None:
+        self.logger.info("%s of %s", stage, mission)
+        if stage == "align" and mission == "2020.245.00":
+            raise InvalidCalFile("No nudged_latitude data")
+
+    def download_process(self, mission: str, src_dir: str) -> None:
+        self._record("download_process", mission)
+        if src_dir == "stalled":
+            time.sleep(3)
+
+    def calibrate(self, mission: str) -> None:
+        self._record("calibrate", mission)
+
+    def align(self, mission: str) -> None:
+        self._record("align", mission)
+
+    def resample(self, mission: str) -> None:
+        self._record("resample", mission)
+
+    def archive(self, mission: str) -> None:
+        self._record("archive", mission)
+
+    def cleanup(self, mission: str) -> None:
+        self._record("cleanup", mission)
+
+
+def test_mission_stages():
+    args = Namespace(calibrate=False, skip_download_process=True, no_cleanup=True)
+    assert mission_stages(args) == ["calibrate", "align", "resample", "archive"]
+    stages = mission_stages(Namespace(align=True))
+    assert stages == ["align", "archive", "cleanup"]
+    assert dependencies(stages) == {
+        "align": set(),
+        "archive": {"align"},
+        "cleanup": {"archive"},
+    }
+
+
+def test_scheduler(tmp_path):
+    proc = StageRecorder("dorado", str(tmp_path), None)
+    proc.args = Namespace(
+        base_path=str(tmp_path),
+        clobber=False,
+        mission_timeout=None,
+        verbose=1,
+        no_cleanup=True,
+    )
+    missions = {f"2020.24{n}.00": None for n in range(5, 9)}
+    scheduler = PipelineScheduler(proc, io_workers=2, cpu_workers=2)
+    results = {mission: status for mission, status, _ in scheduler.run(missions)}
+
+    assert results.pop("2020.245.00") == "failed"
+    assert set(results.values()) == {JOURNAL_DONE}
+    for mission in missions:
+        log_file = os.path.join(
+            tmp_path, "dorado", MISSIONNETCDFS, mission, f"dorado_{mission}_{LOG_NAME}"
+        )
+        with open(log_file) as fh:
+            lines = [line.rstrip() for line in fh]
+        # Only the records of the mission's own stages, in the order run
+        stages = [line.split()[-3] for line in lines if line.endswith(mission)]
+        assert len(stages) == len(lines) - (mission == "2020.245.00")
+        if mission == "2020.245.00":
+            assert stages == ["download_process", "calibrate", "align", "archive"]
+        else:
+            assert stages == [
+                "download_process",
+                "calibrate",
+                "align",
+                "resample",
+                "archive",
+            ]
+
+
+def test_scheduler_timeout(tmp_path):
+    proc = StageRecorder("dorado", str(tmp_path), None)
+    proc.args = Namespace(
+        base_path=str(tmp_path),
+        clobber=False,
+        mission_timeout=1,
+        verbose=1,
+        no_cleanup=True,
+    )
+    missions = {"2020.246.00": "stalled", "2020.247.00": None, "2020.248.00": None}
+    scheduler = PipelineScheduler(proc, io_workers=1, cpu_workers=1)
+    results = {
+        mission: (status, secs) for mission, status, secs in scheduler.run(missions)
+    }
+
+    # The stalled download is abandoned and a new thread takes the next ones
+    assert results.pop("2020.246.00")[0] == "timeout"
+    assert {status for status, _ in results.values()} == {JOURNAL_DONE}
+    # Timed by their stages, not the second waiting for the stalled download
+    assert all(secs < 1 for _, secs in results.values())
@@ -0,0 +1,51 @@
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+from resample import Resampler, _freq_nests, decimate_series
+
+
+def test_freq_nests():
+    assert _freq_nests("1S", "3S")
+    assert _freq_nests("1S", "15S")
+    assert not _freq_nests("1S", "2S")  # Bin edges do not coincide
+    assert not _freq_nests("2S", "3S")
+    assert not _freq_nests("1S", "7S")  # Does not evenly divide a day
+
+
+def test_derived_coarser_means():
+    resamp = Resampler()
+    resamp._bin_cache = defaultdict(dict)
+    # 10 Hz data spanning midnight with a gap of missing values
+    index = pd.date_range("2020-09-01 23:50:00.13", periods=20000, freq="100ms")
+    series = pd.Series(np.random.default_rng(1).normal(size=len(index)), index=index)
+    series[500:900] = np.nan
+
+    for freq in ("1S", "3S", "15S", "2S"):
+        resampled = resamp._resample_mean("var_mf", series, freq)
+        expected = series.shift(0.5, freq=freq).resample(freq).mean()
+        pd.testing.assert_series_equal(
+            resampled, expected, check_freq=False, check_names=False, rtol=1e-12
+        )
+
+
+def test_decimate_series():
+    # 10 Hz signal: slow 0.01 Hz wave plus a 2 Hz tone that would alias
+    index = pd.date_range("2020-09-01 12:00:00.05", periods=36000, freq="100ms")
+    secs = (index - index[0]).total_seconds().values
+    slow = np.sin(2 * np.pi * 0.01 * secs)
+    series = pd.Series(slow + np.sin(2 * np.pi * 2.0 * secs), index=index)
+    series[10000:10100] = np.nan  # 10 second gap splits into two segments
+
+    decimated = decimate_series(series, 10, "1S")
+    assert (decimated.index.astype("int64") % 1_000_000_000 == 0).all()
+    assert decimated.isna().sum() == 11  # 10 second gap is not filled
+    # Away from the segment ends only the slow wave remains
+    t_secs = (decimated.index - index[0]).total_seconds().values
+    error = np.abs(decimated.values - np.sin(2 * np.pi * 0.01 * t_secs))
+    edges = np.r_[0:8, 991:999, 1010:1018, len(error) - 8 : len(error)]
+    assert np.nanmax(np.delete(error, edges)) < 0.01
+
+    # Chunked filtering gives the same result as a single pass
+    chunked = decimate_series(series, 10, "1S", chunk=500)
+    pd.testing.assert_series_equal(chunked, decimated, rtol=1e-12)
@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from selection import CALIBRATE_DEPENDENCIES, MergeError, Selection, merge
+
+
+def _cal(n_ctd=10, offset=0.0):
+    ctd_time = pd.date_range("2020-09-01", periods=n_ctd, freq="1S")
+    bl_time = pd.date_range("2020-09-01", periods=20, freq="500ms")
+    return xr.Dataset(
+        {
+            "ctd1_temperature": ("ctd1_time", np.arange(n_ctd) + offset),
+            "ctd1_salinity": ("ctd1_time", np.full(n_ctd, 33.0) + offset),
+            "ctd1_depth": ("ctd1_time", np.ones(n_ctd) + offset),
+            "biolume_flow": ("biolume_time", np.ones(20) + offset),
+        },
+        coords={"ctd1_time": ctd_time, "biolume_time": bl_time},
+        attrs={"history": "Created", "date_modified": "then"},
+    )
+
+
+def test_expand():
+    selection = Selection(["ctd1"])
+    assert selection.expand(CALIBRATE_DEPENDENCIES) == {"ctd1", "navigation", "depth"}
+    assert Selection(["gps"]).expand(CALIBRATE_DEPENDENCIES) == {"gps", "navigation"}
+    selection = Selection(variables=["ctd1_salinity", "nudged_latitude"])
+    assert selection.sensors == {"ctd1", "gps"}
+    assert selection.selects("ctd1_salinity")
+    assert selection.selects("ctd1_depth")
+    assert not selection.selects("ctd1_temperature")
+    with pytest.raises(ValueError):
+        Selection(["ctd9"])
+
+
+def test_merge():
+    existing, new = _cal(), _cal(offset=100.0)
+    new.attrs = {"history": "Reprocessed", "date_modified": "now"}
+
+    merged = merge(existing, new, Selection(variables=["ctd1_salinity"]))
+    np.testing.assert_array_equal(merged["ctd1_salinity"], new["ctd1_salinity"])
+    np.testing.assert_array_equal(merged["ctd1_temperature"], np.arange(10))
+    np.testing.assert_array_equal(merged["biolume_flow"], 1.0)
+    assert merged.attrs["date_modified"] == "now"
+    assert merged.attrs["history"].startswith("Created. Reprocessed")
+
+    # A new time coordinate replaces all of the sensor's variables
+    merged = merge(existing, _cal(n_ctd=12), Selection(variables=["ctd1_salinity"]))
+    assert merged.dims["ctd1_time"] == 12
+    np.testing.assert_array_equal(merged["biolume_flow"], 1.0)
+
+    existing["biolume_avg"] = ("ctd1_time", np.ones(10))
+    with pytest.raises(MergeError):
+        merge(existing, _cal(n_ctd=12), Selection(["ctd1"]))
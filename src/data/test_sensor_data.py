@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import xarray as xr
+from sensor_data import SensorFiles, SensorInfo
+
+
+def _write(path, summary="Original data"):
+    xr.Dataset(
+        {"depth": ("time", np.arange(5.0)), "unused": ("time", np.ones(5))},
+        coords={"time": np.arange(5)},
+        attrs={"summary": summary},
+    ).to_netcdf(path)
+
+
+def test_sensor_info(tmp_path):
+    files = SensorFiles(max_open=2)
+    sensors = []
+    for name in ("depth", "navigation", "gps"):
+        _write(tmp_path / f"{name}.nc", f"{name} data")
+        sensors.append(SensorInfo(files, str(tmp_path / f"{name}.nc"), ("depth",)))
+    assert len(files) == 0
+
+    depths = [sensor.orig_data["depth"] for sensor in sensors]
+    assert list(sensors[0].orig_data.data_vars) == ["depth"]
+    assert len(files) == 2
+    assert files.summaries == {"depth data", "navigation data", "gps data"}
+    # Variables of files closed as least recently used are still readable
+    files.close()
+    np.testing.assert_array_equal(depths[1].values, np.arange(5.0))
+
+    missing = SensorInfo(files, str(tmp_path / "lopc.nc"))
+    assert not hasattr(missing, "orig_data")
+    with pytest.raises(AttributeError):
+        SensorInfo().orig_data
@@ -0,0 +1,42 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+from storage import open_dataset, write_dataset, zarr_path
+
+
+def test_zarr_storage(tmp_path):
+    pytest.importorskip("zarr")
+    time = pd.date_range("2020-09-01", periods=50000, freq="100ms")
+    ds = xr.Dataset(
+        {
+            "ctd1_temperature": ("ctd1_time", np.linspace(10, 12, time.size)),
+            "ctd1_salinity": ("ctd1_time", np.linspace(33, 34, time.size)),
+        },
+        coords={"ctd1_time": time},
+        attrs={"title": "Calibrated AUV sensor data"},
+    )
+    ds["ctd1_temperature"].attrs = {
+        "standard_name": "sea_water_temperature",
+        "units": "degree_Celsius",
+    }
+    nc_path = os.path.join(tmp_path, "Dorado389_2020.245.00_cal.nc")
+    write_dataset(ds, nc_path, "both", "lossy")
+    store = zarr_path(nc_path)
+    assert os.path.exists(os.path.join(store, ".zmetadata"))
+
+    with open_dataset(nc_path) as from_nc, open_dataset(store) as from_zarr:
+        xr.testing.assert_allclose(from_nc, from_zarr)
+        assert from_zarr.attrs == from_nc.attrs
+        assert from_zarr["ctd1_temperature"].attrs == ds["ctd1_temperature"].attrs
+        # Chunked along time as the netCDF file is
+        assert from_zarr["ctd1_salinity"].encoding["chunks"] == (36000,)
+
+    # A reader asking for the netCDF file gets the Zarr store if that is all
+    os.remove(nc_path)
+    with open_dataset(nc_path) as from_zarr:
+        np.testing.assert_allclose(
+            from_zarr["ctd1_temperature"], ds["ctd1_temperature"], atol=1e-4
+        )
@@ -0,0 +1,173 @@
+"""
+Estimate the offset of an instrument's clock by cross-correlation.
+
+The depth or pressure recorded in an instrument's log is cross-correlated
+with the depth of the vehicle from parosci.log or navigation.log.  Both are
+interpolated onto uniform grids and correlated with FFTs, so that offsets of
+any size within the records can be found in a fraction of a second.  The
+offset is the number of seconds to add to the instrument's times, e.g. with
+correct_log_times.py --add_seconds, and the confidence is the correlation
+coefficient of the two signals once shifted by the offset.
+"""
+
+__author__ = "Mike McCann"
+__copyright__ = "Copyright 2023, Monterey Bay Aquarium Research Institute"
+
+import logging
+import os
+import re
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import numpy as np
+from readauvlog import read_array
+from scipy import fft
+
+XCORR_DT = 1.0  # Seconds between the points of the uniform grids
+MIN_OVERLAP = 0.5  # Fraction of the shorter signal that must overlap
+MIN_CONFIDENCE = 0.9
+DRIFT_THRESHOLD = 2.0  # Seconds of offset flagged as a clock problem
+# Logs of the vehicle's depth, in order of preference, and their depth field
+REFERENCE_LOGS = (("parosci.log", "depth"), ("navigation.log", "mDepth"))
+DEPTH_FIELD = re.compile(r"^(m?depth|pressure|pres)\d*$", re.IGNORECASE)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OffsetEstimate:
+    """Offset of the clock of `log` relative to the clock of `reference`
+
+    offset: Seconds to add to the times of `log`
+    confidence: Correlation coefficient of the signals at `offset`
+    overlap: Seconds of the signals that overlap at `offset`
+    """
+
+    log: str
+    reference: str
+    offset: float
+    confidence: float
+    overlap: float
+
+    def drifted(self, threshold: float = DRIFT_THRESHOLD) -> bool:
+        return abs(self.offset) > threshold
+
+    def __str__(self) -> str:
+        return (
+            f"{self.log:>20s} {self.offset:12.3f} s {self.confidence:6.3f}"
+            f" ({self.overlap / 3600:.1f} hours overlapped with {self.reference})"
+        )
+
+
+def uniform_grid(
+    times: np.ndarray, values: np.ndarray, dt: float = XCORR_DT
+) -> Tuple[float, np.ndarray]:
+    """Return the start time and `values` linearly interpolated to a grid
+    with `dt` second spacing.  Non finite values and repeated or out of
+    order times are removed first."""
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    good = np.isfinite(times) & np.isfinite(values)
+    times, index = np.unique(times[good], return_index=True)
+    values = values[good][index]
+    if times.size < 2:
+        raise ValueError("Need at least 2 good values to make a uniform grid")
+    grid = np.arange(times[0], times[-1], dt)
+    return times[0], np.interp(grid, times, values)
+
+
+def _window_sums(x: np.ndarray, start: np.ndarray, stop: np.ndarray):
+    "Return the sums of x[start:stop] and of its squares for each start, stop"
+    sums = np.concatenate(([0.0], np.cumsum(x)))
+    squares = np.concatenate(([0.0], np.cumsum(x * x)))
+    return sums[stop] - sums[start], squares[stop] - squares[start]
+
+
+def xcorr(
+    a: np.ndarray, b: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Return the lags, the correlation coefficients of `a` and `b` where they
+    overlap at each lag and the numbers of points overlapping.  At lag k
+    a[i + k] is paired with b[i].  The products are summed with FFTs and the
+    means and variances of the overlapping parts with cumulative sums."""
+    a = a - a.mean()
+    b = b - b.mean()
+    n_fft = fft.next_fast_len(a.size + b.size - 1, real=True)
+    products = fft.irfft(fft.rfft(a, n_fft) * np.conj(fft.rfft(b, n_fft)), n_fft)
+    lags = np.arange(-(b.size - 1), a.size)
+    products = products[lags % n_fft]
+    a_start = np.maximum(0, lags)
+    a_stop = np.minimum(a.size, lags + b.size)
+    overlap = a_stop - a_start
+    a_sums, a_squares = _window_sums(a, a_start, a_stop)
+    b_sums, b_squares = _window_sums(b, a_start - lags, a_stop - lags)
+    covariance = products - a_sums * b_sums / overlap
+    variance = (a_squares - a_sums**2 / overlap) * (b_squares - b_sums**2 / overlap)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = np.where(variance > 0, covariance / np.sqrt(variance), 0.0)
+    return lags, corr, overlap
+
+
+def estimate_offset(
+    ref_times: np.ndarray,
+    ref_values: np.ndarray,
+    times: np.ndarray,
+    values: np.ndarray,
+    dt: float = XCORR_DT,
+    max_offset: float = None,
+    min_overlap: float = MIN_OVERLAP,
+) -> Tuple[float, float, float]:
+    """Return the seconds to add to `times` so that `values` best match
+    `ref_values`, the correlation coefficient at that offset and the seconds
+    of overlap.  If `max_offset` is given only offsets up to that many
+    seconds either way are searched."""
+    ref_start, ref_grid = uniform_grid(ref_times, ref_values, dt)
+    start, grid = uniform_grid(times, values, dt)
+    lags, corr, overlap = xcorr(ref_grid, grid)
+    offsets = ref_start - start + lags * dt
+    valid = overlap >= min_overlap * min(ref_grid.size, grid.size)
+    if max_offset is not None:
+        valid &= np.abs(offsets) <= max_offset
+    if not valid.any():
+        raise ValueError("The signals do not overlap enough at any offset")
+    best = np.flatnonzero(valid)[np.argmax(corr[valid])]
+
+    # Refine to a fraction of dt with a parabola through the peak
+    offset = offsets[best]
+    if 0 < best < corr.size - 1 and valid[best - 1] and valid[best + 1]:
+        y0, y1, y2 = corr[best - 1 : best + 2]
+        if (curvature := y0 - 2 * y1 + y2) < 0:
+            offset += 0.5 * (y0 - y2) / curvature * dt
+
+    confidence = min(1.0, corr[best])
+    return float(offset), float(confidence), float(overlap[best] * dt)
+
+
+def depth_field(names) -> Optional[str]:
+    "Return the first of the field `names` that is a depth or pressure"
+    for name in names:
+        if DEPTH_FIELD.match(name):
+            return name
+    return None
+
+
+def log_signal(log_filename: str, field: str = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Return the times and the depth or pressure, or the `field` if given,
+    read from an original log file"""
+    _, _, data = read_array(log_filename)
+    field = field or depth_field(data.dtype.names)
+    if field is None or field not in data.dtype.names:
+        raise LookupError(f"No depth or pressure in {log_filename}")
+    times = data["time"].astype(np.float64)
+    good = times > 0
+    return times[good], data[field][good].astype(np.float64)
+
+
+def reference_signal(logs_dir: str) -> Tuple[str, np.ndarray, np.ndarray]:
+    "Return the name, times and depths of the first of the REFERENCE_LOGS"
+    for log, field in REFERENCE_LOGS:
+        try:
+            return log, *log_signal(os.path.join(logs_dir, log), field)
+        except (FileNotFoundError, EOFError, LookupError) as e:
+            logger.debug(f"Cannot use {log} as the reference: {e}")
+    raise LookupError(f"No reference depth log in {logs_dir}")